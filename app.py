@@ -1,16 +1,24 @@
 
 import os
-import json
-import random
-import time
 from datetime import datetime
-import base64
 import requests
 import dash
 import dash_bootstrap_components as dbc
-import psycopg2
-from dash import dcc, html, Input, Output, State
-
+from dash import dcc, html, Input, Output, State, Patch, no_update
+
+from ensembleClient import fetch_detailed_info
+from eventExtraction import caption_headline, event_times, post_caption
+from batchUpserter import UpsertBatcher
+from eventDedup import get_deduplicator, profile_generic_images
+from imageCache import prefetch_thumbnails, register_thumbnail_route, thumbnail_src
+from scrapeRecords import EventRecord, event_source_key, stable_id
+from scrapeJobs import get_job, start_job
+from scrapeLogging import get_logger
+from scrapeMetrics import record_scrape, register_metrics_route, stage_timer
+from venueIndex import ensure_venue_index, get_venue_index
+from writeQueue import ensure_flusher, get_write_queue
+
+log = get_logger(__name__)
 
 # TOKEN = os.getenv('EnsembleApi')
 
@@ -29,118 +37,54 @@ db_connection_params = {
 # REFACTORED BACKEND LOGIC FOR DASH INTEGRATION
 # ==============================================================================
 
-def image_to_base64(image_url):
-    """Fetches an image from a URL and encodes it to a Base64 string."""
-    if not image_url:
-        return None
-    try:
-        # CONSOLE LOG: Announce image fetch attempt
-        print(f"🖼️  Fetching image from URL: {image_url}")
-        response = requests.get(image_url, timeout=10)
-        response.raise_for_status()
-        content_type = response.headers.get('content-type', 'image/png')
-        encoded_image = base64.b64encode(response.content).decode('utf-8')
-        return f"data:{content_type};base64,{encoded_image}"
-
-    except requests.exceptions.RequestException as e:
-        # CONSOLE LOG: Log image fetch failure
-        print(f"❌ ERROR: Failed to fetch image from {image_url}. Reason: {e}")
-        return None
-
-
-def _format_as_event(profile_data: dict, event_post: dict) -> dict:
-    """Formats scraped data into an event dictionary."""
+def _format_as_event(profile_data: dict, event_post: dict) -> EventRecord:
+    """Formats scraped data into an EventRecord."""
     # CONSOLE LOG: Announce data formatting
-    profile_name = profile_data.get('full_name', 'Unknown Profile')
-    print(f"📝 Formatting '{profile_name}' as an EVENT.")
+    log.debug("📝 Formatting profile as an EVENT", profile=profile_data.get('full_name', 'Unknown Profile'))
 
     if event_post is None: event_post = {}
-    caption_edges = event_post.get('edge_media_to_caption', {}).get('edges', [])
-    caption = caption_edges[0]['node']['text'] if caption_edges else profile_data.get('biography', '')
+    post_text = post_caption(event_post)
+    caption = post_text or profile_data.get('biography', '')
     now = datetime.now()
-
-    return {
-        'id': random.randint(100, 99999),
-        'performerId': None,
-        'eventName': profile_data.get('full_name', 'Unnamed Event'),
-        'description': caption,
-        'minAmount': None,
-        'eventDate': now,
-        'posterUrl': event_post.get('display_url', profile_data.get('profile_pic_url', '')),
-        'createdBy': 289,
-        'deletedAt': None,
-        'createdAt': now,
-        'updatedAt': now,
-        'isPaid': False,
-        'ticketingURL': profile_data.get('external_url', ''),
-        'eventQRCode': None,
-        'eventStatus': 'SCHEDULED',
-        'previousEventDate': None,
-        'previousStartTime': None,
-        'previousEndTime': None,
-        'startTime': now,
-        'endTime': now,
-        'venueId': 168,
-    }
-
-
-def upsert_to_db(record_type: str, data: dict):
-    """Upserts a record and returns a status tuple (success, message)."""
-    # This will always receive 'event' as the record_type now
-    table_name = "events" if record_type == "event" else "venues"
-    record_name = data.get('eventName')
-
-    # CONSOLE LOG: Announce DB upsert attempt
-    print(f"💾 Attempting to upsert '{record_name}' to table '{table_name}'...")
-
-    columns = data.keys()
-    columns_sql = ', '.join(f'"{col}"' for col in columns)
-    placeholders = ', '.join(['%s'] * len(columns))
-    update_cols = [f'"{col}" = EXCLUDED."{col}"' for col in columns if col != 'id']
-    update_sql = ', '.join(update_cols)
-
-    upsert_statement = f"""
-        INSERT INTO {table_name} ({columns_sql}) VALUES ({placeholders})
-        ON CONFLICT (id) DO UPDATE SET {update_sql};
-    """
-    values = list(data.values())
-    try:
-        with psycopg2.connect(**db_connection_params) as conn:
-            with conn.cursor() as cur:
-                cur.execute(upsert_statement, values)
-        # CONSOLE LOG: Announce DB success
-        print(f"✅ SUCCESS: Upserted '{record_name}' to '{table_name}'.")
-        return (True, f"Successfully upserted '{record_name}' to '{table_name}'.")
-    except psycopg2.Error as e:
-        # CONSOLE LOG: Detailed log for DB failure
-        print("\n" + "=" * 25 + " DATABASE UPSERT FAILED " + "=" * 25)
-        print(f"Record Name: {record_name}")
-        print(f"Table Name:  {table_name}")
-        print(f"Error:       {e}")
-        print(f"Data Payload that Failed:\n{json.dumps(data, indent=2, default=str)}")
-        print("=" * 72 + "\n")
-        return (False, f"Database error for '{record_name}': {e}")
-    except Exception as e:
-        # CONSOLE LOG: Detailed log for unexpected failure
-        print("\n" + "=" * 25 + " UNEXPECTED DB ERROR " + "=" * 25)
-        print(f"Record Name: {record_name}")
-        print(f"Error:       {e}")
-        print(f"Data Payload:\n{json.dumps(data, indent=2, default=str)}")
-        print("=" * 65 + "\n")
-        return (False, f"An unexpected error occurred during DB operation: {e}")
+    # Dated by what the caption announces, else by the post itself, so re-formatting a post is stable
+    event_date, start_time, end_time = event_times(event_post, post_text)
+    source_key = event_source_key(profile_data, event_post)
+
+    return EventRecord(
+        id=stable_id(source_key),
+        sourceKey=source_key,
+        performerId=None,
+        eventName=caption_headline(post_text) or profile_data.get('full_name', 'Unnamed Event'),
+        description=caption,
+        minAmount=None,
+        eventDate=event_date,
+        posterUrl=event_post.get('display_url', profile_data.get('profile_pic_url', '')),
+        createdBy=289,
+        deletedAt=None,
+        createdAt=now,
+        updatedAt=now,
+        isPaid=False,
+        ticketingURL=profile_data.get('external_url', ''),
+        eventQRCode=None,
+        eventStatus='SCHEDULED',
+        previousEventDate=None,
+        previousStartTime=None,
+        previousEndTime=None,
+        startTime=start_time,
+        endTime=end_time,
+        venueId=get_venue_index(db_connection_params).resolve(event_post, profile_data, default=168),
+    )
 
 
 def InstaScrapper(scraped_data: list) -> tuple:
     """Formats scraped profile data as an event."""
-    # CONSOLE LOG: Announce data analysis
-    print("🕵️  Processing scraped data as an EVENT.")
     try:
         profile_data = scraped_data[0]['data']
         posts = profile_data.get('edge_owner_to_timeline_media', {}).get('edges', [])
     except (IndexError, KeyError, TypeError) as e:
-        # CONSOLE LOG: Log data structure error
-        print(f"❌ ERROR: Invalid data structure from API. Details: {e}")
-        print(f"Received Data: {scraped_data}")
+        # CONSOLE LOG: Log data structure error (the payload itself only at debug level)
+        log.error("❌ Invalid data structure from API", error=repr(e))
+        log.debug("Received data", payload=scraped_data)
         return "error", {"error": "Invalid data structure from API."}
 
     # Use the first post for event details if available, otherwise use profile data.
@@ -148,20 +92,22 @@ def InstaScrapper(scraped_data: list) -> tuple:
 
     # Always format as an event
     formatted_event = _format_as_event(profile_data, first_post)
-
-    # CONSOLE LOG: Announce completion
-    print("✅ Processing Complete: Profile formatted as EVENT.")
     return "event", formatted_event
 
 
-def create_summary_card(record_type, data, db_success):
-    """Creates a dbc.Card component to summarize the scraping result with an embedded image."""
+def create_summary_card(record_type, data, db_success, queued=False, pending=False, thumbnail=None,
+                        duplicate=False):
+    """
+    Creates a dbc.Card component to summarize the scraping result with an embedded image.
+    A pending card is shown as soon as the profile is formatted, with a placeholder instead of the image,
+    and replaced once its batch is written; `thumbnail` is the served URL of the record's cached image.
+    A duplicate card marks an event skipped as a near-duplicate of one already saved.
+    """
     if record_type == 'event':
-        title = data.get('eventName', 'N/A')
-        image_url = data.get('posterUrl')
-        description = data.get('description', 'No description available.')
+        title = data.eventName or 'N/A'
+        description = data.description or 'No description available.'
         short_desc = (description[:120] + '...') if len(description) > 120 else description
-        event_date_obj = data.get('eventDate')
+        event_date_obj = data.eventDate
         event_date_str = event_date_obj.strftime('%a, %b %d, %Y') if event_date_obj else 'N/A'
         icon = "🎉"
 
@@ -169,19 +115,31 @@ def create_summary_card(record_type, data, db_success):
             html.P(f"🗓️ Date: {event_date_str}", className="card-text fw-bold"),
             html.P(short_desc, className="card-text text-muted small"),
         ]
-        if data.get('ticketingURL'):
-            card_body.append(dbc.CardLink("Get Tickets", href=data.get('ticketingURL'), target="_blank"))
+        if data.ticketingURL:
+            card_body.append(dbc.CardLink("Get Tickets", href=data.ticketingURL, target="_blank"))
     else:
         return None
 
-    base64_image = image_to_base64(image_url)
-    db_badge = dbc.Badge("DB Success", color="success", className="me-1") if db_success else dbc.Badge("DB Failed",
-                                                                                                       color="danger",
-                                                                                                       className="me-1")
+    # Cards point at a cached, resized thumbnail served by Flask instead of an inline base64 blob.
+    # Pending cards never fetch it: the batch's images are downloaded together when the cards are updated
+    if pending:
+        image = dbc.Placeholder(animation="glow", className="card-img-top")
+    else:
+        image = dbc.CardImg(src=thumbnail, top=True, className="card-img-top") if thumbnail else None
+    if pending:
+        db_badge = dbc.Badge("Saving...", color="info", className="me-1")
+    elif duplicate:
+        db_badge = dbc.Badge("Duplicate - Not Saved", color="secondary", className="me-1")
+    elif db_success:
+        db_badge = dbc.Badge("DB Success", color="success", className="me-1")
+    elif queued:
+        db_badge = dbc.Badge("Queued for Retry", color="warning", className="me-1")
+    else:
+        db_badge = dbc.Badge("DB Failed", color="danger", className="me-1")
 
     return dbc.Col(dbc.Card([
         dbc.CardHeader(f"{icon} {title} ({record_type.capitalize()})"),
-        dbc.CardImg(src=base64_image, top=True, className="card-img-top") if base64_image else None,
+        image,
         dbc.CardBody(card_body),
         dbc.CardFooter(db_badge)
     ], className="mb-4 h-100 shadow-lg border-primary fade-in"), md=6, lg=4)
@@ -190,52 +148,89 @@ def create_summary_card(record_type, data, db_success):
 # ==============================================================================
 # UPDATED SCRAPING JOB GENERATOR
 # ==============================================================================
+def _batch_outputs(flush_result, card_positions):
+    """
+    Yields the alert for one flushed batch of records and replaces their pending cards
+    (found by record in `card_positions`) with cards showing the write outcome.
+    """
+    if not flush_result or not (flush_result.records or flush_result.skipped):
+        return
+    outcomes = [(record_type, data, False) for record_type, data in flush_result.records]
+    outcomes += [(record_type, data, True) for record_type, data in flush_result.skipped]
+    # Download every image in the batch in parallel before building the cards
+    thumbnails = prefetch_thumbnails(data.image_url for _, data, _ in outcomes)
+
+    alert_color = "success" if flush_result.success else ("warning" if flush_result.spilled else "danger")
+    yield 'alert', dbc.Alert(flush_result.message, color=alert_color, dismissable=True, duration=6000,
+                             className="fade-in")
+    status = "upserted" if flush_result.success else ("queued" if flush_result.spilled else "db_error")
+    for record_type, data, duplicate in outcomes:
+        record_scrape("skipped" if duplicate else status)
+        card = create_summary_card(record_type, data, flush_result.success, flush_result.spilled,
+                                   thumbnail=thumbnail_src(thumbnails.get(data.image_url)), duplicate=duplicate)
+        position = card_positions.pop(id(data), None)
+        if position is None:
+            yield 'card', card
+        else:
+            yield 'card_update', (position, card)
+
+
 def run_scraping_job(usernames: list):
-    """Manages scraping and yields logs, alerts, and card data."""
-    print("\n" + "#" * 20 + " Starting New Scrape Cycle " + "#" * 20)
+    """Manages scraping, batches DB writes, and yields logs, alerts, and card data."""
+    log.info("🚀 Starting new scrape cycle", profiles=len(usernames))
     yield 'log', html.P("🚀 Starting new scrape cycle...", className="log-entry")
 
+    # Batches that fail to write are kept in the write-behind queue and retried in the background.
+    # Reposted events are dropped as each batch flushes, like on every other scrape path
+    batcher = UpsertBatcher(db_connection_params, spill_queue=get_write_queue(), deduplicator=get_deduplicator())
+    # Position of each record's pending card among the cards yielded so far
+    card_positions = {}
+    cards = 0
+
     for username in (u.strip() for u in usernames if u.strip()):
-        print(f"\n--- Scraping User: {username} ---")
+        log.info("🔎 Scraping data for user", username=username)
         yield 'log', html.P(f"🔎 Scraping data for: {username}...", className="log-entry")
 
         try:
-            # CONSOLE LOG: Announce API call
-            print(f"📡 Making API call for '{username}'...")
-            response = requests.get(f"https://ensembledata.com/apis/instagram/user/detailed-info",
-                                    params={"username": username, "token": TOKEN}, timeout=20)
-            response.raise_for_status()
-            print(f"✅ API call for '{username}' successful.")
+            scraped_json = fetch_detailed_info(username, token=TOKEN, timeout=20)
+            log.debug("✅ API call successful", username=username)
 
-            record_type, filtered_data = InstaScrapper([response.json()])
+            with stage_timer('classify'):
+                record_type, filtered_data = InstaScrapper([scraped_json])
 
             if record_type != "error":
+                log.info("✅ Profile processed", sample='classify', username=username, type=record_type)
                 yield 'log', html.P(f"✅ Profile '{username}' processed as an {record_type.upper()}.",
                                     className="log-entry")
-                success, message = upsert_to_db(record_type, filtered_data)
-
-                alert_color = "success" if success else "danger"
-                yield 'alert', dbc.Alert(message, color=alert_color, dismissable=True, duration=6000,
-                                         className="fade-in")
-                yield 'card', create_summary_card(record_type, filtered_data, success)
+                # The card shows up right away and is updated once the record's batch is committed
+                card = create_summary_card(record_type, filtered_data, False, pending=True)
+                if card is not None:
+                    card_positions[id(filtered_data)] = cards
+                    cards += 1
+                    yield 'card', card
+                generic_images = profile_generic_images(scraped_json['data'])
+                yield from _batch_outputs(batcher.add(record_type, filtered_data, generic_images=generic_images),
+                                          card_positions)
             else:
                 # CONSOLE LOG: Log processing error
-                print(f"❌ Error processing {username}: {filtered_data.get('error')}")
+                log.error("❌ Error processing profile", username=username, error=filtered_data.get('error'))
+                record_scrape("error")
                 yield 'log', html.P(f"❌ Error processing {username}: {filtered_data.get('error')}",
                                     className="log-entry error")
 
         except requests.exceptions.RequestException as e:
             # CONSOLE LOG: Log API failure
-            print(f"❌ API Request Failed for {username}: {e}")
+            log.error("❌ API request failed", username=username, error=str(e))
+            record_scrape("api_error")
             yield 'log', html.P(f"❌ API Request Failed for {username}: {e}", className="log-entry error")
         except Exception as e:
             # CONSOLE LOG: Log other unexpected errors
-            print(f"❌ An unexpected error occurred for {username}: {e}")
+            log.exception("❌ Unexpected error", username=username, error=str(e))
+            record_scrape("error")
             yield 'log', html.P(f"❌ An unexpected error occurred for {username}: {e}", className="log-entry error")
 
-        time.sleep(0.5)
-
-    print("\n" + "#" * 22 + " Scrape Cycle Complete " + "#" * 23 + "\n")
+    yield from _batch_outputs(batcher.flush(), card_positions)
+    log.info("✅ Scraping cycle complete", profiles=len(usernames))
     yield 'log', html.P("✅ Scraping cycle complete.", className="log-entry")
 
 
@@ -246,9 +241,15 @@ app = dash.Dash(__name__, external_stylesheets=[dbc.themes.VAPOR, dbc.icons.FONT
 app.title = "BB Instagram Scrapper"
 
 server = app.server
+register_thumbnail_route(server)
+register_metrics_route(server)
+ensure_flusher(db_connection_params)
+ensure_venue_index(db_connection_params)
 
 app.layout = dbc.Container([
     dcc.Store(id='session-store'),
+    dcc.Store(id='job-cursor'),
+    dcc.Interval(id='job-poller', interval=1000, disabled=True),
     html.Div([
         html.H1("🚀 BB Instagram Scrapper", className="display-3 title-glow"),
         html.P("Enter Instagram profiles to scrape and save them as events.", className="lead")
@@ -275,14 +276,16 @@ app.layout = dbc.Container([
     dbc.Row(id="summary-cards-container", className="mb-5"),
     html.Hr(),
     html.H3("Detailed Logs", className="text-center mt-4 mb-3"),
-    dcc.Loading(id="loading-spinner", type="default", children=[
-        html.Div(id="log-output", className="log-container")
-    ])
+    html.Div(id="job-status", className="text-center mb-2"),
+    html.Div(id="log-output", className="log-container")
 ], fluid=True, className="p-5")
 
 
 @app.callback(
-    [Output('summary-cards-container', 'children'),
+    [Output('session-store', 'data'),
+     Output('job-cursor', 'data'),
+     Output('job-poller', 'disabled'),
+     Output('summary-cards-container', 'children'),
      Output('log-output', 'children'),
      Output('alert-container', 'children')],
     [Input('scrape-button', 'n_clicks')],
@@ -290,26 +293,59 @@ app.layout = dbc.Container([
     prevent_initial_call=True
 )
 def update_output(n_clicks, profiles_value):
-    """Triggers scraping and updates the UI with cards, logs, and alerts."""
+    """Starts a background scrape job and clears the UI; poll_job streams the results in."""
     # CONSOLE LOG: Announce callback trigger
-    print(f"▶️ Scrape button clicked (n_clicks={n_clicks}). Processing usernames.")
+    log.info("▶️ Scrape button clicked; starting background job", n_clicks=n_clicks)
     if not profiles_value:
-        print("⚠️ No usernames entered. Aborting.")
-        return [], [html.P("Please enter at least one profile username.", className="text-warning")], []
+        log.warning("⚠️ No usernames entered; aborting")
+        warning = html.P("Please enter at least one profile username.", className="text-warning")
+        return None, None, True, [], [warning], []
+
+    job = start_job(run_scraping_job, profiles_value.split('\n'))
+    return {'job_id': job.id}, {}, False, [], [], []
 
-    cards, logs, alerts = [], [], []
-    for item_type, content in run_scraping_job(profiles_value.split('\n')):
-        if item_type == 'log':
-            logs.append(content)
-        elif item_type == 'alert':
-            alerts.append(content)
-        elif item_type == 'card' and content:
-            cards.append(content)
 
-    return cards, logs, alerts
+@app.callback(
+    [Output('summary-cards-container', 'children', allow_duplicate=True),
+     Output('log-output', 'children', allow_duplicate=True),
+     Output('alert-container', 'children', allow_duplicate=True),
+     Output('job-cursor', 'data', allow_duplicate=True),
+     Output('job-poller', 'disabled', allow_duplicate=True),
+     Output('job-status', 'children')],
+    [Input('job-poller', 'n_intervals')],
+    [State('session-store', 'data'), State('job-cursor', 'data')],
+    prevent_initial_call=True
+)
+def poll_job(n_intervals, session_data, cursor):
+    """Appends whatever the background job produced since the last poll."""
+    job = get_job((session_data or {}).get('job_id'))
+    if job is None:
+        return no_update, no_update, no_update, no_update, True, ""
+
+    # Read the status first so a finished job's final items are always included
+    done = job.done
+    new_items, cursor = job.since(cursor)
+    if job.status == 'failed':
+        new_items['log'].append(html.P(f"❌ Scrape job failed: {job.error}", className="log-entry error"))
+
+    outputs = []
+    for item_type in ('card', 'log', 'alert'):
+        updates = new_items['card_update'] if item_type == 'card' else []
+        if new_items[item_type] or updates:
+            patch = Patch()
+            patch.extend(new_items[item_type])
+            # Pending cards are replaced in place once their batch is written
+            for position, card in updates:
+                patch[position] = card
+            outputs.append(patch)
+        else:
+            outputs.append(no_update)
+
+    status = "" if done else [dbc.Spinner(size="sm", color="info"), " Scraping in progress..."]
+    return (*outputs, cursor, done, status)
 
 
 if __name__ == '__main__':
     # CONSOLE LOG: Announce app start
-    print("🚀 Starting Dash Application in Debug Mode...")
+    log.info("🚀 Starting Dash Application in Debug Mode", port=5543)
     app.run(debug=True, port=5543)
@@ -0,0 +1,129 @@
+import asyncio
+import time
+
+import httpx
+
+from batchUpserter import UpsertBatcher
+from changeState import ChangeStateStore, get_state_store
+from ensembleClient import fetch_detailed_info_async
+from instaScrapper import TOKEN, PLACES_TO_SCRAPE, db_connection_params, handle_scraped_json
+from scrapeLogging import get_logger
+from scrapeMetrics import record_scrape
+from venueIndex import ensure_venue_index
+from writeQueue import ensure_flusher, get_write_queue
+
+log = get_logger(__name__)
+
+# --- CONFIGURATION ---
+# Maximum number of profiles fetched at the same time
+MAX_CONCURRENCY = 10
+
+# Per-request timeout for the EnsembleData API (in seconds)
+REQUEST_TIMEOUT = 30
+
+
+async def _scrape_one(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, username: str,
+                      state: ChangeStateStore, batcher: UpsertBatcher) -> dict:
+    """
+    Fetches one profile through the shared client, then runs classification and
+    queues the records for a batched upsert in a worker thread so the event loop
+    keeps serving other fetches.
+    """
+    result = {
+        'username': username,
+        'status': 'error',
+        'record_type': None,
+        'records': [],
+        'error': None,
+        'fetch_seconds': None,
+        'total_seconds': None,
+    }
+    if state.is_fresh(username):
+        log.info("⏭️ Fetched recently; skipping API call", sample='skip', username=username)
+        result.update(status='fresh', total_seconds=0.0)
+        return result
+
+    async with semaphore:
+        started = time.perf_counter()
+        log.info("🔎 Scraping data for user", username=username)
+        try:
+            scraped_json = await fetch_detailed_info_async(client, username, token=TOKEN)
+            result['fetch_seconds'] = time.perf_counter() - started
+            state.mark_fetched(username)
+
+            status, record_type, records = await asyncio.to_thread(
+                handle_scraped_json, username, scraped_json, state, batcher)
+            result.update(status=status, record_type=record_type, records=records)
+
+        except httpx.HTTPError as e:
+            log.error("❌ API request failed", username=username, error=str(e))
+            result['error'] = str(e)
+        except ValueError as e:
+            log.error("❌ Failed to parse JSON", username=username, error=str(e))
+            result['error'] = str(e)
+
+        result['total_seconds'] = time.perf_counter() - started
+    return result
+
+
+async def scrape_users_async(usernames: list, state: ChangeStateStore = None,
+                             max_concurrency: int = MAX_CONCURRENCY) -> list:
+    """
+    Scrapes many usernames concurrently over a single HTTP session.
+
+    Args:
+        usernames (list): Instagram usernames to scrape.
+        state (ChangeStateStore): Durable change-detection state; defaults to the shared store.
+        max_concurrency (int): Upper bound on in-flight API requests.
+
+    Returns:
+        list: One result dict per username, in input order, with status and timings.
+    """
+    if state is None:
+        state = get_state_store()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+    # Batches that fail to write are handed to the write-behind queue and retried in the background
+    batcher = UpsertBatcher(db_connection_params, spill_queue=get_write_queue())
+    ensure_flusher(db_connection_params)
+    ensure_venue_index(db_connection_params)
+
+    async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT, limits=limits) as client:
+        tasks = [_scrape_one(client, semaphore, username, state, batcher) for username in usernames]
+        results = await asyncio.gather(*tasks)
+
+    # Write whatever the size/age limits have not flushed yet, then resolve queued statuses
+    await asyncio.to_thread(batcher.flush)
+    outcomes = {id(data): flush for flush in batcher.flush_results for _, data in flush.records}
+    for result in results:
+        if result['status'] == 'queued':
+            flushes = [outcomes.get(id(record)) for record in result['records']]
+            if all(flush is not None and flush.success for flush in flushes):
+                result['status'] = 'upserted'
+            elif any(flush is None or not (flush.success or flush.spilled) for flush in flushes):
+                result['status'] = 'db_error'
+        record_scrape(result['status'])
+    return results
+
+
+def scrape_users(usernames: list, state: ChangeStateStore = None, max_concurrency: int = MAX_CONCURRENCY) -> list:
+    """
+    Synchronous wrapper around scrape_users_async for scripts and cron jobs.
+    """
+    return asyncio.run(scrape_users_async(usernames, state, max_concurrency))
+
+
+def print_cycle_summary(results: list, wall_seconds: float):
+    """Prints one line per user plus the cycle's wall-clock time."""
+    print("\n===== Cycle summary =====")
+    for result in results:
+        total = result['total_seconds'] or 0.0
+        print(f"{result['username']:<30} {result['status']:<10} {total:6.2f}s")
+    serial_seconds = sum(result['total_seconds'] or 0.0 for result in results)
+    print(f"Wall-clock: {wall_seconds:.2f}s (sum of per-user time: {serial_seconds:.2f}s)")
+
+
+if __name__ == "__main__":
+    cycle_started = time.perf_counter()
+    cycle_results = scrape_users(PLACES_TO_SCRAPE)
+    print_cycle_summary(cycle_results, time.perf_counter() - cycle_started)
@@ -1,23 +1,18 @@
 import os
 import requests
-import pprint
 import json
 from datetime import datetime
 from dotenv import load_dotenv
 
+from ensembleClient import fetch_detailed_info
+from keywordMatcher import EVENT_CONFIDENCE_THRESHOLD, EVENT_MATCHER
+from scrapeLogging import get_logger
+
+log = get_logger(__name__)
+
 load_dotenv()
 TOKEN = os.getenv('EnsembleApi')
 
-# Define the keywords that signal an event
-EVENT_KEYWORDS = [
-    'event', 'concert', 'show', 'performance', 'party', 'celebration',
-    'festival', 'workshop', 'seminar', 'conference', 'meetup', 'launch',
-    'opening', 'closing', 'anniversary', 'birthday', 'wedding', 'gala',
-    'competition', 'tournament', 'match', 'game', 'screening', 'premiere',
-    'sale', 'promotion', 'special', 'limited time', 'today only', 'live',
-    'happening', 'join us', 'come celebrate', 'don\'t miss'
-]
-
 
 def _format_as_event(profile_data: dict, event_post: dict) -> dict:
     """Helper function to structure data for an Event."""
@@ -114,11 +109,13 @@ def InstaScrapper(scraped_data: list) -> dict:
 
     is_event = False
     best_event_post = None
+    confidence = 0.0
 
     for post in recent_posts:
         node = post.get('node', {})
         if node.get('has_upcoming_event'):
             is_event = True
+            confidence = 1.0
             best_event_post = node
             break
 
@@ -132,57 +129,47 @@ def InstaScrapper(scraped_data: list) -> dict:
                 captions.append(caption_edges[0]['node']['text'])
 
         # Combine profile bio and all recent captions for a comprehensive search
-        text_to_search = (profile_data.get('biography', '') + ' ' + ' '.join(captions)).lower()
+        text_to_search = profile_data.get('biography', '') + ' ' + ' '.join(captions)
 
-        if any(keyword in text_to_search for keyword in EVENT_KEYWORDS):
+        keyword_result = EVENT_MATCHER.match(text_to_search)
+        confidence = keyword_result.confidence
+        if confidence >= EVENT_CONFIDENCE_THRESHOLD:
             is_event = True
             # If a keyword is found, assume the most recent post is the most relevant one
             best_event_post = recent_posts[0].get('node', {})
 
     # --- Format the Output Based on the Decision ---
+    log.info("✅ Profile identified", profile=profile_data.get('username'),
+             type="event" if is_event else "venue", confidence=round(confidence, 2))
     if is_event:
-        print("✅ Profile identified as an EVENT.")
         return _format_as_event(profile_data, best_event_post)
     else:
-        print("🏠 Profile identified as a VENUE.")
         return _format_as_venue(profile_data)
 
 
 def connectScrapper(username: str):
     """
-    Connects to the API, fetches data, filters it, and prints the result.
+    Connects to the API, fetches data, filters it, and logs the result.
     """
-    root = "https://ensembledata.com/apis"
-    endpoint = "/instagram/user/detailed-info"
-    params = {
-        "username": username,
-        "token": TOKEN
-    }
-
-    print(f"🔎 Scraping data for user: {username}...")
+    log.info("🔎 Scraping data for user", username=username)
 
     try:
-        # 1. Make the API request
-        response = requests.get(root + endpoint, params=params)
-        response.raise_for_status()
-
-        # 2. Parse the JSON from the response
-        scraped_json = response.json()
+        # 1. Make the rate-limited API request and parse the JSON response
+        scraped_json = fetch_detailed_info(username, token=TOKEN)
 
-        # 3. Pass the parsed JSON to the filtering function.
+        # 2. Pass the parsed JSON to the filtering function.
         filtered_results = InstaScrapper([scraped_json])
 
-        # 4. Print the final, filtered list
-        print("\n--- Filtered Results ---")
-        pprint.pprint(filtered_results)
+        # 3. Log the final, filtered record
+        log.info("Filtered results", username=username, record=filtered_results)
 
         return filtered_results
 
     except requests.exceptions.RequestException as e:
-        print(f"❌ API Request Failed: {e}")
+        log.error("❌ API request failed", username=username, error=str(e))
         return None
     except json.JSONDecodeError:
-        print("❌ Failed to parse JSON from the API response.")
+        log.error("❌ Failed to parse JSON from the API response", username=username)
         return None
 
 
@@ -0,0 +1,84 @@
+import time
+
+from instaScrapper import _format_as_event, _format_as_venue, classify_profile, event_search_text
+from keywordMatcher import EVENT_MATCHER
+from responseCache import get_response_cache
+from scrapeLogging import get_logger
+
+log = get_logger(__name__)
+
+# --- CONFIGURATION ---
+# Matches InstaScrapper's look-back window
+RECENT_POSTS = 5
+RESULT_COLUMNS = ('username', 'type', 'confidence', 'latest_post_id', 'record')
+
+
+def _profile_data(payload: dict) -> dict:
+    """Returns the profile dict of a detailed-info payload, or None if it is malformed."""
+    try:
+        profile_data = payload['data']
+    except (KeyError, TypeError):
+        return None
+    return profile_data if isinstance(profile_data, dict) else None
+
+
+def classify_batch(payloads, user_id: str = '1234', format_records: bool = True) -> dict:
+    """
+    Classifies many detailed-info payloads at once without printing per profile.
+    The search texts of all profiles are scanned by EVENT_MATCHER in a single pass.
+
+    Args:
+        payloads (iterable): (username, payload) pairs, where payload is the detailed-info JSON.
+        user_id (str): Creator ID stamped on the formatted records.
+        format_records (bool): Whether to build the Event/Venue records, or only classify.
+
+    Returns:
+        dict: Columnar result, one list per name in RESULT_COLUMNS, all the same length.
+              Malformed payloads get type "error" and a None record.
+    """
+    usernames, profiles, texts = [], [], []
+    for username, payload in payloads:
+        profile_data = _profile_data(payload)
+        usernames.append(username)
+        profiles.append(profile_data)
+        if profile_data is None:
+            texts.append('')
+            continue
+        try:
+            posts = profile_data.get('edge_owner_to_timeline_media', {}).get('edges', [])
+            texts.append(event_search_text(profile_data, posts[:RECENT_POSTS]))
+        except (IndexError, KeyError, TypeError, AttributeError):
+            profiles[-1] = None
+            texts.append('')
+
+    result = {column: [] for column in RESULT_COLUMNS}
+    result['username'] = usernames
+    for profile_data, keyword_result in zip(profiles, EVENT_MATCHER.match_many(texts)):
+        record_type, confidence, latest_post_id, record = "error", 0.0, None, None
+        if profile_data is not None:
+            try:
+                record_type, best_event_post, confidence, latest_post_id = classify_profile(profile_data,
+                                                                                            keyword_result)
+                if format_records:
+                    record = (_format_as_event(profile_data, best_event_post, user_id) if record_type == "event"
+                              else _format_as_venue(profile_data, user_id))
+            except (IndexError, KeyError, TypeError, AttributeError):
+                record_type, confidence, latest_post_id, record = "error", 0.0, None, None
+        result['type'].append(record_type)
+        result['confidence'].append(confidence)
+        result['latest_post_id'].append(latest_post_id)
+        result['record'].append(record)
+    return result
+
+
+if __name__ == "__main__":
+    # Re-classify every cached response, e.g. after tuning the keyword lists
+    start = time.perf_counter()
+    cached = [(username, payload) for username, _, payload in get_response_cache().replay()]
+    result = classify_batch(cached, format_records=False)
+    elapsed = time.perf_counter() - start
+
+    counts = {}
+    for record_type in result['type']:
+        counts[record_type] = counts.get(record_type, 0) + 1
+    log.info("Classified cached payloads", payloads=len(cached), seconds=round(elapsed, 2), types=counts)
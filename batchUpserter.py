@@ -0,0 +1,156 @@
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+import psycopg2
+
+from postGresConnection import Database, get_pool
+from scrapeLogging import get_logger
+from scrapeMetrics import stage_timer
+from scrapeRecords import EventRecord, ScrapeRecord
+
+log = get_logger(__name__)
+
+# --- CONFIGURATION ---
+# Flush when this many records are pending...
+BATCH_MAX_RECORDS = 50
+# ...or when the oldest pending record has waited this long (in seconds)
+BATCH_MAX_AGE = 10.0
+
+RECORD_TABLES = {"event": "events", "venue": "venues"}
+
+# `spilled` is True when a failed batch was handed to the write-behind queue for retry;
+# `error` is the psycopg2 exception of a failed batch;
+# `skipped` lists the (record_type, data) pairs dropped as near-duplicate events instead of written
+FlushResult = namedtuple('FlushResult', ['success', 'message', 'records', 'spilled', 'error', 'skipped'],
+                         defaults=(False, None, ()))
+
+
+class UpsertBatcher:
+    """
+    Collects formatted event/venue records and writes them with one multi-row
+    upsert per (table, column set) and a single commit per batch.
+    Size and age limits are checked on every add(); call flush() at the end of a cycle.
+    With a spill queue (see writeQueue), a batch that fails to write is queued for retry instead of lost.
+    With a deduplicator (see eventDedup), events repeating one already written are dropped as their
+    batch flushes, so the batch's posters are downloaded for hashing together.
+    """
+
+    def __init__(self, db_params, max_records=BATCH_MAX_RECORDS, max_age=BATCH_MAX_AGE, spill_queue=None,
+                 deduplicator=None):
+        self.db_params = db_params
+        self.max_records = max_records
+        self.max_age = max_age
+        self.spill_queue = spill_queue
+        self.deduplicator = deduplicator
+        self._pending = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        # Every non-empty FlushResult produced so far, so callers can map records to outcomes
+        self.flush_results = []
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, record_type: str, data: ScrapeRecord, on_success=None, write_info=None, generic_images=()):
+        """
+        Queues a record for the next flush.
+
+        Args:
+            record_type (str): "event" or "venue".
+            data (ScrapeRecord): The formatted record.
+            on_success (callable): Optional callback run once the record is committed (or skipped as a duplicate).
+            write_info (tuple): Optional (username, post_id, content_hash) kept with the record
+                                if it spills, so the change-detection state is updated on retry.
+            generic_images (tuple): Image URLs that say nothing about the event, such as the profile
+                                    picture a post without its own image falls back to (see eventDedup).
+
+        Returns:
+            FlushResult: The result if this add triggered a flush, otherwise None.
+        """
+        with self._lock:
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append((record_type, data, on_success, write_info, generic_images))
+            due = (len(self._pending) >= self.max_records
+                   or time.monotonic() - self._oldest >= self.max_age)
+        return self.flush() if due else None
+
+    def flush(self) -> FlushResult:
+        """
+        Writes every pending record in one transaction.
+
+        Returns:
+            FlushResult: (success, message, records, ..., skipped) where records are (record_type, data) pairs.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._oldest = None
+        if not pending:
+            return FlushResult(True, "Nothing to flush.", [])
+        pending, skipped = self._drop_duplicates(pending)
+        if not pending:
+            return self._skipped_only(skipped)
+
+        groups = {}
+        for record_type, data, *_ in pending:
+            key = (RECORD_TABLES.get(record_type, "venues"), data.COLUMNS)
+            groups.setdefault(key, []).append(data)
+
+        records = [(record_type, data) for record_type, data, *_ in pending]
+        skipped_pairs = [(record_type, data) for record_type, data, *_ in skipped]
+        try:
+            with stage_timer('db_upsert'), Database(self.db_params, pool=get_pool(self.db_params)) as db:
+                for (table_name, _), rows in groups.items():
+                    db.upsert_many(table_name, rows)
+                db.connection.commit()
+        except psycopg2.Error as e:
+            log.error("❌ Database error during batch upsert", records=len(pending), error=str(e))
+            if self.spill_queue is not None:
+                for record_type, data, _, write_info, _ in pending:
+                    self.spill_queue.enqueue(record_type, data, *(write_info or ()))
+                log.warning("📥 Records queued for retry", records=len(pending))
+                result = FlushResult(False, f"Batch upsert of {len(pending)} records failed: {e}. "
+                                            f"Records were queued for retry.", records, True, e, skipped_pairs)
+            else:
+                result = FlushResult(False, f"Batch upsert of {len(pending)} records failed: {e}", records,
+                                     error=e, skipped=skipped_pairs)
+            self.flush_results.append(result)
+            return result
+
+        log.info("💾 Batch upserted", records=len(pending), statement_groups=len(groups))
+        for _, _, on_success, _, _ in pending + skipped:
+            if on_success:
+                on_success()
+        message = f"Successfully upserted {len(pending)} records."
+        if skipped:
+            message += f" Skipped {len(skipped)} near-duplicate events."
+        result = FlushResult(True, message, records, skipped=skipped_pairs)
+        self.flush_results.append(result)
+        return result
+
+    def _drop_duplicates(self, pending: list) -> tuple:
+        """Splits pending entries into (to write, near-duplicate events to skip) with the deduplicator."""
+        if self.deduplicator is None or not any(isinstance(entry[1], EventRecord) for entry in pending):
+            return pending, []
+        generic_images = {url for *_, images in pending for url in images if url}
+        try:
+            with stage_timer('dedup'):
+                kept = {id(data) for data in self.deduplicator.filter([entry[1] for entry in pending], generic_images)}
+        except sqlite3.Error as e:
+            # A possible duplicate is better than a lost batch
+            log.error("❌ Deduplication failed; writing the batch as is", records=len(pending), error=str(e))
+            return pending, []
+        return ([entry for entry in pending if id(entry[1]) in kept],
+                [entry for entry in pending if id(entry[1]) not in kept])
+
+    def _skipped_only(self, skipped: list) -> FlushResult:
+        """The result of a batch whose every record was a near-duplicate: nothing to write."""
+        for _, _, on_success, _, _ in skipped:
+            if on_success:
+                on_success()
+        result = FlushResult(True, f"Skipped {len(skipped)} near-duplicate events.", [],
+                             skipped=[(record_type, data) for record_type, data, *_ in skipped])
+        self.flush_results.append(result)
+        return result
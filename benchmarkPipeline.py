@@ -0,0 +1,419 @@
+"""
+Offline benchmark for the scrape hot path.
+
+Replays recorded detailed-info payloads through a local mock EnsembleData server and
+measures InstaScrapper, upsert_to_db and the full process_user path: profiles/second,
+p50/p99 latency and the peak memory each stage allocates. Memory is traced with tracemalloc,
+which slows every stage down; --no-memory times the stages untraced. Writes go to an in-memory
+Postgres stand-in unless BENCH_DB_* variables point at a disposable Postgres database.
+
+    python benchmarkPipeline.py --record             # export fixtures from the response cache
+    python benchmarkPipeline.py --save-baseline      # run and store the numbers as the baseline
+    python benchmarkPipeline.py                      # run and compare against the baseline
+    python benchmarkPipeline.py --no-memory          # timings only, without tracing overhead
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# --- CONFIGURATION ---
+FIXTURE_DIR = os.getenv('BENCH_FIXTURE_DIR', 'benchmark_fixtures')
+BASELINE_PATH = os.getenv('BENCH_BASELINE', 'benchmark_baseline.json')
+# Profiles pushed through each benchmarked path
+DEFAULT_PROFILES = 500
+# Simulated latencies (in seconds) of the mock API and of each stand-in DB statement
+MOCK_API_LATENCY = float(os.getenv('BENCH_API_LATENCY', '0'))
+STAND_IN_DB_LATENCY = float(os.getenv('BENCH_DB_LATENCY', '0'))
+# A run fails the baseline check when throughput drops, or p99 grows, by more than this fraction
+REGRESSION_TOLERANCE = 0.20
+# Separates the fixture username from the run index in generated usernames
+USERNAME_SUFFIX = '__'
+
+_work_dir = tempfile.mkdtemp(prefix='scrape-bench-')
+# Isolate every local store and lift the API rate limit before the pipeline modules read their config
+os.environ.setdefault('SCRAPE_STATE_DB', os.path.join(_work_dir, 'state.sqlite3'))
+os.environ.setdefault('WRITE_QUEUE_DB', os.path.join(_work_dir, 'write_queue.sqlite3'))
+os.environ.setdefault('EVENT_DEDUP_DB', os.path.join(_work_dir, 'event_dedup.sqlite3'))
+# Fixture posters point nowhere, so only captions are compared
+os.environ['DEDUP_IMAGE_HASHES'] = '0'
+os.environ['RESPONSE_CACHE_MODE'] = 'off'
+os.environ['ENSEMBLE_MAX_RPS'] = '1000000'
+os.environ['ENSEMBLE_BURST'] = '1000000'
+os.environ['ENSEMBLE_DAILY_UNITS'] = '0'
+
+from scrapeLogging import configure_logging  # noqa: E402
+
+# Log calls still run at the configured levels (their cost is part of the numbers) but write nowhere
+configure_logging(stream=open(os.devnull, 'w'))
+
+import batchUpserter  # noqa: E402
+import ensembleClient  # noqa: E402
+import instaScrapper  # noqa: E402
+import venueIndex  # noqa: E402
+from captionDates import parse_event_times, scan_caption  # noqa: E402
+from changeState import ChangeStateStore  # noqa: E402
+from eventExtraction import post_caption  # noqa: E402
+from migrateSchema import migrate  # noqa: E402
+from profileParser import compact_payload  # noqa: E402
+from responseCache import ResponseCache  # noqa: E402
+from writeQueue import WriteBehindFlusher, WriteBehindQueue  # noqa: E402
+
+
+# ==============================================================================
+# FIXTURES
+# ==============================================================================
+
+def record_fixtures(fixture_dir: str = FIXTURE_DIR, cache: ResponseCache = None) -> int:
+    """Exports the latest cached raw response of every username as <username>.json. Returns the count."""
+    cache = cache or ResponseCache(mode='normal')
+    os.makedirs(fixture_dir, exist_ok=True)
+    written = 0
+    for username in cache.usernames():
+        history = cache.history(username)
+        raw = cache.load_raw(history[0][1]) if history else None
+        if raw is None:
+            continue
+        with open(os.path.join(fixture_dir, f"{username}.json"), 'wb') as f:
+            f.write(raw)
+        written += 1
+    return written
+
+
+def synthetic_payload(index: int) -> bytes:
+    """Builds a detailed-info response shaped like the real API, including fields the parser drops."""
+    rng = random.Random(index)
+    words = ['live', 'music', 'tonight', 'brunch', 'cocktails', 'karibu', 'nairobi', 'dj', 'set', 'menu',
+             'weekend', 'tickets', 'happy', 'hour', 'party', 'chill', 'vibe', 'food', 'open', 'daily',
+             'sat 14th dec', '8pm', 'till late', 'this friday', '9:30pm']
+    posts = [{
+        'node': {
+            'id': str(10 ** 12 + index * 100 + n),
+            'taken_at_timestamp': 1_700_000_000 - n * rng.randint(3600, 4 * 86400),
+            'display_url': f"https://example.invalid/{index}/{n}.jpg",
+            'has_upcoming_event': n == 0 and index % 7 == 0,
+            'location': {'id': str(index), 'name': f"Venue {index}"} if n % 3 == 0 else None,
+            'edge_media_to_caption': {'edges': [{'node': {'text': ' '.join(rng.choices(words, k=30))}}]},
+            'edge_media_preview_like': {'count': rng.randint(0, 5000)},
+            'thumbnail_resources': [{'src': f"https://example.invalid/{index}/{n}_{s}.jpg", 'config_width': s}
+                                    for s in (150, 240, 320, 480, 640)],
+        }
+    } for n in range(12)]
+    payload = {'data': {
+        'id': str(index),
+        'username': f"profile{index}",
+        'full_name': f"Profile {index}",
+        'biography': ' '.join(rng.choices(words, k=20)),
+        'external_url': f"https://example.invalid/{index}",
+        'profile_pic_url': f"https://example.invalid/{index}.jpg",
+        'business_email': f"info{index}@example.invalid",
+        'business_phone_number': f"+2547{index:08d}",
+        'business_address_json': json.dumps({'street_address': f"{index} Kimathi Street"}),
+        'edge_owner_to_timeline_media': {'count': 12, 'edges': posts},
+        'edge_felix_video_timeline': {'edges': posts},
+        'edge_related_profiles': {'edges': [{'node': {'id': str(i), 'username': f"related{i}"}} for i in range(80)]},
+    }}
+    return json.dumps(payload).encode('utf-8')
+
+
+def load_fixtures(fixture_dir: str = FIXTURE_DIR, synthetic: int = 50) -> dict:
+    """
+    Loads recorded fixtures as {username: raw bytes}, falling back to `synthetic`
+    generated payloads when the directory has none.
+    """
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(fixture_dir, '*.json'))):
+        with open(path, 'rb') as f:
+            fixtures[os.path.splitext(os.path.basename(path))[0]] = f.read()
+    if not fixtures:
+        fixtures = {f"profile{i}": synthetic_payload(i) for i in range(synthetic)}
+    return fixtures
+
+
+# ==============================================================================
+# MOCK API AND DATABASE STAND-IN
+# ==============================================================================
+
+class MockEnsembleServer:
+    """Serves fixtures on the detailed-info endpoint from a local thread, like the real API."""
+
+    def __init__(self, fixtures: dict, latency: float = MOCK_API_LATENCY):
+        names = list(fixtures)
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse_qs(urlsplit(self.path).query)
+                username = query.get('username', [''])[0].split(USERNAME_SUFFIX)[0]
+                body = fixtures.get(username) or fixtures[names[hash(username) % len(names)]]
+                if latency:
+                    time.sleep(latency)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StandInDatabase:
+    """
+    In-memory replacement for postGresConnection.Database with the same upsert interface.
+    Rows are kept per table and natural key; every statement and commit can be delayed
+    to model a remote database.
+    """
+    tables = {}
+    latency = STAND_IN_DB_LATENCY
+
+    def __init__(self, db_params, pool=None):
+        self.connection = self
+        self.cursor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def commit(self):
+        self._wait()
+
+    def upsert(self, table_name, record, conflict_column=None):
+        self._wait()
+        self.tables.setdefault(table_name, {})[getattr(record, conflict_column or record.KEY_COLUMN)] = \
+            record.as_params()
+        return 1
+
+    def upsert_many(self, table_name, records, conflict_column=None):
+        self._wait()
+        rows = self.tables.setdefault(table_name, {})
+        for record in records:
+            rows[getattr(record, conflict_column or record.KEY_COLUMN)] = record.as_params()
+        return len(records)
+
+    def select_changed(self, table_name, columns, changed_column, since=None):
+        # Rows are kept as bare parameter tuples, so there is nothing to reload; venues are learned as scraped
+        self._wait()
+        return []
+
+
+def use_database(db_params: dict = None):
+    """
+    Points the pipeline at a disposable Postgres when `db_params` is given, otherwise at StandInDatabase.
+
+    Returns:
+        dict: The connection parameters the pipeline will use.
+    """
+    if db_params:
+        migrate(db_params)
+        instaScrapper.db_connection_params = db_params
+        return db_params
+    for module in (instaScrapper, batchUpserter, venueIndex):
+        module.Database = StandInDatabase
+        module.get_pool = lambda params, **kwargs: None
+    return instaScrapper.db_connection_params
+
+
+def _bench_db_params() -> dict:
+    if not os.getenv('BENCH_DB_NAME'):
+        return None
+    return {
+        'dbname': os.getenv('BENCH_DB_NAME'),
+        'user': os.getenv('BENCH_DB_USER', 'postgres'),
+        'password': os.getenv('BENCH_DB_PASSWORD', ''),
+        'host': os.getenv('BENCH_DB_HOST', 'localhost'),
+        'port': os.getenv('BENCH_DB_PORT', '5432'),
+    }
+
+
+# ==============================================================================
+# MEASUREMENT
+# ==============================================================================
+
+def _traced(run):
+    """
+    Runs `run()` and measures the most memory it held at once on top of what was allocated before,
+    so a stage is not charged for the peaks of the stages before it.
+
+    Returns:
+        tuple: (run()'s result, peak in MB, or None when tracemalloc is not tracing)
+    """
+    if not tracemalloc.is_tracing():
+        return run(), None
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    result = run()
+    return result, max(0, tracemalloc.get_traced_memory()[1] - before) / (1024 * 1024)
+
+
+def _percentile(sorted_samples: list, fraction: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def _measure(name: str, items: list, call) -> dict:
+    """Runs `call(item)` for every item and summarizes the latencies."""
+    latencies = []
+
+    def run():
+        started = time.perf_counter()
+        for item in items:
+            t0 = time.perf_counter()
+            call(item)
+            latencies.append(time.perf_counter() - t0)
+        return time.perf_counter() - started
+
+    wall, peak_mb = _traced(run)
+    latencies.sort()
+    return {
+        'name': name,
+        'count': len(items),
+        'per_second': len(items) / wall if wall else 0.0,
+        'p50_ms': _percentile(latencies, 0.50) * 1000,
+        'p99_ms': _percentile(latencies, 0.99) * 1000,
+        'peak_mb': peak_mb,
+    }
+
+
+def run_benchmark(fixtures: dict, profiles: int = DEFAULT_PROFILES, db_params: dict = None,
+                  trace_memory: bool = True) -> dict:
+    """
+    Benchmarks caption date parsing, InstaScrapper, upsert_to_db and process_user over
+    `profiles` replayed fixtures. With `trace_memory`, every stage also reports its peak memory.
+
+    Returns:
+        dict: Benchmark name to {count, per_second, p50_ms, p99_ms, peak_mb}.
+    """
+    use_database(db_params)
+    if not trace_memory:
+        return _run_stages(fixtures, profiles)
+    tracemalloc.start()
+    try:
+        return _run_stages(fixtures, profiles)
+    finally:
+        tracemalloc.stop()
+
+
+def _run_stages(fixtures: dict, profiles: int) -> dict:
+    names = list(fixtures)
+    payloads = [compact_payload(fixtures[names[i % len(names)]]) for i in range(profiles)]
+    results = {}
+
+    # Every distinct post caption of the fixtures, first with an empty memo, then again from it
+    nodes = [edge['node'] for payload in payloads
+             for edge in ((payload.get('data') or {}).get('edge_owner_to_timeline_media') or {}).get('edges') or []]
+    posts = list({post_caption(node): node.get('taken_at_timestamp') for node in nodes}.items())
+    scan_caption.cache_clear()
+    results['caption_dates_cold'] = _measure('caption_dates_cold', posts, lambda post: parse_event_times(*post))
+    results['caption_dates_warm'] = _measure('caption_dates_warm', posts, lambda post: parse_event_times(*post))
+
+    results['InstaScrapper'] = _measure('InstaScrapper', payloads,
+                                        lambda payload: instaScrapper.InstaScrapper([payload], '1234'))
+
+    records = [instaScrapper.InstaScrapper([payload], '1234') for payload in payloads]
+    results['upsert_to_db'] = _measure('upsert_to_db', records,
+                                       lambda result: instaScrapper.upsert_to_db(result[0], result[1]))
+
+    state = ChangeStateStore(os.path.join(_work_dir, f"state-{time.time_ns()}.sqlite3"))
+    queue = WriteBehindQueue(os.path.join(_work_dir, f"queue-{time.time_ns()}.sqlite3"))
+    usernames = [f"{names[i % len(names)]}{USERNAME_SUFFIX}{i}" for i in range(profiles)]
+    with MockEnsembleServer(fixtures) as server:
+        ensembleClient.API_ROOT = server.url
+        results['process_user'] = _measure(
+            'process_user', usernames,
+            lambda username: instaScrapper.process_user(username, state, min_refetch_seconds=0, write_queue=queue))
+
+    flusher = WriteBehindFlusher(queue, instaScrapper.db_connection_params, state=state)
+    started = time.perf_counter()
+    drained, peak_mb = _traced(flusher.drain)
+    wall = time.perf_counter() - started
+    results['write_queue_drain'] = {
+        'name': 'write_queue_drain', 'count': drained, 'per_second': drained / wall if wall else 0.0,
+        'p50_ms': 0.0, 'p99_ms': 0.0, 'peak_mb': peak_mb,
+    }
+    return results
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float = REGRESSION_TOLERANCE) -> list:
+    """
+    Returns a description of every regression beyond `tolerance` against the baseline.
+    Stages timed with memory tracing are only compared with traced baselines, and vice versa.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous or (previous.get('peak_mb') is None) != (current.get('peak_mb') is None):
+            continue
+        if previous['per_second'] and current['per_second'] < previous['per_second'] * (1 - tolerance):
+            regressions.append(f"{name}: {current['per_second']:.1f}/s vs baseline {previous['per_second']:.1f}/s")
+        if previous['p99_ms'] and current['p99_ms'] > previous['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {current['p99_ms']:.2f}ms vs baseline {previous['p99_ms']:.2f}ms")
+    return regressions
+
+
+def _format_peak(peak_mb) -> str:
+    return '-' if peak_mb is None else f"{peak_mb:.1f}"
+
+
+def print_results(results: dict):
+    print(f"\n{'benchmark':<20} {'count':>7} {'per sec':>10} {'p50 ms':>9} {'p99 ms':>9} {'peak MB':>9}")
+    for result in results.values():
+        print(f"{result['name']:<20} {result['count']:>7} {result['per_second']:>10.1f} {result['p50_ms']:>9.2f} "
+              f"{result['p99_ms']:>9.2f} {_format_peak(result.get('peak_mb')):>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scrape hot path against recorded fixtures.")
+    parser.add_argument('--profiles', type=int, default=DEFAULT_PROFILES)
+    parser.add_argument('--record', action='store_true', help="export fixtures from the response cache and exit")
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the new baseline")
+    parser.add_argument('--no-memory', action='store_true', help="skip memory tracing for undistorted timings")
+    args = parser.parse_args()
+
+    if args.record:
+        print(f"📼 Recorded {record_fixtures()} fixtures into '{FIXTURE_DIR}'.")
+        sys.exit(0)
+
+    bench_results = run_benchmark(load_fixtures(), args.profiles, _bench_db_params(), not args.no_memory)
+    print_results(bench_results)
+
+    if args.save_baseline:
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(bench_results, f, indent=2)
+        print(f"\n📌 Baseline saved to '{BASELINE_PATH}'.")
+    elif os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            found = compare_to_baseline(bench_results, json.load(f))
+        if found:
+            print("\n❌ Regressions against the baseline:")
+            for regression in found:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\n✅ No regressions against the baseline.")
@@ -0,0 +1,220 @@
+import os
+import re
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+# --- CONFIGURATION ---
+# Captions are read, and event times returned, in the venues' local time
+VENUE_TIMEZONE = ZoneInfo(os.getenv('VENUE_TIMEZONE', 'Africa/Nairobi'))
+# "till late" / "till dawn" ends at this hour the next morning
+LATE_END_HOUR = 4
+# A date without a year that falls more than this long before the post belongs to the following year
+PAST_DATE_GRACE = timedelta(days=60)
+# Distinct captions whose scan results are memoized (re-scrapes and reposts repeat captions)
+CAPTION_CACHE_SIZE = 8192
+
+EventTimes = namedtuple('EventTimes', ['event_date', 'start_time', 'end_time'])
+NO_EVENT_TIMES = EventTimes(None, None, None)
+
+# Scan result of one caption, independent of when it was posted:
+# date: (day, month, year or None); weekday: (0=Monday..6, strictly_after); relative_days: 0 today, 1 tomorrow;
+# start/end: (hour, minute); late: the event runs "till late"
+CaptionScan = namedtuple('CaptionScan', ['date', 'weekday', 'relative_days', 'start', 'end', 'late'])
+
+_MONTHS = {'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+           'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12}
+_WEEKDAYS = {
+    'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3, 'friday': 4, 'saturday': 5, 'sunday': 6,
+    # Swahili
+    'jumatatu': 0, 'jumanne': 1, 'jumatano': 2, 'alhamisi': 3, 'ijumaa': 4, 'jumamosi': 5, 'jumapili': 6,
+}
+_RELATIVE_DAYS = {'tonight': 0, 'today': 0, 'leo usiku': 0, 'tomorrow': 1, 'tmrw': 1, 'kesho': 1}
+
+_MONTH = (r'(?:january|jan|february|feb|march|mar|april|apr|may|june|jun|july|jul|august|aug|'
+          r'september|sept|sep|october|oct|november|nov|december|dec)\.?(?!\w)')
+# Abbreviations are only trusted right before a date ("Sat 14th Dec"), full names anywhere
+_WEEKDAY_ABBREVIATION = (r'(?:mon|tue|tues|wed|thu|thur|thurs|fri|sat|sun|monday|tuesday|wednesday|thursday|'
+                         r'friday|saturday|sunday)')
+_WEEKDAY_PREFIX = _WEEKDAY_ABBREVIATION + r'\.?,?\s+'
+_WEEKDAY = r'(?:' + '|'.join(_WEEKDAYS) + r')'
+_ORDINAL = r'(?:st|nd|rd|th)?'
+
+# Leading letters of every word that can start a match: positions not starting with a digit or one
+# of these are rejected before any alternative is tried, which is most of a caption
+_MATCH_STARTS = sorted({word[:3] for word in (*_MONTHS, *_WEEKDAYS, *_RELATIVE_DAYS)}
+                       | {'thi', 'nex', 'com', 'til', 'unt', "'ti", 'to ', 'on ', 'all'})
+
+# Matched against the lowercased caption; every alternative starts at a word start
+_CAPTION_PATTERN = re.compile(r'(?<![\w:./])(?=\d|' + '|'.join(map(re.escape, _MATCH_STARTS)) + r')(?:' + '|'.join((
+    # "Sat 14th Dec", "14 December 2024", "14th of Dec"
+    rf'(?:{_WEEKDAY_PREFIX})?(?P<dm_day>[0-3]?\d){_ORDINAL}\s*(?:of\s+)?(?P<dm_month>{_MONTH})'
+    rf'(?:,?\s*(?P<dm_year>20\d\d)(?!\d))?',
+    # "Dec 14", "December 14th, 2024"
+    rf'(?P<md_month>{_MONTH})\s+(?P<md_day>[0-3]?\d){_ORDINAL}(?!\w)(?:,?\s*(?P<md_year>20\d\d)(?!\d))?',
+    # "Sat 14/12", "on 14/12", "14/12/2024" (day first; only read as a date next to one of these cues)
+    rf'(?:(?P<num_weekday>{_WEEKDAY_ABBREVIATION}|{_WEEKDAY})\.?,?\s+|(?P<num_on>on)\s+)?'
+    r'(?P<num_day>[0-3]?\d)/(?P<num_month>[01]?\d)(?:/(?P<num_year>(?:20)?\d\d))?(?![\w/])',
+    # "this Friday", "next Saturday", "Jumamosi"
+    rf'(?:(?P<wd_mod>this|next|coming)\s+)?(?P<wd_name>{_WEEKDAY})(?!\w)',
+    # "tonight", "tomorrow", "kesho"
+    r'(?P<rel>' + '|'.join(sorted(_RELATIVE_DAYS, key=len, reverse=True)) + r')(?!\w)',
+    # "8PM", "8:30 pm", "10.30p.m."
+    r'(?P<t_hour>1[0-2]|0?[1-9])(?:[:.](?P<t_min>[0-5]\d))?\s*(?P<t_ampm>[ap])\.?m(?!\w)\.?',
+    # "20:00", "20h00", "20:00hrs"
+    r'(?P<h_hour>[01]?\d|2[0-3])[:h](?P<h_min>[0-5]\d)(?:\s*hrs)?(?!\w)',
+    # "till late", "til dawn", "all night"
+    r"(?P<late>(?:till?|until|'til|to)\s+(?:late|dawn|sunrise|morning)|all\s+night)(?!\w)",
+)) + ')')
+# Text allowed between the two times of a range: "8pm - 2am", "8pm till 2am"
+_RANGE_SEPARATOR = re.compile(r"\s*(?:-|–|—|to|till?|until|'til)\s*")
+
+
+def _year(value: str) -> int:
+    year = int(value)
+    return year + 2000 if year < 100 else year
+
+
+def _weekday(name: str) -> int:
+    """Returns the weekday (0=Monday) of a weekday name or abbreviation ("sat", "thurs", "jumamosi")."""
+    if name in _WEEKDAYS:
+        return _WEEKDAYS[name]
+    return next(weekday for word, weekday in _WEEKDAYS.items() if word.startswith(name[:3]))
+
+
+def _numeric_date(m) -> tuple:
+    """
+    Reads a numeric "14/12" match as (day, month, year or None). Slashed numbers are as often
+    "Open 24/7" or a "10/10" rating as a date, so without a year they only count after a weekday
+    or "on", and never in those two shapes.
+
+    Returns:
+        tuple: The date, or None if the match is not a real date next to a date cue.
+    """
+    day, month = int(m.group('num_day')), int(m.group('num_month'))
+    year = _year(m.group('num_year')) if m.group('num_year') else None
+    if year is None:
+        if not (m.group('num_weekday') or m.group('num_on')):
+            return None
+        if (day, month) == (24, 7) or (month == 10 and day <= 10):
+            return None
+    try:
+        date(year or 2000, month, day)  # 2000 is a leap year, so "29/02" is left to the post's year
+    except ValueError:
+        return None
+    return day, month, year
+
+
+@lru_cache(maxsize=CAPTION_CACHE_SIZE)
+def scan_caption(caption: str) -> CaptionScan:
+    """
+    Finds the first date, weekday, relative day and time range mentioned in a caption,
+    in one pass of the precompiled pattern over the lowercased text. Memoized: reposted and
+    re-scraped captions are free.
+
+    Returns:
+        CaptionScan: What the caption says, not yet resolved against a post date (None if it says nothing).
+    """
+    found_date = numeric_date = weekday = relative_days = start = end = None
+    late = False
+    start_end = None
+    caption = caption.lower()
+    for m in _CAPTION_PATTERN.finditer(caption):
+        if m.group('dm_day') and found_date is None:
+            found_date = (int(m.group('dm_day')), _MONTHS[m.group('dm_month')[:3]],
+                          _year(m.group('dm_year')) if m.group('dm_year') else None)
+        elif m.group('md_day') and found_date is None:
+            found_date = (int(m.group('md_day')), _MONTHS[m.group('md_month')[:3]],
+                          _year(m.group('md_year')) if m.group('md_year') else None)
+        elif m.group('num_day'):
+            numeric = _numeric_date(m)
+            if numeric is None and m.group('num_weekday') and weekday is None:
+                # "Friday 31/02": the date is nonsense but its weekday still says something
+                weekday = (_weekday(m.group('num_weekday')), False)
+            elif numeric_date is None:
+                numeric_date = numeric
+        elif m.group('wd_name') and weekday is None:
+            weekday = (_WEEKDAYS[m.group('wd_name')], m.group('wd_mod') == 'next')
+        elif m.group('rel') and relative_days is None:
+            relative_days = _RELATIVE_DAYS[' '.join(m.group('rel').split())]
+        elif m.group('t_hour') or m.group('h_hour'):
+            if m.group('t_hour'):
+                hour = int(m.group('t_hour')) % 12 + (12 if m.group('t_ampm') == 'p' else 0)
+                minute = int(m.group('t_min') or 0)
+            else:
+                hour, minute = int(m.group('h_hour')), int(m.group('h_min'))
+            if start is None:
+                start, start_end = (hour, minute), m.end()
+            elif end is None and start_end is not None and _RANGE_SEPARATOR.fullmatch(caption, start_end, m.start()):
+                end = (hour, minute)
+        elif m.group('late'):
+            late = True
+
+    if found_date is None and weekday is None:
+        # A weekday phrase ("this Friday") outranks a numeric date, the weaker of the two signals
+        found_date = numeric_date
+    if found_date is None and weekday is None and relative_days is None and start is None:
+        return None
+    return CaptionScan(found_date, weekday, relative_days, start, end, late)
+
+
+def _resolve_day(scan: CaptionScan, posted_on: date) -> date:
+    if scan.date is not None:
+        day, month, year = scan.date
+        try:
+            if year is not None:
+                return date(year, month, day)
+            candidate = date(posted_on.year, month, day)
+            if candidate < posted_on - PAST_DATE_GRACE:
+                candidate = date(posted_on.year + 1, month, day)
+            return candidate
+        except ValueError:
+            pass  # "31/02" and the like: fall through to the weaker signals
+    if scan.weekday is not None:
+        weekday, strictly_after = scan.weekday
+        days_ahead = (weekday - posted_on.weekday()) % 7
+        if strictly_after and days_ahead == 0:
+            days_ahead = 7
+        return posted_on + timedelta(days=days_ahead)
+    if scan.relative_days is not None:
+        return posted_on + timedelta(days=scan.relative_days)
+    # Only a time was given: the post announces something the same day
+    return posted_on
+
+
+def parse_event_times(caption: str, posted_at: float, tz=VENUE_TIMEZONE) -> EventTimes:
+    """
+    Reads an event's date and start/end times from a post caption ("Sat 14th Dec",
+    "this Friday", "8PM till late", "8pm - 2am"), resolved relative to when the post
+    was published, in the venue's timezone.
+
+    Args:
+        caption (str): The post caption.
+        posted_at (float): The post's taken_at_timestamp (Unix seconds).
+        tz (ZoneInfo): The venue's timezone.
+
+    Returns:
+        EventTimes: (event_date at midnight, start_time, end_time) as aware datetimes;
+        fields the caption does not determine are None.
+    """
+    if not caption or not posted_at:
+        return NO_EVENT_TIMES
+    scan = scan_caption(caption)
+    if scan is None:
+        return NO_EVENT_TIMES
+
+    day = _resolve_day(scan, datetime.fromtimestamp(posted_at, tz).date())
+    event_date = datetime.combine(day, time(), tz)
+    if scan.start is None:
+        return EventTimes(event_date, None, None)
+
+    start_time = datetime.combine(day, time(*scan.start), tz)
+    end_time = None
+    if scan.end is not None:
+        end_time = datetime.combine(day, time(*scan.end), tz)
+        if end_time <= start_time:
+            end_time += timedelta(days=1)
+    elif scan.late:
+        end_time = datetime.combine(day + timedelta(days=1), time(LATE_END_HOUR), tz)
+    return EventTimes(event_date, start_time, end_time)
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# --- CONFIGURATION ---
+# Local SQLite file holding per-profile change-detection state
+STATE_DB_PATH = os.getenv('SCRAPE_STATE_DB', 'scrape_state.sqlite3')
+
+# Profiles fetched more recently than this are not fetched again (in seconds)
+MIN_REFETCH_SECONDS = float(os.getenv('MIN_REFETCH_SECONDS', '3600'))
+
+# Fields regenerated on every format call; they must not count as a content change
+VOLATILE_FIELDS = {'id', 'createdAt', 'updatedAt'}
+
+
+def content_hash(record_type: str, data) -> str:
+    """Returns a stable SHA-256 of a formatted record (or dict), ignoring volatile fields."""
+    items = data.items() if isinstance(data, dict) else zip(data.COLUMNS, data.as_params())
+    stable = {key: value for key, value in items if key not in VOLATILE_FIELDS}
+    payload = json.dumps([record_type, stable], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ChangeStateStore:
+    """
+    Durable per-username scrape state: last post ID, content hash of the last
+    written record, when the profile was last fetched and last changed, and the
+    high-water mark of posts already run through event extraction.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path=STATE_DB_PATH):
+        """
+        Opens (and creates if needed) the SQLite state file.
+
+        Args:
+            path (str): Path to the SQLite database file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS profile_state (
+                username TEXT PRIMARY KEY,
+                last_post_id TEXT,
+                content_hash TEXT,
+                last_fetched_at REAL,
+                last_changed_at REAL,
+                post_high_water REAL
+            )
+        """)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(profile_state)")}
+        if 'post_high_water' not in columns:
+            self._conn.execute("ALTER TABLE profile_state ADD COLUMN post_high_water REAL")
+
+    def get(self, username: str) -> dict:
+        """Returns the stored state for `username`, or None if it was never scraped."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_post_id, content_hash, last_fetched_at, last_changed_at "
+                "FROM profile_state WHERE username = ?", (username,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            'last_post_id': row[0],
+            'content_hash': row[1],
+            'last_fetched_at': row[2],
+            'last_changed_at': row[3],
+        }
+
+    def is_fresh(self, username: str, min_interval: float = MIN_REFETCH_SECONDS) -> bool:
+        """True when the profile was fetched less than `min_interval` seconds ago."""
+        state = self.get(username)
+        if not state or state['last_fetched_at'] is None:
+            return False
+        return time.time() - state['last_fetched_at'] < min_interval
+
+    def is_unchanged(self, username: str, new_hash: str) -> bool:
+        """True when `new_hash` matches the content hash of the last written record."""
+        state = self.get(username)
+        return bool(state) and state['content_hash'] == new_hash
+
+    def mark_fetched(self, username: str):
+        """Records that the API was called for `username` just now."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO profile_state (username, last_fetched_at) VALUES (?, ?) "
+                "ON CONFLICT (username) DO UPDATE SET last_fetched_at = excluded.last_fetched_at",
+                (username, time.time()),
+            )
+
+    def record_write(self, username: str, post_id: str, new_hash: str):
+        """Records the post ID and content hash of a record that was written to the DB."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO profile_state (username, last_post_id, content_hash, last_fetched_at, last_changed_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (username) DO UPDATE SET last_post_id = excluded.last_post_id, "
+                "content_hash = excluded.content_hash, last_changed_at = excluded.last_changed_at",
+                (username, post_id, new_hash, now, now),
+            )
+
+    def post_high_water(self, username: str) -> float:
+        """Returns the taken_at_timestamp of the newest post already extracted for `username`, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT post_high_water FROM profile_state WHERE username = ?", (username,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def record_post_high_water(self, username: str, taken_at: float):
+        """Advances the post high-water mark of `username`; it never moves backwards."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO profile_state (username, post_high_water) VALUES (?, ?) "
+                "ON CONFLICT (username) DO UPDATE SET post_high_water = "
+                "MAX(COALESCE(post_high_water, 0), excluded.post_high_water)",
+                (username, taken_at),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_state_store() -> ChangeStateStore:
+    """Returns the process-wide store backed by STATE_DB_PATH, opening it on first use."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ChangeStateStore()
+        return _default_store
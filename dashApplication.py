@@ -1,14 +1,25 @@
 import os
 import json
-import random
-import time
 from datetime import datetime
-import base64
 import requests
 import dash
 import dash_bootstrap_components as dbc
-import psycopg2
-from dash import dcc, html, Input, Output, State
+from dash import dcc, html, Input, Output, State, Patch, no_update
+
+from ensembleClient import fetch_detailed_info
+from eventExtraction import caption_headline, event_times, post_caption
+from batchUpserter import UpsertBatcher
+from eventDedup import get_deduplicator, profile_generic_images
+from keywordMatcher import EVENT_CONFIDENCE_THRESHOLD, EVENT_MATCHER
+from imageCache import prefetch_thumbnails, register_thumbnail_route, thumbnail_src
+from scrapeRecords import EventRecord, VenueRecord, event_source_key, stable_id, venue_source_key
+from scrapeJobs import get_job, start_job
+from scrapeLogging import get_logger
+from scrapeMetrics import record_scrape, register_metrics_route, stage_timer
+from venueIndex import ensure_venue_index, get_venue_index
+from writeQueue import ensure_flusher, get_write_queue
+
+log = get_logger(__name__)
 
 # --- Environment and Database Configuration ---
 TOKEN = os.getenv('EnsembleApi')
@@ -20,75 +31,50 @@ db_connection_params = {
     "port": "5432"
 }
 
-EVENT_KEYWORDS = [
-    'event', 'concert', 'show', 'performance', 'party', 'celebration',
-    'festival', 'workshop', 'seminar', 'conference', 'meetup', 'launch',
-    'opening', 'closing', 'anniversary', 'birthday', 'wedding', 'gala'
-]
-
 
 # ==============================================================================
 # REFACTORED BACKEND LOGIC FOR DASH INTEGRATION
 # ==============================================================================
 
-def image_to_base64(image_url):
-    """Fetches an image from a URL and encodes it to a Base64 string."""
-    if not image_url:
-        return None
-    try:
-        response = requests.get(image_url, timeout=10)
-        response.raise_for_status()
-
-        # Get the content type to correctly format the data URI
-        content_type = response.headers.get('content-type', 'image/png')
-
-        # Encode the image content in Base64
-        encoded_image = base64.b64encode(response.content).decode('utf-8')
-
-        # Return the formatted data URI
-        return f"data:{content_type};base64,{encoded_image}"
-
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching image from {image_url}: {e}")
-        return None
-
-
-def _format_as_event(profile_data: dict, event_post: dict) -> dict:
-    """Formats scraped data into an event dictionary."""
+def _format_as_event(profile_data: dict, event_post: dict) -> EventRecord:
+    """Formats scraped data into an EventRecord."""
     if event_post is None: event_post = {}
-    caption_edges = event_post.get('edge_media_to_caption', {}).get('edges', [])
-    caption = caption_edges[0]['node']['text'] if caption_edges else profile_data.get('biography', '')
+    post_text = post_caption(event_post)
+    caption = post_text or profile_data.get('biography', '')
 
-    # Using current time for demonstration as in the original script
     now = datetime.now()
-
-    return {
-        'id': random.randint(100, 99999),
-        'performerId': None,
-        'eventName': profile_data.get('full_name', 'Unnamed Event'),
-        'description': caption,
-        'minAmount': None,
-        'eventDate': now,
-        'posterUrl': event_post.get('display_url', profile_data.get('profile_pic_url', '')),
-        'createdBy': 289,
-        'deletedAt': None,
-        'createdAt': now,
-        'updatedAt': now,
-        'isPaid': False,
-        'ticketingURL': profile_data.get('external_url', ''),
-        'eventQRCode': None,
-        'eventStatus': 'UNPUBLISHED',
-        'previousEventDate': None,
-        'previousStartTime': None,
-        'previousEndTime': None,
-        'startTime': now,
-        'endTime': now,
-        'venueId': 7,
-    }
-
-
-def _format_as_venue(profile_data: dict) -> dict:
-    """Formats scraped data into a venue dictionary."""
+    # Dated by what the caption announces, else by the post itself, so re-formatting a post is stable
+    event_date, start_time, end_time = event_times(event_post, post_text)
+    source_key = event_source_key(profile_data, event_post)
+
+    return EventRecord(
+        id=stable_id(source_key),
+        sourceKey=source_key,
+        performerId=None,
+        eventName=caption_headline(post_text) or profile_data.get('full_name', 'Unnamed Event'),
+        description=caption,
+        minAmount=None,
+        eventDate=event_date,
+        posterUrl=event_post.get('display_url', profile_data.get('profile_pic_url', '')),
+        createdBy=289,
+        deletedAt=None,
+        createdAt=now,
+        updatedAt=now,
+        isPaid=False,
+        ticketingURL=profile_data.get('external_url', ''),
+        eventQRCode=None,
+        eventStatus='UNPUBLISHED',
+        previousEventDate=None,
+        previousStartTime=None,
+        previousEndTime=None,
+        startTime=start_time,
+        endTime=end_time,
+        venueId=get_venue_index(db_connection_params).resolve(event_post, profile_data, default=7),
+    )
+
+
+def _format_as_venue(profile_data: dict) -> VenueRecord:
+    """Formats scraped data into a VenueRecord."""
     address = ''
     address_str = profile_data.get('business_address_json')
     if isinstance(address_str, str) and address_str:
@@ -99,53 +85,29 @@ def _format_as_venue(profile_data: dict) -> dict:
             address = ''
 
     now = datetime.now()
-    return {
-        'id': random.randint(100, 9999),
-        'userId': 289,
-        'venueName': profile_data.get('full_name', 'Unnamed Venue'),
-        'email': profile_data.get('business_email'),
-        'phoneNumber': profile_data.get('business_phone_number'),
-        'address': address,
-        'openHours': None,
-        'closingHours': None,
-        'latitude': None,
-        'longitude': None,
-        'capacity': None,
-        'description': profile_data.get('biography', ''),
-        'website': profile_data.get('external_url', ''),
-        'profileImageUrl': profile_data.get('profile_pic_url', ''),
-        'coverImageUrl': None,
-        'allowsDirectBookings': False,
-        'createdAt': now,
-        'updatedAt': now,
-        'deletedAt': None
-    }
-
-
-def upsert_to_db(record_type: str, data: dict):
-    """Upserts a record and returns a status tuple (success, message)."""
-    table_name = "events" if record_type == "event" else "venues"
-    record_name = data.get('eventName', data.get('venueName'))
-    columns = data.keys()
-    columns_sql = ', '.join(f'"{col}"' for col in columns)
-    placeholders = ', '.join(['%s'] * len(columns))
-    update_cols = [f'"{col}" = EXCLUDED."{col}"' for col in columns if col != 'id']
-    update_sql = ', '.join(update_cols)
-
-    upsert_statement = f"""
-        INSERT INTO {table_name} ({columns_sql}) VALUES ({placeholders})
-        ON CONFLICT (id) DO UPDATE SET {update_sql};
-    """
-    values = list(data.values())
-    try:
-        with psycopg2.connect(**db_connection_params) as conn:
-            with conn.cursor() as cur:
-                cur.execute(upsert_statement, values)
-        return (True, f"Successfully upserted '{record_name}' to '{table_name}'.")
-    except psycopg2.Error as e:
-        return (False, f"Database error for '{record_name}': {e}")
-    except Exception as e:
-        return (False, f"An unexpected error occurred during DB operation: {e}")
+    source_key = venue_source_key(profile_data)
+    return VenueRecord(
+        id=stable_id(source_key),
+        sourceKey=source_key,
+        userId=289,
+        venueName=profile_data.get('full_name', 'Unnamed Venue'),
+        email=profile_data.get('business_email'),
+        phoneNumber=profile_data.get('business_phone_number'),
+        address=address,
+        openHours=None,
+        closingHours=None,
+        latitude=None,
+        longitude=None,
+        capacity=None,
+        description=profile_data.get('biography', ''),
+        website=profile_data.get('external_url', ''),
+        profileImageUrl=profile_data.get('profile_pic_url', ''),
+        coverImageUrl=None,
+        allowsDirectBookings=False,
+        createdAt=now,
+        updatedAt=now,
+        deletedAt=None
+    )
 
 
 def InstaScrapper(scraped_data: list) -> tuple:
@@ -166,23 +128,30 @@ def InstaScrapper(scraped_data: list) -> tuple:
     if not is_event and recent_posts:
         captions = [p['node']['edge_media_to_caption']['edges'][0]['node']['text'] for p in recent_posts if
                     p.get('node', {}).get('edge_media_to_caption', {}).get('edges')]
-        text_to_search = (profile_data.get('biography', '') + ' ' + ' '.join(captions)).lower()
-        if any(keyword in text_to_search for keyword in EVENT_KEYWORDS):
+        text_to_search = profile_data.get('biography', '') + ' ' + ' '.join(captions)
+        if EVENT_MATCHER.match(text_to_search).confidence >= EVENT_CONFIDENCE_THRESHOLD:
             is_event, best_event_post = True, recent_posts[0].get('node', {})
 
-    return ("event", _format_as_event(profile_data, best_event_post)) if is_event else (
-        "venue", _format_as_venue(profile_data))
+    if is_event:
+        return "event", _format_as_event(profile_data, best_event_post)
+    venue = _format_as_venue(profile_data)
+    get_venue_index(db_connection_params).learn_venue(profile_data, venue.id)
+    return "venue", venue
 
 
-def create_summary_card(record_type, data, db_success):
-    """Creates a dbc.Card component to summarize the scraping result with an embedded image."""
+def create_summary_card(record_type, data, db_success, queued=False, pending=False, thumbnail=None,
+                        duplicate=False):
+    """
+    Creates a dbc.Card component to summarize the scraping result with an embedded image.
+    A pending card is shown as soon as the profile is formatted, with a placeholder instead of the image,
+    and replaced once its batch is written; `thumbnail` is the served URL of the record's cached image.
+    A duplicate card marks an event skipped as a near-duplicate of one already saved.
+    """
     if record_type == 'event':
-        title = data.get('eventName', 'N/A')
-        # Get the original image URL
-        image_url = data.get('posterUrl')
-        description = data.get('description', 'No description available.')
+        title = data.eventName or 'N/A'
+        description = data.description or 'No description available.'
         short_desc = (description[:120] + '...') if len(description) > 120 else description
-        event_date_obj = data.get('eventDate')
+        event_date_obj = data.eventDate
         event_date_str = event_date_obj.strftime('%a, %b %d, %Y') if event_date_obj else 'N/A'
         icon = "🎉"
 
@@ -190,38 +159,45 @@ def create_summary_card(record_type, data, db_success):
             html.P(f"🗓️ Date: {event_date_str}", className="card-text fw-bold"),
             html.P(short_desc, className="card-text text-muted small"),
         ]
-        if data.get('ticketingURL'):
-            card_body.append(dbc.CardLink("Get Tickets", href=data.get('ticketingURL'), target="_blank"))
+        if data.ticketingURL:
+            card_body.append(dbc.CardLink("Get Tickets", href=data.ticketingURL, target="_blank"))
 
     elif record_type == 'venue':
-        title = data.get('venueName', 'N/A')
-        # Get the original image URL
-        image_url = data.get('profileImageUrl')
-        description = data.get('description', 'No description available.')
+        title = data.venueName or 'N/A'
+        description = data.description or 'No description available.'
         short_desc = (description[:120] + '...') if len(description) > 120 else description
         icon = "🏠"
 
         card_body = [html.P(short_desc, className="card-text text-muted small")]
-        if data.get('address'):
-            card_body.append(html.P(f"📍 {data.get('address')}", className="card-text small"))
-        if data.get('phoneNumber'):
-            card_body.append(html.P(f"📞 {data.get('phoneNumber')}", className="card-text small"))
+        if data.address:
+            card_body.append(html.P(f"📍 {data.address}", className="card-text small"))
+        if data.phoneNumber:
+            card_body.append(html.P(f"📞 {data.phoneNumber}", className="card-text small"))
 
     else:  # Error case
         return None
 
-    # --- KEY CHANGE IS HERE ---
-    # Convert the image URL to a Base64 string before passing it to the card
-    base64_image = image_to_base64(image_url)
-
-    db_badge = dbc.Badge("DB Success", color="success", className="me-1") if db_success else dbc.Badge("DB Failed",
-                                                                                                       color="danger",
-                                                                                                       className="me-1")
+    # Cards point at a cached, resized thumbnail served by Flask instead of an inline base64 blob.
+    # Pending cards never fetch it: the batch's images are downloaded together when the cards are updated
+    if pending:
+        image = dbc.Placeholder(animation="glow", className="card-img-top")
+    else:
+        image = dbc.CardImg(src=thumbnail, top=True, className="card-img-top") if thumbnail else None
+
+    if pending:
+        db_badge = dbc.Badge("Saving...", color="info", className="me-1")
+    elif duplicate:
+        db_badge = dbc.Badge("Duplicate - Not Saved", color="secondary", className="me-1")
+    elif db_success:
+        db_badge = dbc.Badge("DB Success", color="success", className="me-1")
+    elif queued:
+        db_badge = dbc.Badge("Queued for Retry", color="warning", className="me-1")
+    else:
+        db_badge = dbc.Badge("DB Failed", color="danger", className="me-1")
 
     return dbc.Col(dbc.Card([
         dbc.CardHeader(f"{icon} {title} ({record_type.capitalize()})"),
-        # Use the base64_image string as the source for dbc.CardImg
-        dbc.CardImg(src=base64_image, top=True, className="card-img-top") if base64_image else None,
+        image,
         dbc.CardBody(card_body),
         dbc.CardFooter(db_badge)
     ], className="mb-4 h-100 shadow-lg border-primary fade-in"), md=6, lg=4)
@@ -230,40 +206,80 @@ def create_summary_card(record_type, data, db_success):
 # ==============================================================================
 # UPDATED SCRAPING JOB GENERATOR
 # ==============================================================================
+def _batch_outputs(flush_result, card_positions):
+    """
+    Yields the alert for one flushed batch of records and replaces their pending cards
+    (found by record in `card_positions`) with cards showing the write outcome.
+    """
+    if not flush_result or not (flush_result.records or flush_result.skipped):
+        return
+    outcomes = [(record_type, data, False) for record_type, data in flush_result.records]
+    outcomes += [(record_type, data, True) for record_type, data in flush_result.skipped]
+    # Download every image in the batch in parallel before building the cards
+    thumbnails = prefetch_thumbnails(data.image_url for _, data, _ in outcomes)
+
+    alert_color = "success" if flush_result.success else ("warning" if flush_result.spilled else "danger")
+    yield 'alert', dbc.Alert(flush_result.message, color=alert_color, dismissable=True, duration=6000,
+                             className="fade-in")
+    status = "upserted" if flush_result.success else ("queued" if flush_result.spilled else "db_error")
+    for record_type, data, duplicate in outcomes:
+        record_scrape("skipped" if duplicate else status)
+        card = create_summary_card(record_type, data, flush_result.success, flush_result.spilled,
+                                   thumbnail=thumbnail_src(thumbnails.get(data.image_url)), duplicate=duplicate)
+        position = card_positions.pop(id(data), None)
+        if position is None:
+            yield 'card', card
+        else:
+            yield 'card_update', (position, card)
+
+
 def run_scraping_job(usernames: list):
-    """Manages scraping and yields logs, alerts, and card data."""
+    """Manages scraping, batches DB writes, and yields logs, alerts, and card data."""
     yield 'log', html.P("🚀 Starting new scrape cycle...", className="log-entry")
 
+    # Batches that fail to write are kept in the write-behind queue and retried in the background.
+    # Reposted events are dropped as each batch flushes, like on every other scrape path
+    batcher = UpsertBatcher(db_connection_params, spill_queue=get_write_queue(), deduplicator=get_deduplicator())
+    # Position of each record's pending card among the cards yielded so far
+    card_positions = {}
+    cards = 0
+
     for username in (u.strip() for u in usernames if u.strip()):
         yield 'log', html.P(f"🔎 Scraping data for: {username}...", className="log-entry")
 
         try:
-            response = requests.get(f"https://ensembledata.com/apis/instagram/user/detailed-info",
-                                    params={"username": username, "token": TOKEN}, timeout=20)
-            response.raise_for_status()
-            record_type, filtered_data = InstaScrapper([response.json()])
+            scraped_json = fetch_detailed_info(username, token=TOKEN, timeout=20)
+            with stage_timer('classify'):
+                record_type, filtered_data = InstaScrapper([scraped_json])
 
             if record_type != "error":
                 yield 'log', html.P(f"✅ Profile '{username}' identified as an {record_type.upper()}.",
                                     className="log-entry")
-                success, message = upsert_to_db(record_type, filtered_data)
-
-                alert_color = "success" if success else "danger"
-                yield 'alert', dbc.Alert(message, color=alert_color, dismissable=True, duration=6000,
-                                         className="fade-in")
-
-                yield 'card', create_summary_card(record_type, filtered_data, success)
+                # The card shows up right away and is updated once the record's batch is committed
+                card = create_summary_card(record_type, filtered_data, False, pending=True)
+                if card is not None:
+                    card_positions[id(filtered_data)] = cards
+                    cards += 1
+                    yield 'card', card
+                generic_images = profile_generic_images(scraped_json['data'])
+                yield from _batch_outputs(batcher.add(record_type, filtered_data, generic_images=generic_images),
+                                          card_positions)
             else:
+                log.error("❌ Error processing profile", username=username, error=filtered_data.get('error'))
+                record_scrape("error")
                 yield 'log', html.P(f"❌ Error processing {username}: {filtered_data.get('error')}",
                                     className="log-entry error")
 
         except requests.exceptions.RequestException as e:
+            log.error("❌ API request failed", username=username, error=str(e))
+            record_scrape("api_error")
             yield 'log', html.P(f"❌ API Request Failed for {username}: {e}", className="log-entry error")
         except Exception as e:
+            log.exception("❌ Unexpected error", username=username, error=str(e))
+            record_scrape("error")
             yield 'log', html.P(f"❌ An unexpected error occurred for {username}: {e}", className="log-entry error")
 
-        time.sleep(0.5)
-
+    yield from _batch_outputs(batcher.flush(), card_positions)
     yield 'log', html.P("✅ Scraping cycle complete.", className="log-entry")
 
 
@@ -272,9 +288,15 @@ def run_scraping_job(usernames: list):
 # ==============================================================================
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.VAPOR, dbc.icons.FONT_AWESOME])
 app.title = "BB Instagram Scrapper"
+register_thumbnail_route(app.server)
+register_metrics_route(app.server)
+ensure_flusher(db_connection_params)
+ensure_venue_index(db_connection_params)
 
 app.layout = dbc.Container([
     dcc.Store(id='session-store'),
+    dcc.Store(id='job-cursor'),
+    dcc.Interval(id='job-poller', interval=1000, disabled=True),
     html.Div([
         html.H1("🚀 BB Instagram Scrapper", className="display-3 title-glow"),
         html.P("Enter Instagram profiles to scrape and save them as events or venues.", className="lead")
@@ -299,14 +321,16 @@ app.layout = dbc.Container([
 
     # Detailed Log Section
     html.H3("Detailed Logs", className="text-center mt-4 mb-3"),
-    dcc.Loading(id="loading-spinner", type="default", children=[
-        html.Div(id="log-output", className="log-container")
-    ])
+    html.Div(id="job-status", className="text-center mb-2"),
+    html.Div(id="log-output", className="log-container")
 ], fluid=True, className="p-5")
 
 
 @app.callback(
-    [Output('summary-cards-container', 'children'),
+    [Output('session-store', 'data'),
+     Output('job-cursor', 'data'),
+     Output('job-poller', 'disabled'),
+     Output('summary-cards-container', 'children'),
      Output('log-output', 'children'),
      Output('alert-container', 'children')],
     [Input('scrape-button', 'n_clicks')],
@@ -314,20 +338,53 @@ app.layout = dbc.Container([
     prevent_initial_call=True
 )
 def update_output(n_clicks, profiles_value):
-    """Triggers scraping and updates the UI with cards, logs, and alerts."""
+    """Starts a background scrape job and clears the UI; poll_job streams the results in."""
     if not profiles_value:
-        return [], [html.P("Please enter at least one profile username.", className="text-warning")], []
-
-    cards, logs, alerts = [], [], []
-    for item_type, content in run_scraping_job(profiles_value.split('\n')):
-        if item_type == 'log':
-            logs.append(content)
-        elif item_type == 'alert':
-            alerts.append(content)
-        elif item_type == 'card' and content:
-            cards.append(content)
-
-    return cards, logs, alerts
+        warning = html.P("Please enter at least one profile username.", className="text-warning")
+        return None, None, True, [], [warning], []
+
+    job = start_job(run_scraping_job, profiles_value.split('\n'))
+    return {'job_id': job.id}, {}, False, [], [], []
+
+
+@app.callback(
+    [Output('summary-cards-container', 'children', allow_duplicate=True),
+     Output('log-output', 'children', allow_duplicate=True),
+     Output('alert-container', 'children', allow_duplicate=True),
+     Output('job-cursor', 'data', allow_duplicate=True),
+     Output('job-poller', 'disabled', allow_duplicate=True),
+     Output('job-status', 'children')],
+    [Input('job-poller', 'n_intervals')],
+    [State('session-store', 'data'), State('job-cursor', 'data')],
+    prevent_initial_call=True
+)
+def poll_job(n_intervals, session_data, cursor):
+    """Appends whatever the background job produced since the last poll."""
+    job = get_job((session_data or {}).get('job_id'))
+    if job is None:
+        return no_update, no_update, no_update, no_update, True, ""
+
+    # Read the status first so a finished job's final items are always included
+    done = job.done
+    new_items, cursor = job.since(cursor)
+    if job.status == 'failed':
+        new_items['log'].append(html.P(f"❌ Scrape job failed: {job.error}", className="log-entry error"))
+
+    outputs = []
+    for item_type in ('card', 'log', 'alert'):
+        updates = new_items['card_update'] if item_type == 'card' else []
+        if new_items[item_type] or updates:
+            patch = Patch()
+            patch.extend(new_items[item_type])
+            # Pending cards are replaced in place once their batch is written
+            for position, card in updates:
+                patch[position] = card
+            outputs.append(patch)
+        else:
+            outputs.append(no_update)
+
+    status = "" if done else [dbc.Spinner(size="sm", color="info"), " Scraping in progress..."]
+    return (*outputs, cursor, done, status)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,179 @@
+import asyncio
+import os
+import time
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from dotenv import load_dotenv
+
+from profileParser import compact_payload, compact_posts_page
+from rateLimiter import ENSEMBLE_LIMITER, CircuitOpenError, BudgetExhaustedError, backoff_delay
+from responseCache import ResponseCache, get_response_cache
+from scrapeLogging import get_logger
+from scrapeMetrics import API_ERRORS, CACHE_HITS, record_api_response, stage_timer
+
+log = get_logger(__name__)
+
+load_dotenv()
+TOKEN = os.getenv('EnsembleApi')
+
+# --- CONFIGURATION ---
+API_ROOT = os.getenv('ENSEMBLE_API_ROOT', "https://ensembledata.com/apis")
+DETAILED_INFO_ENDPOINT = "/instagram/user/detailed-info"
+
+# API units charged per detailed-info call
+DETAILED_INFO_UNITS = 1
+
+# Paginated post history: posts per page and API units charged per page
+POSTS_ENDPOINT = "/instagram/user/posts"
+POSTS_PAGE_SIZE = int(os.getenv('ENSEMBLE_POSTS_PAGE_SIZE', '12'))
+POSTS_PAGE_UNITS = 1
+
+# Statuses worth retrying after a backoff
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 4
+
+
+def get_with_backoff(url: str, params: dict, timeout: float = 20, units: int = 1,
+                     limiter=ENSEMBLE_LIMITER) -> requests.Response:
+    """
+    Sends a GET through the shared rate limiter, retrying 429 and 5xx responses
+    with Retry-After aware, jittered exponential backoff.
+    Raises requests exceptions like a plain requests.get + raise_for_status.
+    """
+    host = urlsplit(url).netloc
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            limiter.acquire(host, units)
+        except (CircuitOpenError, BudgetExhaustedError) as e:
+            API_ERRORS.labels(type(e).__name__).inc()
+            raise requests.exceptions.ConnectionError(str(e)) from e
+
+        try:
+            with stage_timer('api'):
+                response = requests.get(url, params=params, timeout=timeout)
+        except requests.exceptions.RequestException as e:
+            API_ERRORS.labels(type(e).__name__).inc()
+            limiter.record_error(host)
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(backoff_delay(attempt))
+            continue
+
+        limiter.record_response(host, response.status_code)
+        record_api_response(response.status_code)
+        if response.status_code in RETRY_STATUSES and attempt < MAX_RETRIES:
+            delay = backoff_delay(attempt, response.headers.get('Retry-After'))
+            log.warning("⏳ Retrying after a retryable status", host=host, status=response.status_code,
+                        delay=round(delay, 1), attempt=attempt)
+            time.sleep(delay)
+            continue
+
+        response.raise_for_status()
+        return response
+
+
+async def get_with_backoff_async(client: httpx.AsyncClient, url: str, params: dict, units: int = 1,
+                                 limiter=ENSEMBLE_LIMITER) -> httpx.Response:
+    """Asyncio counterpart of get_with_backoff; raises httpx exceptions."""
+    host = urlsplit(url).netloc
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            await limiter.acquire_async(host, units)
+        except (CircuitOpenError, BudgetExhaustedError) as e:
+            API_ERRORS.labels(type(e).__name__).inc()
+            raise httpx.ConnectError(str(e)) from e
+
+        try:
+            with stage_timer('api'):
+                response = await client.get(url, params=params)
+        except httpx.TransportError as e:
+            API_ERRORS.labels(type(e).__name__).inc()
+            limiter.record_error(host)
+            if attempt == MAX_RETRIES:
+                raise
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+
+        limiter.record_response(host, response.status_code)
+        record_api_response(response.status_code)
+        if response.status_code in RETRY_STATUSES and attempt < MAX_RETRIES:
+            delay = backoff_delay(attempt, response.headers.get('Retry-After'))
+            log.warning("⏳ Retrying after a retryable status", host=host, status=response.status_code,
+                        delay=round(delay, 1), attempt=attempt)
+            await asyncio.sleep(delay)
+            continue
+
+        response.raise_for_status()
+        return response
+
+
+def fetch_detailed_info(username: str, token: str = None, timeout: float = 20, max_age: float = None,
+                        cache: ResponseCache = None) -> dict:
+    """
+    Fetches the detailed-info payload for one Instagram username.
+    A cached response younger than `max_age` (default: the cache TTL) is returned
+    without calling the API; in offline mode a cache miss raises ConnectionError.
+    """
+    cache = cache or get_response_cache()
+    cached = cache.get(username, max_age)
+    if cached is not None:
+        log.info("🗄️ Serving cached detailed-info", sample='cache', username=username)
+        CACHE_HITS.inc()
+        return cached
+    if cache.offline:
+        raise requests.exceptions.ConnectionError(f"Offline mode: no cached response for {username}.")
+
+    params = {"username": username, "token": token or TOKEN}
+    response = get_with_backoff(API_ROOT + DETAILED_INFO_ENDPOINT, params, timeout=timeout,
+                                units=DETAILED_INFO_UNITS)
+    # Only the fields the scrapers read are kept; the full response goes to the cache
+    with stage_timer('parse'):
+        scraped_json = compact_payload(response.content)
+    cache.put(username, response.content)
+    return scraped_json
+
+
+async def fetch_detailed_info_async(client: httpx.AsyncClient, username: str, token: str = None,
+                                    max_age: float = None, cache: ResponseCache = None) -> dict:
+    """Asyncio counterpart of fetch_detailed_info using a shared client."""
+    cache = cache or get_response_cache()
+    cached = await asyncio.to_thread(cache.get, username, max_age)
+    if cached is not None:
+        log.info("🗄️ Serving cached detailed-info", sample='cache', username=username)
+        CACHE_HITS.inc()
+        return cached
+    if cache.offline:
+        raise httpx.ConnectError(f"Offline mode: no cached response for {username}.")
+
+    params = {"username": username, "token": token or TOKEN}
+    response = await get_with_backoff_async(client, API_ROOT + DETAILED_INFO_ENDPOINT, params,
+                                            units=DETAILED_INFO_UNITS)
+    # Only the fields the scrapers read are kept; the full response goes to the cache
+    with stage_timer('parse'):
+        scraped_json = compact_payload(response.content)
+    await asyncio.to_thread(cache.put, username, response.content)
+    return scraped_json
+
+
+async def fetch_posts_page_async(client: httpx.AsyncClient, user_id: str, cursor: str = None,
+                                 token: str = None) -> tuple:
+    """
+    Fetches one page of a profile's post history, newest first.
+
+    Args:
+        client (httpx.AsyncClient): The shared client.
+        user_id (str): The numeric Instagram user ID (the detailed-info profile "id").
+        cursor (str): The cursor returned with the previous page, or None for the first page.
+        token (str): API token (defaults to the EnsembleApi environment variable).
+
+    Returns:
+        tuple: (compact post nodes, cursor of the next page or None when the history is exhausted)
+    """
+    params = {"user_id": user_id, "depth": 1, "chunk_size": POSTS_PAGE_SIZE, "token": token or TOKEN}
+    if cursor:
+        params["start_cursor"] = cursor
+    response = await get_with_backoff_async(client, API_ROOT + POSTS_ENDPOINT, params, units=POSTS_PAGE_UNITS)
+    with stage_timer('parse'):
+        return compact_posts_page(response.content)
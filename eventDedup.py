@@ -0,0 +1,255 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+
+from imageCache import perceptual_hash, prefetch_thumbnails
+from scrapeLogging import get_logger
+from scrapeRecords import EventRecord
+from venueIndex import normalize_name
+
+log = get_logger(__name__)
+
+# --- CONFIGURATION ---
+# Local SQLite file holding the signatures and LSH buckets of every event written so far
+DEDUP_DB_PATH = os.getenv('EVENT_DEDUP_DB', 'event_dedup.sqlite3')
+# Compare poster images too (downloads each new poster once, into the thumbnail cache)
+DEDUP_IMAGE_HASHES = os.getenv('DEDUP_IMAGE_HASHES', '1') == '1'
+# Captions whose estimated Jaccard similarity reaches this are the same event
+CAPTION_SIMILARITY_THRESHOLD = 0.8
+# Posters whose perceptual hashes differ in at most this many of 64 bits are the same image
+IMAGE_DISTANCE_THRESHOLD = 6
+# Captions are compared as sets of character shingles of this length
+SHINGLE_SIZE = 5
+# MinHash signature length and its split into LSH bands: 16 bands of 4 values make captions
+# at the similarity threshold collide in some band with probability ~0.9998
+MINHASH_BINS = 64
+LSH_BANDS = 16
+# A 64-bit image hash split into 8 bands of 8 bits: hashes within 7 bits of each other share a band
+IMAGE_BANDS = 8
+
+# Each shingle's 32-bit hash picks its bin with the low bits and competes with the rest
+_BIN_BITS = MINHASH_BINS.bit_length() - 1
+_ROWS_PER_BAND = MINHASH_BINS // LSH_BANDS
+_IMAGE_BAND_BITS = 64 // IMAGE_BANDS
+
+
+def minhash_signature(text: str) -> array:
+    """
+    One-permutation MinHash of a caption: each distinct character shingle of the normalized
+    text is hashed once and kept as the minimum of the bin its hash falls into, and empty bins
+    borrow from the next filled one. Costs one hash per shingle instead of one per shingle and bin.
+
+    Returns:
+        array: MINHASH_BINS unsigned values, or None for text too short to compare.
+    """
+    normalized = normalize_name(text)
+    if len(normalized) < SHINGLE_SIZE * 2:
+        return None
+    encoded = normalized.encode('utf-8')
+    bins = [None] * MINHASH_BINS
+    shingles = {encoded[start:start + SHINGLE_SIZE] for start in range(len(encoded) - SHINGLE_SIZE + 1)}
+    for value in map(zlib.crc32, shingles):
+        index, value = value & (MINHASH_BINS - 1), value >> _BIN_BITS
+        current = bins[index]
+        if current is None or value < current:
+            bins[index] = value
+    signature = array('Q', bytes(8 * MINHASH_BINS))
+    for index in range(MINHASH_BINS):
+        distance = 0
+        while bins[(index + distance) % MINHASH_BINS] is None:
+            distance += 1
+        # The borrowing distance goes into the high bits so borrowed and own values never collide
+        signature[index] = bins[(index + distance) % MINHASH_BINS] | (distance << 32)
+    return signature
+
+
+def caption_similarity(first: array, second: array) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return sum(a == b for a, b in zip(first, second)) / MINHASH_BINS
+
+
+def _bucket(kind: str, day: str, band: int, values) -> int:
+    """Signed 64-bit bucket ID of one LSH band; the event day is part of it, so only same-day events collide."""
+    payload = f"{kind}|{day}|{band}|{values}".encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(payload, digest_size=8).digest(), 'big', signed=True)
+
+
+def _signed(value: int) -> int:
+    return value - (1 << 64) if value is not None and value >= 1 << 63 else value
+
+
+class EventDeduplicator:
+    """
+    Detects events that were already written under another post: the same caption reposted,
+    or the same flyer posted by several promoters for the same day. Every written event
+    leaves its caption MinHash and poster dHash in LSH buckets persisted in SQLite, so a
+    new event is only compared with the few events sharing a bucket, never the whole table.
+    Re-scrapes of an event's own post are updates, not duplicates. Safe to share between threads.
+    """
+
+    def __init__(self, path=DEDUP_DB_PATH, image_hashes: bool = DEDUP_IMAGE_HASHES):
+        """
+        Opens (and creates if needed) the SQLite index file.
+
+        Args:
+            path (str): Path to the SQLite database file.
+            image_hashes (bool): Compare poster images as well as captions.
+        """
+        self.path = path
+        self.image_hashes = image_hashes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS dedup_events (
+                source_key TEXT PRIMARY KEY,
+                canonical_key TEXT NOT NULL,
+                event_day TEXT,
+                signature BLOB,
+                image_hash INTEGER,
+                indexed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS dedup_buckets (
+                bucket INTEGER NOT NULL,
+                source_key TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS dedup_buckets_bucket ON dedup_buckets (bucket)")
+
+    def _hashes_poster(self, record: EventRecord, generic_images) -> bool:
+        return self.image_hashes and bool(record.posterUrl) and record.posterUrl not in generic_images
+
+    def _signatures(self, record: EventRecord, generic_images=()) -> tuple:
+        event_day = record.eventDate.date().isoformat() if record.eventDate else None
+        signature = minhash_signature(record.description or '')
+        image_hash = perceptual_hash(record.posterUrl) if self._hashes_poster(record, generic_images) else None
+        return event_day, signature, image_hash
+
+    @staticmethod
+    def _buckets(event_day: str, signature: array, image_hash: int) -> list:
+        buckets = []
+        if signature is not None:
+            buckets.extend(_bucket('caption', event_day, band,
+                                   tuple(signature[band * _ROWS_PER_BAND:(band + 1) * _ROWS_PER_BAND]))
+                           for band in range(LSH_BANDS))
+        if image_hash is not None:
+            buckets.extend(_bucket('image', event_day, band, (image_hash >> (band * _IMAGE_BAND_BITS)) & 0xFF)
+                           for band in range(IMAGE_BANDS))
+        return buckets
+
+    def _find_duplicate(self, source_key: str, signature: array, image_hash: int, buckets: list) -> str:
+        """Returns the canonical key of an indexed event this one duplicates, or None."""
+        placeholders = ','.join('?' * len(buckets))
+        rows = self._conn.execute(
+            f"SELECT e.source_key, e.canonical_key, e.signature, e.image_hash FROM dedup_events e "
+            f"WHERE e.source_key IN (SELECT source_key FROM dedup_buckets WHERE bucket IN ({placeholders})) "
+            f"AND e.source_key != ?",
+            (*buckets, source_key),
+        ).fetchall()
+        for _, canonical_key, other_signature, other_image_hash in rows:
+            if signature is not None and other_signature is not None:
+                if caption_similarity(signature, array('Q', other_signature)) >= CAPTION_SIMILARITY_THRESHOLD:
+                    return canonical_key
+            if image_hash is not None and other_image_hash is not None:
+                if bin((image_hash ^ other_image_hash) & 0xFFFFFFFFFFFFFFFF).count('1') <= IMAGE_DISTANCE_THRESHOLD:
+                    return canonical_key
+        return None
+
+    def filter(self, records: list, generic_images=()) -> list:
+        """
+        Drops the events that duplicate an already indexed event and indexes the rest.
+        A duplicate is remembered as an alias of the first event, so later scrapes of its
+        post are dropped without comparing again, and known events skip the signature work.
+        Records of other types pass through. Posters are downloaded in parallel (and cached)
+        before hashing, so this blocks on the network: call it off the event loop.
+
+        Args:
+            records (list): Formatted records, in the order they would be written.
+            generic_images (iterable): Poster URLs that are not specific to one event, e.g. the
+                                       profile picture a post without its own image falls back to;
+                                       they are never hashed, so they cannot make events duplicates.
+
+        Returns:
+            list: The records to write.
+        """
+        events = [record for record in records if isinstance(record, EventRecord)]
+        if not events:
+            return records
+        placeholders = ','.join('?' * len(events))
+        with self._lock:
+            known = dict(self._conn.execute(
+                f"SELECT source_key, canonical_key FROM dedup_events WHERE source_key IN ({placeholders})",
+                [event.sourceKey for event in events],
+            ).fetchall())
+        # Image hashes may download a poster: signatures are computed outside the lock, and only for new posts
+        new_events = [event for event in events if event.sourceKey not in known]
+        generic_images = set(generic_images)
+        prefetch_thumbnails(event.posterUrl for event in new_events if self._hashes_poster(event, generic_images))
+        signatures = {event.sourceKey: self._signatures(event, generic_images) for event in new_events}
+
+        dropped = set()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for source_key, (event_day, signature, image_hash) in signatures.items():
+                    if not self._index(source_key, event_day, signature, _signed(image_hash)):
+                        dropped.add(source_key)
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+        # Seen before: an update of a kept event is written, a repeat of a known duplicate is not
+        dropped.update(key for key, canonical_key in known.items() if canonical_key != key)
+        return [record for record in records if not isinstance(record, EventRecord) or record.sourceKey not in dropped]
+
+    def _index(self, source_key: str, event_day: str, signature: array, image_hash: int) -> bool:
+        """Indexes a new event, as an alias when it duplicates an indexed one. Returns True if it is kept."""
+        buckets = self._buckets(event_day, signature, image_hash)
+        canonical_key = self._find_duplicate(source_key, signature, image_hash, buckets) if buckets else None
+        inserted = self._conn.execute(
+            "INSERT OR IGNORE INTO dedup_events (source_key, canonical_key, event_day, signature, image_hash, "
+            "indexed_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (source_key, canonical_key or source_key, event_day,
+             signature.tobytes() if signature is not None else None, image_hash, time.time()),
+        ).rowcount
+        if not inserted:
+            return True  # indexed by another thread meanwhile; writing it again is an update
+        if canonical_key is not None:
+            log.info("🪞 Skipping near-duplicate event", sample='skip', source_key=source_key,
+                     duplicate_of=canonical_key)
+            return False
+        # Only kept events are bucketed, so the buckets grow with distinct events, not reposts
+        self._conn.executemany("INSERT INTO dedup_buckets (bucket, source_key) VALUES (?, ?)",
+                               [(bucket, source_key) for bucket in buckets])
+        return True
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_deduplicator = None
+_default_deduplicator_lock = threading.Lock()
+
+
+def get_deduplicator() -> EventDeduplicator:
+    """Returns the process-wide deduplicator backed by DEDUP_DB_PATH, opening it on first use."""
+    global _default_deduplicator
+    with _default_deduplicator_lock:
+        if _default_deduplicator is None:
+            _default_deduplicator = EventDeduplicator()
+        return _default_deduplicator
+
+
+def profile_generic_images(profile_data: dict) -> tuple:
+    """
+    Returns the image URLs of a profile that say nothing about any one of its events, to pass as
+    `generic_images`: a post without its own image falls back to the profile picture.
+    """
+    return (profile_data.get('profile_pic_url'),)
@@ -0,0 +1,80 @@
+from datetime import datetime
+
+from captionDates import VENUE_TIMEZONE, parse_event_times
+from keywordMatcher import EVENT_CONFIDENCE_THRESHOLD, EVENT_MATCHER
+
+# --- CONFIGURATION ---
+# Longest event name taken from the first line of a caption
+EVENT_NAME_MAX_LENGTH = 120
+
+
+def post_caption(node: dict) -> str:
+    """Returns the caption text of a post node, or '' if it has none."""
+    edges = (node.get('edge_media_to_caption') or {}).get('edges') or []
+    return edges[0].get('node', {}).get('text') or '' if edges else ''
+
+
+def caption_headline(caption: str, max_length: int = EVENT_NAME_MAX_LENGTH) -> str:
+    """
+    Returns the first non-empty line of a caption, cut at a word boundary to `max_length`,
+    for use as an event name. Returns '' for an empty caption.
+    """
+    for line in caption.splitlines():
+        line = line.strip()
+        if line:
+            if len(line) <= max_length:
+                return line
+            return line[:max_length].rsplit(' ', 1)[0].rstrip(' ,.-–—:;') + '…'
+    return ''
+
+
+def post_datetime(node: dict) -> datetime:
+    """Returns when a post was published (in the venues' timezone), or None if unknown."""
+    timestamp = node.get('taken_at_timestamp')
+    return datetime.fromtimestamp(timestamp, VENUE_TIMEZONE) if timestamp else None
+
+
+def event_times(node: dict, caption: str) -> tuple:
+    """
+    Dates an event post: the date and times its caption announces ("Sat 14th Dec 8PM till late"),
+    falling back to when the post was published (or now, for an undated post).
+
+    Args:
+        node (dict): The post node.
+        caption (str): The post caption.
+
+    Returns:
+        tuple: (eventDate, startTime, endTime) as aware datetimes, never None.
+    """
+    times = parse_event_times(caption, node.get('taken_at_timestamp'))
+    event_date = times.event_date or post_datetime(node) or datetime.now(VENUE_TIMEZONE)
+    start_time = times.start_time or event_date
+    return event_date, start_time, times.end_time or start_time
+
+
+def select_event_posts(nodes: list, high_water: float = None) -> tuple:
+    """
+    Picks the posts that describe an event: flagged with an upcoming event, or whose
+    caption alone reaches the event confidence threshold. With a high-water mark, only
+    posts published after it are considered, so steady-state cycles only score new posts.
+    Captions are scored in one keyword pass.
+
+    Args:
+        nodes (list): Post nodes in the detailed-info layout, in any order.
+        high_water (float): taken_at_timestamp of the newest post already processed, or None.
+
+    Returns:
+        tuple: (qualifying post nodes, newest taken_at_timestamp among the considered posts or `high_water`)
+    """
+    if high_water is not None:
+        # Posts without a timestamp cannot be placed after the mark and are left alone
+        nodes = [node for node in nodes if (node.get('taken_at_timestamp') or 0) > high_water]
+    newest = max((node.get('taken_at_timestamp') or 0 for node in nodes), default=0) or None
+    if high_water is not None and (newest is None or newest < high_water):
+        newest = high_water
+    if not nodes:
+        return [], newest
+
+    results = EVENT_MATCHER.match_many([post_caption(node) for node in nodes])
+    return [node for node, result in zip(nodes, results)
+            if node.get('has_upcoming_event') or result.confidence >= EVENT_CONFIDENCE_THRESHOLD], newest
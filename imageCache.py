@@ -0,0 +1,255 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from flask import Response, abort
+from PIL import Image, UnidentifiedImageError
+
+from scrapeLogging import get_logger
+from scrapeMetrics import stage_timer
+
+log = get_logger(__name__)
+
+# --- CONFIGURATION ---
+THUMBNAIL_DIR = os.getenv('THUMBNAIL_CACHE_DIR', '.thumbnail_cache')
+# Least recently used thumbnails are deleted once the directory grows past this size (in bytes)
+THUMBNAIL_DISK_MAX_BYTES = int(os.getenv('THUMBNAIL_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+# Thumbnails not used for this long are deleted (in seconds)
+THUMBNAIL_MAX_AGE = float(os.getenv('THUMBNAIL_CACHE_MAX_AGE', str(7 * 24 * 3600)))
+# The directory is rescanned for old thumbnails at most this often (in seconds)
+PRUNE_INTERVAL = 3600
+# Longest edge of a cached thumbnail (in pixels)
+THUMBNAIL_SIZE = (480, 480)
+THUMBNAIL_QUALITY = 80
+# Number of thumbnails kept in memory
+MEMORY_CACHE_ITEMS = 256
+# Parallel image downloads
+MAX_WORKERS = 8
+IMAGE_TIMEOUT = 10
+# Failed URLs are not retried for this long (in seconds)
+FAILURE_TTL = 300
+# URL prefix the Flask server serves thumbnails under
+THUMBNAIL_ROUTE = '/thumbnails'
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='thumbnail')
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+_failures = {}
+_failures_lock = threading.Lock()
+_disk_lock = threading.Lock()
+_prune_lock = threading.Lock()
+# Running total of THUMBNAIL_DIR's size, known once the first prune has scanned it
+_disk_bytes = None
+_last_prune = float('-inf')
+
+
+def thumbnail_key(image_url: str) -> str:
+    """Returns the cache key (a SHA-256 hex digest) for an image URL."""
+    return hashlib.sha256(image_url.encode('utf-8')).hexdigest()
+
+
+def _disk_path(key: str) -> str:
+    return os.path.join(THUMBNAIL_DIR, key[:2], key + '.jpg')
+
+
+def _remember(key: str, data: bytes):
+    with _memory_lock:
+        _memory[key] = data
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_CACHE_ITEMS:
+            _memory.popitem(last=False)
+
+
+def load_thumbnail(key: str) -> bytes:
+    """Returns thumbnail bytes from memory or disk, or None if the key is not cached."""
+    with _memory_lock:
+        data = _memory.get(key)
+        if data is not None:
+            _memory.move_to_end(key)
+            return data
+    path = _disk_path(key)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        # The modification time doubles as the last use, which is what pruning goes by
+        os.utime(path)
+    except OSError:
+        return None
+    _remember(key, data)
+    return data
+
+
+def prune_disk_cache():
+    """
+    Deletes thumbnails not used for THUMBNAIL_MAX_AGE, then the least recently used ones
+    until THUMBNAIL_DIR is back under 90% of THUMBNAIL_DISK_MAX_BYTES, so a full cache is
+    not rescanned on every write. Skipped if another thread is already pruning.
+    """
+    global _disk_bytes, _last_prune
+    if not _prune_lock.acquire(blocking=False):
+        return
+    try:
+        expires_before = time.time() - THUMBNAIL_MAX_AGE
+        files = []
+        for root, _, names in os.walk(THUMBNAIL_DIR):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                # A fresh .tmp file is a thumbnail still being written; a stale one was left by a crash
+                if name.endswith('.tmp') and stat.st_mtime >= expires_before:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for mtime, size, path in files:
+            if mtime >= expires_before and total <= THUMBNAIL_DISK_MAX_BYTES * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            log.info("🧹 Pruned thumbnail cache", removed=removed, bytes=total)
+        with _disk_lock:
+            _disk_bytes = total
+            _last_prune = time.monotonic()
+    finally:
+        _prune_lock.release()
+
+
+def _record_write(size: int):
+    """Counts a newly written thumbnail and prunes the directory when it is over size or due a rescan."""
+    global _disk_bytes
+    with _disk_lock:
+        if _disk_bytes is not None:
+            _disk_bytes += size
+        due = (_disk_bytes is None or _disk_bytes > THUMBNAIL_DISK_MAX_BYTES
+               or time.monotonic() - _last_prune >= PRUNE_INTERVAL)
+    if due:
+        prune_disk_cache()
+
+
+def _record_failure(key: str):
+    """Remembers a failed fetch, dropping failures whose FAILURE_TTL has run out."""
+    now = time.monotonic()
+    with _failures_lock:
+        for expired in [k for k, failed_at in _failures.items() if now - failed_at >= FAILURE_TTL]:
+            del _failures[expired]
+        _failures[key] = now
+
+
+def _make_thumbnail(content: bytes) -> bytes:
+    """Shrinks an image to THUMBNAIL_SIZE and re-encodes it as JPEG."""
+    with Image.open(io.BytesIO(content)) as image:
+        image.thumbnail(THUMBNAIL_SIZE)
+        buffer = io.BytesIO()
+        image.convert('RGB').save(buffer, format='JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+        return buffer.getvalue()
+
+
+def fetch_thumbnail(image_url: str) -> str:
+    """
+    Makes sure a resized thumbnail for `image_url` is cached.
+
+    Returns:
+        str: The cache key, or None if the image could not be fetched or decoded.
+    """
+    if not image_url:
+        return None
+    key = thumbnail_key(image_url)
+    if load_thumbnail(key) is not None:
+        return key
+    if time.monotonic() - _failures.get(key, float('-inf')) < FAILURE_TTL:
+        return None
+    try:
+        log.debug("🖼️ Fetching image", url=image_url)
+        with stage_timer('image'):
+            response = requests.get(image_url, timeout=IMAGE_TIMEOUT)
+            response.raise_for_status()
+            data = _make_thumbnail(response.content)
+    except requests.exceptions.RequestException as e:
+        log.warning("❌ Failed to fetch image", url=image_url, error=str(e))
+        _record_failure(key)
+        return None
+    except (UnidentifiedImageError, OSError) as e:
+        log.warning("❌ Could not decode image", url=image_url, error=str(e))
+        _record_failure(key)
+        return None
+
+    path = _disk_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    _remember(key, data)
+    _record_write(len(data))
+    return key
+
+
+def prefetch_thumbnails(image_urls) -> dict:
+    """
+    Fetches thumbnails for many URLs in parallel on the shared bounded pool.
+
+    Returns:
+        dict: Image URL to cache key (None for failures).
+    """
+    unique_urls = [url for url in dict.fromkeys(image_urls) if url]
+    return dict(zip(unique_urls, _executor.map(fetch_thumbnail, unique_urls)))
+
+
+def perceptual_hash(image_url: str) -> int:
+    """
+    Returns a 64-bit difference hash (dHash) of an image, computed from its cached thumbnail:
+    re-encoded, resized or lightly edited copies of the same picture differ in only a few bits.
+
+    Returns:
+        int: The hash, or None if the image could not be fetched or decoded.
+    """
+    key = fetch_thumbnail(image_url)
+    data = load_thumbnail(key) if key else None
+    if data is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            pixels = list(image.convert('L').resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    except (UnidentifiedImageError, OSError) as e:
+        log.warning("❌ Could not decode thumbnail", url=image_url, error=str(e))
+        return None
+    bits = 0
+    for row in range(8):
+        for column in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + column] > pixels[row * 9 + column + 1])
+    return bits
+
+
+def thumbnail_src(key: str) -> str:
+    """Returns the URL a cached thumbnail is served under, given the key from fetch_thumbnail/prefetch_thumbnails."""
+    return f"{THUMBNAIL_ROUTE}/{key}.jpg" if key else None
+
+
+def register_thumbnail_route(server):
+    """Adds the route that serves cached thumbnails to a Flask server."""
+
+    @server.route(f"{THUMBNAIL_ROUTE}/<key>.jpg")
+    def serve_thumbnail(key):
+        if len(key) != 64 or not all(c in '0123456789abcdef' for c in key):
+            abort(404)
+        data = load_thumbnail(key)
+        if data is None:
+            abort(404)
+        return Response(data, mimetype='image/jpeg', headers={'Cache-Control': 'public, max-age=86400'})
+
+    return serve_thumbnail
@@ -1,12 +1,25 @@
 import os
 import requests
-import pprint
 import json
 from datetime import datetime
+from functools import partial
 from dotenv import load_dotenv
 import psycopg2
 import time
-import random
+
+from changeState import MIN_REFETCH_SECONDS, ChangeStateStore, content_hash, get_state_store
+from ensembleClient import fetch_detailed_info
+from eventDedup import get_deduplicator, profile_generic_images
+from eventExtraction import caption_headline, event_times, post_caption, select_event_posts
+from keywordMatcher import EVENT_CONFIDENCE_THRESHOLD, EVENT_MATCHER
+from postGresConnection import Database, get_pool
+from scrapeLogging import get_logger
+from scrapeMetrics import record_scrape, stage_timer
+from scrapeRecords import EventRecord, ScrapeRecord, VenueRecord, event_source_key, stable_id, venue_source_key
+from venueIndex import ensure_venue_index, get_venue_index
+from writeQueue import WriteBehindQueue, ensure_flusher, get_write_queue
+
+log = get_logger(__name__)
 
 load_dotenv()
 TOKEN = os.getenv('EnsembleApi')
@@ -33,47 +46,44 @@ db_connection_params = {
     "port": "5432"
 }
 
-EVENT_KEYWORDS = [
-    'event', 'concert', 'show', 'performance', 'party', 'celebration',
-    'festival', 'workshop', 'seminar', 'conference', 'meetup', 'launch',
-    'opening', 'closing', 'anniversary', 'birthday', 'wedding', 'gala'
-]
 
-
-def _format_as_event(profile_data: dict, event_post: dict, creator_id: str) -> dict:
+def _format_as_event(profile_data: dict, event_post: dict, creator_id: str) -> EventRecord:
     if event_post is None: event_post = {}
-    caption_edges = event_post.get('edge_media_to_caption', {}).get('edges', [])
-    caption = caption_edges[0]['node']['text'] if caption_edges else profile_data.get('biography', '')
-    location_obj = event_post.get('location')
-    venue_id = location_obj.get('id') if location_obj else None
-
-    # Use the Instagram profile ID as the primary key for the record
-    return {
-        'id': random.randint(100, 99999),
-        'performerId': None,
-        'eventName': profile_data.get('full_name', ''),
-        'description': caption,
-        'minAmount': None,
-        'eventDate': datetime.now(),
-        'posterUrl': event_post.get('display_url', profile_data.get('profile_pic_url', '')),
-        'createdBy': 289,
-        'deletedAt': None,
-        'createdAt': datetime.now(),
-        'updatedAt': datetime.now(),
-        'isPaid': False,
-        'ticketingURL': profile_data.get('external_url', ''),
-        'eventQRCode': None,
-        'eventStatus': 'UNPUBLISHED',
-        'previousEventDate': None,
-        'previousStartTime': None,
-        'previousEndTime': None,
-        'startTime': datetime.now(),
-        'endTime': datetime.now(),
-        'venueId': 4,
-    }
-
-
-def _format_as_venue(profile_data: dict, creator_id: str) -> dict:
+    post_text = post_caption(event_post)
+    caption = post_text or profile_data.get('biography', '')
+
+    # Keyed on the Instagram profile and post IDs, so re-scrapes update the same row
+    source_key = event_source_key(profile_data, event_post)
+    # Dated by what the caption announces, else by the post itself, so re-formatting a post is stable
+    event_date, start_time, end_time = event_times(event_post, post_text)
+    return EventRecord(
+        id=stable_id(source_key),
+        sourceKey=source_key,
+        performerId=None,
+        eventName=caption_headline(post_text) or profile_data.get('full_name', ''),
+        description=caption,
+        minAmount=None,
+        eventDate=event_date,
+        posterUrl=event_post.get('display_url', profile_data.get('profile_pic_url', '')),
+        createdBy=289,
+        deletedAt=None,
+        createdAt=datetime.now(),
+        updatedAt=datetime.now(),
+        isPaid=False,
+        ticketingURL=profile_data.get('external_url', ''),
+        eventQRCode=None,
+        eventStatus='UNPUBLISHED',
+        previousEventDate=None,
+        previousStartTime=None,
+        previousEndTime=None,
+        startTime=start_time,
+        endTime=end_time,
+        # Linked through the post's tagged location or the posting venue's own profile
+        venueId=get_venue_index(db_connection_params).resolve(event_post, profile_data, default=4),
+    )
+
+
+def _format_as_venue(profile_data: dict, creator_id: str) -> VenueRecord:
     address = ''
     address_str = profile_data.get('business_address_json')
     if isinstance(address_str, str) and address_str:
@@ -83,67 +93,92 @@ def _format_as_venue(profile_data: dict, creator_id: str) -> dict:
         except json.JSONDecodeError:
             address = ''
 
-    # Use the Instagram profile ID as the primary key for the record
-    return {
-        'id': random.randint(100, 9999),
-        'userId': 289,
-        'venueName': profile_data.get('full_name', ''),
-        'email': profile_data.get('business_email'),
-        'phoneNumber': profile_data.get('business_phone_number'),
-        'address': address,
-        'openHours': None,
-        'closingHours': None,
-        'latitude': None,
-        'longitude': None,
-        'capacity': None,
-        'description': profile_data.get('biography', ''),
-        'website': profile_data.get('external_url', ''),
-        'profileImageUrl': profile_data.get('profile_pic_url', ''),
-        'coverImageUrl': None,
-        'allowsDirectBookings': False,
-        'createdAt': datetime.now(),
-        'updatedAt': datetime.now(),
-        'deletedAt': None
-    }
-
-
-def upsert_to_db(record_type: str, data: dict):
+    # Keyed on the Instagram profile ID, so re-scrapes update the same row
+    source_key = venue_source_key(profile_data)
+    return VenueRecord(
+        id=stable_id(source_key),
+        sourceKey=source_key,
+        userId=289,
+        venueName=profile_data.get('full_name', ''),
+        email=profile_data.get('business_email'),
+        phoneNumber=profile_data.get('business_phone_number'),
+        address=address,
+        openHours=None,
+        closingHours=None,
+        latitude=None,
+        longitude=None,
+        capacity=None,
+        description=profile_data.get('biography', ''),
+        website=profile_data.get('external_url', ''),
+        profileImageUrl=profile_data.get('profile_pic_url', ''),
+        coverImageUrl=None,
+        allowsDirectBookings=False,
+        createdAt=datetime.now(),
+        updatedAt=datetime.now(),
+        deletedAt=None
+    )
+
+
+def upsert_to_db(record_type: str, data: ScrapeRecord):
     """
-    Inserts a new record or updates an existing one based on the ID.
-    This is known as an "UPSERT" operation.
+    Inserts a new record or updates an existing one based on its natural key.
+    This is known as an "UPSERT" operation. Returns True on success.
     """
     table_name = "events" if record_type == "event" else "venues"
 
-    # Build the parts of the SQL query
-    columns = data.keys()
-    columns_sql = ', '.join(f'"{col}"' for col in columns)
-    placeholders = ', '.join(['%s'] * len(columns))
-
-    # Create the "ON CONFLICT... DO UPDATE" part
-    update_cols = [f'"{col}" = EXCLUDED."{col}"' for col in columns if col != 'id']
-    update_sql = ', '.join(update_cols)
-
-    # Combine into the final UPSERT statement
-    upsert_statement = f"""
-        INSERT INTO {table_name} ({columns_sql})
-        VALUES ({placeholders})
-        ON CONFLICT (id) DO UPDATE SET
-        {update_sql};
-    """
-    values = list(data.values())
-    conn = None
     try:
-        conn = psycopg2.connect(**db_connection_params)
-        cur = conn.cursor()
-        cur.execute(upsert_statement, values)
-        conn.commit()
-        print(f"💾 Data successfully upserted to the '{table_name}' table.")
+        # Borrow a persistent connection; the statement is cached and prepared per connection
+        with stage_timer('db_upsert'), Database(db_connection_params, pool=get_pool(db_connection_params)) as db:
+            written = db.upsert(table_name, data)
+            db.connection.commit()
+        if written:
+            log.info("💾 Data successfully upserted", sample='write', table=table_name, source_key=data.sourceKey)
+        else:
+            log.info("👍 Row is already up to date", sample='write', table=table_name, source_key=data.sourceKey)
+        return True
     except psycopg2.Error as e:
-        print(f"❌ Database error during upsert: {e}")
-    finally:
-        if conn:
-            cur.close()
-            conn.close()
+        log.error("❌ Database error during upsert", table=table_name, source_key=data.sourceKey, error=str(e))
+        return False
+
+
+def upcoming_event_post(recent_posts: list) -> dict:
+    """Returns the first recent post node flagged with has_upcoming_event, or None."""
+    for post in recent_posts:
+        node = post.get('node', {})
+        if node.get('has_upcoming_event'):
+            return node
+    return None
+
+
+def event_search_text(profile_data: dict, recent_posts: list) -> str:
+    """Combines the profile bio and the recent post captions into the text the keyword matcher scans."""
+    captions = [p['node']['edge_media_to_caption']['edges'][0]['node']['text'] for p in recent_posts if
+                p.get('node', {}).get('edge_media_to_caption', {}).get('edges')]
+    return profile_data.get('biography', '') + ' ' + ' '.join(captions)
+
+
+def classify_profile(profile_data: dict, keyword_result=None) -> tuple:
+    """
+    Decides whether a profile is an Event or Venue without logging anything.
+    Batch callers may pass a precomputed EVENT_MATCHER result for the profile's search text.
+    Returns a (record_type, best_event_post, confidence, latest_post_id) tuple.
+    """
+    posts = profile_data.get('edge_owner_to_timeline_media', {}).get('edges', [])
+    # Get the ID of the most recent post
+    latest_post_id = posts[0].get('node', {}).get('id') if posts else None
+
+    recent_posts = posts[:5]
+    event_post = upcoming_event_post(recent_posts)
+    if event_post is not None:
+        return "event", event_post, 1.0, latest_post_id
+    if not recent_posts:
+        return "venue", None, 0.0, latest_post_id
+
+    if keyword_result is None:
+        keyword_result = EVENT_MATCHER.match(event_search_text(profile_data, recent_posts))
+    if keyword_result.confidence >= EVENT_CONFIDENCE_THRESHOLD:
+        return "event", recent_posts[0].get('node', {}), keyword_result.confidence, latest_post_id
+    return "venue", None, keyword_result.confidence, latest_post_id
 
 
 def InstaScrapper(scraped_data: list, user_id: str) -> tuple:
@@ -151,88 +186,185 @@ def InstaScrapper(scraped_data: list, user_id: str) -> tuple:
     Determines if a profile is an Event or Venue and returns the
     type, formatted data, and the latest post ID for change detection.
     """
-    latest_post_id = None
     try:
         profile_data = scraped_data[0]['data']
-        posts = profile_data.get('edge_owner_to_timeline_media', {}).get('edges', [])
-        if posts:
-            # Get the ID of the most recent post
-            latest_post_id = posts[0].get('node', {}).get('id')
-    except (IndexError, KeyError, TypeError):
+        with stage_timer('classify'):
+            record_type, best_event_post, confidence, latest_post_id = classify_profile(profile_data)
+    except (IndexError, KeyError, TypeError, AttributeError):
         return "error", {"error": "Invalid data structure."}, None
 
-    recent_posts = posts[:5]
-    is_event = False
-    best_event_post = None
-    for post in recent_posts:
-        node = post.get('node', {})
-        if node.get('has_upcoming_event'):
-            is_event = True
-            best_event_post = node
-            break
-    if not is_event and recent_posts:
-        captions = [p['node']['edge_media_to_caption']['edges'][0]['node']['text'] for p in recent_posts if
-                    p.get('node', {}).get('edge_media_to_caption', {}).get('edges')]
-        text_to_search = (profile_data.get('biography', '') + ' ' + ' '.join(captions)).lower()
-        if any(keyword in text_to_search for keyword in EVENT_KEYWORDS):
-            is_event = True
-            best_event_post = recent_posts[0].get('node', {})
-
-    if is_event:
-        print("✅ Profile identified as an EVENT.")
+    log.info("✅ Profile identified", sample='classify', profile=profile_data.get('username'),
+             type=record_type, confidence=round(confidence, 2))
+    if record_type == "event":
         return "event", _format_as_event(profile_data, best_event_post, user_id), latest_post_id
     else:
-        print("🏠 Profile identified as a VENUE.")
         return "venue", _format_as_venue(profile_data, user_id), latest_post_id
 
 
-def process_user(username: str, last_post_ids: dict):
+def extract_post_events(profile_data: dict, user_id: str = '1234', high_water: float = None,
+                        nodes: list = None) -> tuple:
+    """
+    Formats one EventRecord per event post of a profile (see eventExtraction.select_event_posts).
+    With a high-water mark only posts published after it are considered. Near-duplicates of
+    events already written from other posts (reposts, shared flyers) are dropped here, before
+    any write path (see eventDedup).
+
+    Args:
+        profile_data (dict): The detailed-info profile.
+        user_id (str): The creating user.
+        high_water (float): taken_at_timestamp of the newest post already extracted, or None for all posts.
+        nodes (list): Post nodes to consider; defaults to the profile's timeline posts.
+
+    Returns:
+        tuple: (EventRecords to write, newest taken_at_timestamp considered, for the next high-water mark)
+    """
+    if nodes is None:
+        edges = profile_data.get('edge_owner_to_timeline_media', {}).get('edges', [])
+        nodes = [edge.get('node', {}) for edge in edges]
+    with stage_timer('classify'):
+        event_posts, newest = select_event_posts(nodes, high_water)
+    records = [_format_as_event(profile_data, node, user_id) for node in event_posts]
+    with stage_timer('dedup'):
+        records = get_deduplicator().filter(records, generic_images=profile_generic_images(profile_data))
+    return records, newest
+
+
+def handle_scraped_json(username: str, scraped_json: dict, state: ChangeStateStore = None, batcher=None,
+                        write_queue: WriteBehindQueue = None) -> tuple:
+    """
+    Turns a fetched profile payload into records and upserts them:
+    the venue record of a venue profile, unless its content is unchanged since the last
+    successful write, plus one event per event post published after the profile's
+    post high-water mark. The mark advances once those records are written (or durably queued).
+    With a batcher the records are queued for the next batch flush instead of written inline;
+    with a write-behind queue they are stored durably for a background flusher to write.
+    Returns a (status, record_type, records) tuple where status is one of
+    'upserted', 'queued', 'skipped', 'db_error' or 'error' and records lists what was written.
+    """
+    if state is None:
+        state = get_state_store()
+    logged_in_user_id = '1234'
+
+    try:
+        profile_data = scraped_json['data']
+        with stage_timer('classify'):
+            record_type, _, confidence, new_post_id = classify_profile(profile_data)
+    except (KeyError, TypeError, AttributeError):
+        return "error", "error", {"error": "Invalid data structure."}
+    log.info("✅ Profile identified", sample='classify', username=username, type=record_type,
+             confidence=round(confidence, 2))
+
+    # (record, on_success, write_info) for everything that needs writing
+    writes = []
+    if record_type == "venue":
+        venue = _format_as_venue(profile_data, logged_in_user_id)
+        # Index the venue before its events are formatted, so they link to it even before the row is read back
+        get_venue_index(db_connection_params).learn_venue(profile_data, venue.id)
+        new_hash = content_hash(record_type, venue)
+        if not state.is_unchanged(username, new_hash):
+            writes.append((venue, partial(state.record_write, username, new_post_id, new_hash),
+                           (username, new_post_id, new_hash)))
+
+    high_water = state.post_high_water(username)
+    events, newest = extract_post_events(profile_data, logged_in_user_id, high_water)
+    writes.extend((event, None, None) for event in events)
+
+    def advance_high_water():
+        if newest is not None and newest != high_water:
+            state.record_post_high_water(username, newest)
+
+    if not writes:
+        advance_high_water()
+        log.info("👍 No changes found; skipping", sample='skip', username=username)
+        return "skipped", record_type, []
+
+    records = [record for record, _, _ in writes]
+    for record in records:
+        # The record is only serialized, on the log writer thread, if this sampled debug line is kept
+        log.debug("Filtered results", sample='record', username=username, record=record)
+
+    if batcher is not None:
+        # Batches flush in order, so the profile's last record succeeding means its posts are written
+        *earlier, (last, last_success, last_info) = writes
+        for record, on_success, write_info in earlier:
+            batcher.add(record.RECORD_TYPE, record, on_success=on_success, write_info=write_info)
+        batcher.add(last.RECORD_TYPE, last, on_success=_chain(last_success, advance_high_water),
+                    write_info=last_info)
+        return "queued", record_type, records
+
+    if write_queue is not None:
+        for record, _, write_info in writes:
+            write_queue.enqueue(record.RECORD_TYPE, record, *(write_info or ()))
+        advance_high_water()
+        return "queued", record_type, records
+
+    failed = False
+    for record, on_success, _ in writes:
+        if not upsert_to_db(record.RECORD_TYPE, record):
+            failed = True
+        elif on_success:
+            on_success()
+    if failed:
+        return "db_error", record_type, records
+    advance_high_water()
+    return "upserted", record_type, records
+
+
+def _chain(*callbacks):
+    """Returns one callback that runs the given ones (skipping None) in order."""
+    callbacks = [callback for callback in callbacks if callback]
+
+    def run():
+        for callback in callbacks:
+            callback()
+    return run
+
+
+def process_user(username: str, state: ChangeStateStore = None,
+                 min_refetch_seconds: float = MIN_REFETCH_SECONDS, write_queue: WriteBehindQueue = None) -> tuple:
     """
     Contains the logic for fetching and processing a single user.
+    Profiles fetched within `min_refetch_seconds` are skipped before any API call is made.
+    Records go to the write-behind queue (the shared one, drained by a background flusher,
+    unless another is given), so a slow or unreachable database never stalls scraping.
+    The first call also starts the background refresh of the venue index events are linked with.
+    Returns a (status, scraped_json) tuple; scraped_json is None when nothing was fetched.
     """
-    root = "https://ensembledata.com/apis"
-    endpoint = "/instagram/user/detailed-info"
-    params = {"username": username, "token": TOKEN}
-    print("-" * 50)
-    print(f"🔎 Scraping data for user: {username}...")
+    if state is None:
+        state = get_state_store()
+    if write_queue is None:
+        write_queue = get_write_queue()
+        ensure_flusher(db_connection_params)
+    ensure_venue_index(db_connection_params)
+    if state.is_fresh(username, min_refetch_seconds):
+        log.info("⏭️ Fetched recently; skipping API call", sample='skip', username=username)
+        record_scrape("fresh")
+        return "fresh", None
+    log.info("🔎 Scraping data for user", username=username)
     try:
-        response = requests.get(root + endpoint, params=params)
-        response.raise_for_status()
-        scraped_json = response.json()
-
-        logged_in_user_id = '1234'
-
-        record_type, filtered_data, new_post_id = InstaScrapper([scraped_json], logged_in_user_id)
+        scraped_json = fetch_detailed_info(username, token=TOKEN)
+        state.mark_fetched(username)
 
-        # CHECK FOR NEW DATA
-        if new_post_id and new_post_id == last_post_ids.get(username):
-            print(f"👍 No new posts found for {username}. Skipping.")
-            return
-
-        print("\n--- Filtered Results ---")
-        pprint.pprint(filtered_data)
-
-        if record_type != "error":
-            upsert_to_db(record_type, filtered_data)
-            # Update the dictionary with the latest post ID
-            if new_post_id:
-                last_post_ids[username] = new_post_id
+        status, _, _ = handle_scraped_json(username, scraped_json, state, write_queue=write_queue)
+        record_scrape(status)
+        return status, scraped_json
 
     except requests.exceptions.RequestException as e:
-        print(f"❌ API Request Failed for {username}: {e}")
+        log.error("❌ API request failed", username=username, error=str(e))
     except json.JSONDecodeError:
-        print(f"❌ Failed to parse JSON for {username}.")
+        log.error("❌ Failed to parse JSON", username=username)
+    record_scrape("api_error")
+    return "api_error", None
 
 
 # def start_scraping_cycle():
 #     """
 #     Initializes and runs the continuous scraping loop.
 #     """
-#     last_post_ids = {}
 #     while True:
 #         print("\n===== Starting new scrape cycle... =====")
 #         for username in PLACES_TO_SCRAPE:
-#             process_user(username, last_post_ids)
+#             process_user(username)
 #             print(f"--- Waiting for {SCRAPE_INTERVAL} seconds... ---")
 #             time.sleep(SCRAPE_INTERVAL)
 #
@@ -243,5 +375,3 @@ def process_user(username: str, last_post_ids: dict):
 # start_scraping_cycle()
 
 
-
-
@@ -0,0 +1,138 @@
+import re
+from collections import namedtuple
+
+# --- KEYWORD LISTS ---
+# Each keyword carries a weight: roughly how likely a profile is to be an event when it appears.
+STRONG_EVENT_KEYWORDS = [
+    'event', 'concert', 'party', 'festival', 'gala', 'performance', 'celebration', 'launch',
+    'premiere', 'screening', 'tournament', 'competition', 'live band', 'live music', 'dj set',
+    'lineup', 'headlining', 'tickets', 'rsvp', 'early bird', 'gate charges', 'entry fee',
+    # Swahili
+    'tamasha', 'sherehe', 'onyesho', 'burudani', 'karamu', 'uzinduzi', 'mashindano', 'harusi',
+    'siku ya kuzaliwa', 'usiku wa',
+    # Sheng
+    'bash', 'jam session', 'turn up', 'link up', 'mbogi',
+]
+EVENT_KEYWORDS_DEFAULT = [
+    'show', 'workshop', 'seminar', 'conference', 'meetup', 'anniversary', 'birthday', 'wedding',
+    'happening', 'join us', 'come celebrate', "don't miss", 'today only', 'limited time',
+    'this friday', 'this saturday', 'this weekend', 'tonight',
+    # Swahili
+    'mkutano', 'leo usiku', 'wikendi hii', 'karibuni wote',
+]
+WEAK_EVENT_KEYWORDS = [
+    'opening', 'closing', 'sale', 'promotion', 'special', 'live', 'match', 'game',
+    # Sheng
+    'vibe', 'manzi', 'form ni gani',
+]
+
+STRONG_WEIGHT = 0.6
+DEFAULT_WEIGHT = 0.4
+WEAK_WEIGHT = 0.2
+
+EVENT_KEYWORD_WEIGHTS = {
+    **{keyword: WEAK_WEIGHT for keyword in WEAK_EVENT_KEYWORDS},
+    **{keyword: DEFAULT_WEIGHT for keyword in EVENT_KEYWORDS_DEFAULT},
+    **{keyword: STRONG_WEIGHT for keyword in STRONG_EVENT_KEYWORDS},
+}
+EVENT_KEYWORDS = list(EVENT_KEYWORD_WEIGHTS)
+
+# A profile is treated as an event at or above this confidence (one default-weight keyword)
+EVENT_CONFIDENCE_THRESHOLD = DEFAULT_WEIGHT
+# Weak keywords only back up stronger ones: however many appear ("flash sale, special prices,
+# live DJ"), a text with nothing else scores at most this, just short of an event
+WEAK_ONLY_CONFIDENCE_CAP = EVENT_CONFIDENCE_THRESHOLD - 0.01
+
+KeywordMatch = namedtuple('KeywordMatch', ['keyword', 'start', 'end'])
+MatchResult = namedtuple('MatchResult', ['matches', 'keywords', 'confidence'])
+
+
+class KeywordMatcher:
+    """
+    Matches a whole keyword list in a single regex pass.
+    Keywords match on word boundaries, case-insensitively, with any run of whitespace
+    between the words of a phrase and an optional plural "s"/"es" suffix.
+    """
+
+    def __init__(self, keyword_weights: dict, weak_only_cap: float = None):
+        """
+        Compiles the combined pattern once.
+
+        Args:
+            keyword_weights (dict): Keyword to weight (0..1) mapping.
+            weak_only_cap (float): Optional upper bound on the confidence of a text whose keywords
+                                   all weigh less than it, so weak keywords never add up past it.
+        """
+        self.keywords = [keyword.lower() for keyword in keyword_weights]
+        self.weights = {keyword.lower(): weight for keyword, weight in keyword_weights.items()}
+        self.weak_only_cap = weak_only_cap
+        # One capturing group per keyword so m.lastindex identifies the keyword without a lookup.
+        # Longer keywords first so phrases win over the single words they contain.
+        self._group_keywords = sorted(self.keywords, key=len, reverse=True)
+        alternatives = '|'.join(
+            '(' + r'\s+'.join(re.escape(word) for word in keyword.split()) + ')'
+            for keyword in self._group_keywords
+        )
+        self.pattern = re.compile(r'(?<!\w)(?:' + alternatives + r')(?:e?s)?(?!\w)', re.IGNORECASE)
+
+    def find(self, text: str) -> list:
+        """Returns every KeywordMatch in `text`, in order of position."""
+        if not text:
+            return []
+        group_keywords = self._group_keywords
+        return [KeywordMatch(group_keywords[m.lastindex - 1], m.start(), m.end())
+                for m in self.pattern.finditer(text)]
+
+    def match(self, text: str) -> MatchResult:
+        """
+        Scans `text` once and scores it.
+        Confidence combines the weights of the distinct keywords found as independent
+        signals: 1 - prod(1 - weight), capped at weak_only_cap when every keyword is weaker than it.
+
+        Returns:
+            MatchResult: (matches, distinct keywords in order of first appearance, confidence)
+        """
+        return self._score(self.find(text))
+
+    def _score(self, matches: list) -> MatchResult:
+        """Turns the matches found in one text into its MatchResult."""
+        keywords = list(dict.fromkeys(m.keyword for m in matches))
+        miss = 1.0
+        for keyword in keywords:
+            miss *= 1.0 - self.weights[keyword]
+        confidence = 1.0 - miss
+        if self.weak_only_cap is not None and all(self.weights[keyword] < self.weak_only_cap for keyword in keywords):
+            confidence = min(confidence, self.weak_only_cap)
+        return MatchResult(matches, keywords, confidence)
+
+    def match_many(self, texts: list) -> list:
+        """
+        Scores many texts with one regex pass over their concatenation.
+        Texts are joined with NUL separators, which no keyword can span, and
+        each match is routed back to its text by offset.
+
+        Returns:
+            list: One MatchResult per input text; match offsets are relative to that text.
+        """
+        starts = []
+        offset = 0
+        for text in texts:
+            starts.append(offset)
+            offset += len(text) + 1
+        combined = '\0'.join(texts)
+
+        per_text = [[] for _ in texts]
+        group_keywords = self._group_keywords
+        index = 0
+        for m in self.pattern.finditer(combined):
+            start = m.start()
+            # Matches arrive in order, so the owning text index only ever moves forward
+            while index + 1 < len(starts) and starts[index + 1] <= start:
+                index += 1
+            base = starts[index]
+            per_text[index].append(KeywordMatch(group_keywords[m.lastindex - 1], start - base, m.end() - base))
+        return [self._score(matches) for matches in per_text]
+
+
+# Compiled once at import and shared by every classifier
+EVENT_MATCHER = KeywordMatcher(EVENT_KEYWORD_WEIGHTS, weak_only_cap=WEAK_ONLY_CONFIDENCE_CAP)
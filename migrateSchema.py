@@ -0,0 +1,52 @@
+import psycopg2.sql as sql
+
+from postGresConnection import Database
+from scrapeLogging import get_logger
+from scrapeRecords import EventRecord, VenueRecord
+
+log = get_logger(__name__)
+
+# --- CONFIGURATION ---
+# Tables the scrapers upsert into, with the natural-key column their ON CONFLICT needs
+KEYED_TABLES = (
+    (EventRecord.TABLE, EventRecord.KEY_COLUMN),
+    (VenueRecord.TABLE, VenueRecord.KEY_COLUMN),
+)
+
+
+def add_key_column(db: Database, table_name: str, column: str):
+    """
+    Adds a text natural-key column with a unique index to a table if it is missing, and commits.
+
+    Args:
+        db (Database): An open database.
+        table_name (str): The table the records are written to.
+        column (str): The natural-key column that upserts conflict on.
+    """
+    cursor = db.connection.cursor()
+    cursor.execute(sql.SQL("ALTER TABLE {} ADD COLUMN IF NOT EXISTS {} TEXT").format(
+        sql.Identifier(table_name), sql.Identifier(column)))
+    cursor.execute(sql.SQL("CREATE UNIQUE INDEX IF NOT EXISTS {} ON {} ({})").format(
+        sql.Identifier(f"{table_name}_{column}_key"), sql.Identifier(table_name), sql.Identifier(column)))
+    db.connection.commit()
+    cursor.close()
+
+
+def migrate(db_params: dict):
+    """
+    Prepares a database for the scrapers. Run once per database before deploying them;
+    the scrape and refresh paths never change the schema. Safe to run again.
+
+    Args:
+        db_params (dict): Connection parameters of the database to migrate.
+    """
+    with Database(db_params) as db:
+        for table_name, column in KEYED_TABLES:
+            add_key_column(db, table_name, column)
+            log.info("🧱 Natural-key column ready", table=table_name, column=column)
+
+
+if __name__ == "__main__":
+    from instaScrapper import db_connection_params
+
+    migrate(db_connection_params)
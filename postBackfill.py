@@ -0,0 +1,189 @@
+import asyncio
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import httpx
+
+from ensembleClient import fetch_detailed_info_async, fetch_posts_page_async
+from instaScrapper import PLACES_TO_SCRAPE, TOKEN, db_connection_params, extract_post_events
+from scrapeLogging import get_logger
+from venueIndex import ensure_venue_index
+from writeQueue import WriteBehindFlusher, WriteBehindQueue, ensure_flusher, get_write_queue
+
+log = get_logger(__name__)
+
+# --- CONFIGURATION ---
+# Local SQLite file holding each profile's backfill cursor
+BACKFILL_DB_PATH = os.getenv('BACKFILL_STATE_DB', 'backfill_state.sqlite3')
+# Post pages fetched at the same time, across all profiles being backfilled
+BACKFILL_CONCURRENCY = int(os.getenv('BACKFILL_CONCURRENCY', '8'))
+# Pages fetched per profile in one run (0 = until the history is exhausted); the next run resumes
+BACKFILL_MAX_PAGES = int(os.getenv('BACKFILL_MAX_PAGES', '0'))
+REQUEST_TIMEOUT = 30
+
+
+class BackfillCheckpoints:
+    """
+    Durable per-username backfill progress: the cursor of the next page to fetch,
+    pages and posts seen so far, and when the history was exhausted.
+    A page's cursor is saved only after its posts were handed on, so an interrupted
+    run resumes at the first unprocessed page and never re-fetches an earlier one.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path=BACKFILL_DB_PATH):
+        """
+        Opens (and creates if needed) the SQLite checkpoint file.
+
+        Args:
+            path (str): Path to the SQLite database file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS backfill_cursors (
+                username TEXT PRIMARY KEY,
+                user_id TEXT,
+                cursor TEXT,
+                pages INTEGER NOT NULL DEFAULT 0,
+                posts INTEGER NOT NULL DEFAULT 0,
+                completed_at REAL,
+                updated_at REAL NOT NULL
+            )
+        """)
+
+    def get(self, username: str) -> dict:
+        """Returns the stored progress for `username`, or None if its backfill never started."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT user_id, cursor, pages, posts, completed_at FROM backfill_cursors WHERE username = ?",
+                (username,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'user_id': row[0], 'cursor': row[1], 'pages': row[2], 'posts': row[3], 'completed_at': row[4]}
+
+    def save_page(self, username: str, user_id: str, next_cursor: str, posts: int):
+        """Records one processed page; a None cursor marks the history as exhausted."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO backfill_cursors (username, user_id, cursor, pages, posts, completed_at, updated_at) "
+                "VALUES (?, ?, ?, 1, ?, ?, ?) "
+                "ON CONFLICT (username) DO UPDATE SET user_id = excluded.user_id, cursor = excluded.cursor, "
+                "pages = pages + 1, posts = posts + excluded.posts, completed_at = excluded.completed_at, "
+                "updated_at = excluded.updated_at",
+                (username, user_id, next_cursor, posts, None if next_cursor else now, now),
+            )
+
+    def reset(self, username: str):
+        """Forgets a profile's progress so the next run backfills it from the newest post again."""
+        with self._lock:
+            self._conn.execute("DELETE FROM backfill_cursors WHERE username = ?", (username,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+async def backfill_profile(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, username: str,
+                           checkpoints: BackfillCheckpoints, write_queue: WriteBehindQueue,
+                           max_pages: int = BACKFILL_MAX_PAGES) -> dict:
+    """
+    Pages through one profile's post history from its checkpoint, queueing the event
+    records of every page for the write-behind flusher before saving the next cursor.
+
+    Returns:
+        dict: username, status ('complete', 'partial', 'already_complete' or 'api_error'), pages, posts, events.
+    """
+    result = {'username': username, 'status': 'partial', 'pages': 0, 'posts': 0, 'events': 0}
+    progress = checkpoints.get(username)
+    if progress and progress['completed_at'] is not None:
+        result['status'] = 'already_complete'
+        return result
+
+    try:
+        # The profile (for its user ID and event formatting) usually comes from the response cache
+        async with semaphore:
+            scraped_json = await fetch_detailed_info_async(client, username, token=TOKEN)
+        profile_data = scraped_json['data']
+        user_id = (progress and progress['user_id']) or profile_data['id']
+        cursor = progress['cursor'] if progress else None
+
+        while not max_pages or result['pages'] < max_pages:
+            # The semaphore is held per page, so pages of different profiles interleave
+            async with semaphore:
+                nodes, cursor = await fetch_posts_page_async(client, user_id, cursor, token=TOKEN)
+            # Older pages lie below the incremental high-water mark, so every post is considered
+            # Deduplication may download posters, so extraction runs off the event loop
+            records, _ = await asyncio.to_thread(extract_post_events, profile_data, nodes=nodes)
+            await asyncio.to_thread(_queue_page, write_queue, records, checkpoints, username, user_id, cursor,
+                                    len(nodes))
+            result['pages'] += 1
+            result['posts'] += len(nodes)
+            result['events'] += len(records)
+            if cursor is None:
+                result['status'] = 'complete'
+                break
+    except (httpx.HTTPError, ValueError, KeyError, TypeError) as e:
+        log.error("❌ Backfill stopped; it resumes from the last saved page", username=username, error=repr(e))
+        result['status'] = 'api_error'
+
+    log.info("📚 Backfill progress", **result)
+    return result
+
+
+def _queue_page(write_queue: WriteBehindQueue, records: list, checkpoints: BackfillCheckpoints, username: str,
+                user_id: str, next_cursor: str, posts: int):
+    for record in records:
+        write_queue.enqueue(record.RECORD_TYPE, record)
+    checkpoints.save_page(username, user_id, next_cursor, posts)
+
+
+async def backfill_profiles_async(usernames: list, checkpoints: BackfillCheckpoints = None,
+                                  write_queue: WriteBehindQueue = None, max_concurrency: int = BACKFILL_CONCURRENCY,
+                                  max_pages: int = BACKFILL_MAX_PAGES) -> list:
+    """
+    Backfills the post history of many profiles concurrently over a single HTTP session.
+
+    Args:
+        usernames (list): Instagram usernames to backfill.
+        checkpoints (BackfillCheckpoints): Cursor store; defaults to one at BACKFILL_DB_PATH.
+        write_queue (WriteBehindQueue): Where event records go; defaults to the shared queue.
+        max_concurrency (int): Upper bound on in-flight API requests.
+        max_pages (int): Pages per profile in this run (0 = no limit).
+
+    Returns:
+        list: One result dict per username, in input order.
+    """
+    checkpoints = checkpoints or BackfillCheckpoints()
+    if write_queue is None:
+        write_queue = get_write_queue()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+    async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT, limits=limits) as client:
+        tasks = [backfill_profile(client, semaphore, username, checkpoints, write_queue, max_pages)
+                 for username in dict.fromkeys(usernames)]
+        return await asyncio.gather(*tasks)
+
+
+def backfill_profiles(usernames: list, max_concurrency: int = BACKFILL_CONCURRENCY,
+                      max_pages: int = BACKFILL_MAX_PAGES) -> list:
+    """
+    Synchronous wrapper around backfill_profiles_async that also starts the write-behind flusher
+    and the venue index refresh.
+    """
+    ensure_flusher(db_connection_params)
+    ensure_venue_index(db_connection_params)
+    return asyncio.run(backfill_profiles_async(usernames, max_concurrency=max_concurrency, max_pages=max_pages))
+
+
+if __name__ == "__main__":
+    backfill_profiles(sys.argv[1:] or PLACES_TO_SCRAPE)
+    # Write what the backfill queued before exiting
+    WriteBehindFlusher(get_write_queue(), db_connection_params).drain()
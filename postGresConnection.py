@@ -1,5 +1,276 @@
+import hashlib
+import os
+import threading
+import time
+import weakref
+from collections import deque, namedtuple
+
 import psycopg2
+import psycopg2.errors
+import psycopg2.pool
 import psycopg2.sql as sql
+import psycopg2.extensions
+from psycopg2.extras import execute_values
+
+from scrapeLogging import get_logger
+from scrapeRecords import stable_id
+
+log = get_logger(__name__)
+
+# --- POOL CONFIGURATION ---
+POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN', '1'))
+POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX', '10'))
+# Connections older than this are closed instead of being reused (in seconds)
+POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', '1800'))
+# Idle connections are pinged with "SELECT 1" before reuse after this long (in seconds)
+POOL_HEALTH_CHECK_AFTER = float(os.getenv('DB_POOL_HEALTH_CHECK_AFTER', '30'))
+# How long getconn() waits for a free connection before giving up (in seconds)
+POOL_ACQUIRE_TIMEOUT = float(os.getenv('DB_POOL_ACQUIRE_TIMEOUT', '30'))
+
+# Rows sent per multi-row VALUES statement in upsert_many()
+UPSERT_PAGE_SIZE = 500
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of persistent PostgreSQL connections with health checks
+    and max-lifetime recycling.
+    """
+
+    def __init__(self, db_params, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+                 max_lifetime=POOL_MAX_LIFETIME, health_check_after=POOL_HEALTH_CHECK_AFTER):
+        """
+        Initializes the pool and opens `min_size` connections up front.
+
+        Args:
+            db_params (dict): A dictionary containing the database connection parameters.
+            min_size (int): Number of connections kept open while idle.
+            max_size (int): Upper bound on open connections.
+            max_lifetime (float): Seconds after which a connection is recycled.
+            health_check_after (float): Idle seconds after which a connection is pinged before reuse.
+        """
+        self.db_params = db_params
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self._idle = deque()
+        self._created_at = {}
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        for _ in range(min_size):
+            self._size += 1
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        try:
+            connection = psycopg2.connect(**self.db_params)
+        except psycopg2.Error:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        self._created_at[connection] = time.monotonic()
+        return connection
+
+    def _discard(self, connection):
+        """Closes a connection and frees its slot. Must be called without the lock held."""
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+        with self._condition:
+            self._created_at.pop(connection, None)
+            self._size -= 1
+            self._condition.notify()
+
+    def _expired(self, connection):
+        created_at = self._created_at.get(connection, 0)
+        return time.monotonic() - created_at > self.max_lifetime
+
+    def _healthy(self, connection, idle_since):
+        if connection.closed:
+            return False
+        if time.monotonic() - idle_since < self.health_check_after:
+            return True
+        try:
+            with connection.cursor() as cur:
+                cur.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self, timeout=POOL_ACQUIRE_TIMEOUT):
+        """
+        Borrows a connection, opening a new one if the pool is below max_size.
+        Idle connections are taken under the lock but health-checked after releasing it,
+        so a slow or half-dead connection only holds up the thread that drew it.
+
+        Raises:
+            psycopg2.pool.PoolError: If the pool is closed or no connection frees up in time.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            connection = None
+            with self._condition:
+                while True:
+                    if self._closed:
+                        raise psycopg2.pool.PoolError("connection pool is closed")
+                    if self._idle:
+                        connection, idle_since = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise psycopg2.pool.PoolError("connection pool exhausted")
+                    self._condition.wait(remaining)
+            if connection is None:
+                return self._connect()
+            if not self._expired(connection) and self._healthy(connection, idle_since):
+                return connection
+            self._discard(connection)
+
+    def putconn(self, connection, discard=False):
+        """
+        Returns a borrowed connection. Broken, expired or discarded connections are closed.
+        Open transactions are rolled back before the lock is taken.
+        """
+        if discard or self._closed or connection.closed or self._expired(connection):
+            self._discard(connection)
+            return
+        try:
+            if connection.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except psycopg2.Error:
+            self._discard(connection)
+            return
+        with self._condition:
+            if not self._closed:
+                self._idle.append((connection, time.monotonic()))
+                self._condition.notify()
+                return
+        self._discard(connection)
+
+    def closeall(self):
+        """Closes every idle connection and refuses further borrowing."""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, deque()
+        for connection, _ in idle:
+            self._discard(connection)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_params, **pool_kwargs):
+    """
+    Returns the process-wide pool for `db_params`, creating it on first use.
+    Pools are recreated after a fork so child processes never share sockets.
+
+    Args:
+        db_params (dict): A dictionary containing the database connection parameters.
+        **pool_kwargs: Optional ConnectionPool sizing overrides used on creation.
+
+    Returns:
+        ConnectionPool: The shared pool for these parameters.
+    """
+    key = (os.getpid(), tuple(sorted(db_params.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(db_params, **pool_kwargs)
+            _pools[key] = pool
+        return pool
+
+
+_statement_cache = {}
+_statement_cache_lock = threading.Lock()
+# Names of the server-side prepared statements that exist on each live connection
+_prepared_statements = weakref.WeakKeyDictionary()
+# Prepared statement name for each upsert statement key
+_prepared_names = {}
+
+UpsertLayout = namedtuple('UpsertLayout', ['columns', 'row_values', 'conflict_column', 'keep_columns',
+                                           'compare_columns'])
+
+
+def _upsert_query(table_name, columns, conflict_column, values, keep_columns=(), compare_columns=()):
+    """
+    Composes INSERT ... ON CONFLICT DO UPDATE with psycopg2.sql around a VALUES clause.
+    `keep_columns` are only written on insert. With `compare_columns`, a conflicting row is
+    only rewritten when one of those columns actually differs.
+    """
+    query = sql.SQL(
+        "INSERT INTO {table} ({columns}) {values} "
+        "ON CONFLICT ({conflict}) DO UPDATE SET {updates}"
+    ).format(
+        table=sql.Identifier(table_name),
+        columns=sql.SQL(', ').join(map(sql.Identifier, columns)),
+        values=values,
+        conflict=sql.Identifier(conflict_column),
+        updates=sql.SQL(', ').join(
+            sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(col)) for col in columns
+            if col != conflict_column and col not in keep_columns
+        ),
+    )
+    if not compare_columns:
+        return query
+    return query + sql.SQL(" WHERE ({current}) IS DISTINCT FROM ({incoming})").format(
+        current=sql.SQL(', ').join(sql.SQL("{}.{}").format(sql.Identifier(table_name), sql.Identifier(col))
+                                   for col in compare_columns),
+        incoming=sql.SQL(', ').join(sql.SQL("EXCLUDED.{}").format(sql.Identifier(col)) for col in compare_columns),
+    )
+
+
+def _prepare_upsert_query(name, table_name, layout):
+    """Composes PREPARE <name> AS <upsert> using positional $n parameters."""
+    positional = sql.SQL(', ').join(sql.SQL('$' + str(i)) for i in range(1, len(layout.columns) + 1))
+    return sql.SQL("PREPARE {} AS {}").format(
+        sql.Identifier(name),
+        _upsert_query(table_name, layout.columns, layout.conflict_column, sql.SQL("VALUES ({})").format(positional),
+                      layout.keep_columns, layout.compare_columns),
+    )
+
+
+def _cached_statement(connection, key, build):
+    """
+    Returns the rendered SQL text for `key`, composing it with `build()` only once per process.
+    """
+    statement = _statement_cache.get(key)
+    if statement is None:
+        statement = build().as_string(connection)
+        with _statement_cache_lock:
+            _statement_cache[key] = statement
+    return statement
+
+
+def _upsert_layout(record, conflict_column=None):
+    """
+    Describes how to upsert a record. Records from scrapeRecords carry a fixed COLUMNS tuple,
+    a precomputed as_params() and their natural key; plain dicts fall back to their key order
+    and conflict on `conflict_column` (default 'id').
+
+    Returns:
+        UpsertLayout: (columns, row_values, conflict_column, keep_columns, compare_columns),
+                      where row_values(record) gives the record's values in column order.
+    """
+    if isinstance(record, dict):
+        columns = tuple(record.keys())
+        return UpsertLayout(columns, lambda row: tuple(row[col] for col in columns), conflict_column or 'id', (), ())
+    return UpsertLayout(record.COLUMNS, type(record).as_params, conflict_column or record.KEY_COLUMN,
+                        record.INSERT_ONLY_COLUMNS, record.COMPARE_COLUMNS)
+
+
+def clear_statement_cache():
+    """Drops every cached statement text, e.g. after a table or column rename."""
+    with _statement_cache_lock:
+        _statement_cache.clear()
 
 
 class Database:
@@ -7,14 +278,17 @@ class Database:
     A class to manage a PostgreSQL database connection using a context manager.
     """
 
-    def __init__(self, db_params):
+    def __init__(self, db_params, pool=None):
         """
         Initializes the Database object with connection parameters.
 
         Args:
             db_params (dict): A dictionary containing the database connection parameters.
+            pool (ConnectionPool): Optional pool to borrow the connection from instead of
+                opening a new one. The connection is returned to it on exit.
         """
         self.db_params = db_params
+        self.pool = pool
         self.connection = None
         self.cursor = None
 
@@ -25,25 +299,37 @@ class Database:
         Returns:
             Database: The instance of the Database class.
         """
+        if self.pool is not None:
+            self.connection = self.pool.getconn()
+            return self
         try:
-            print("Connecting to the PostgreSQL database...")
+            log.debug("Connecting to the PostgreSQL database", host=self.db_params.get('host'))
             self.connection = psycopg2.connect(**self.db_params)
-            print("Connection successful.")
+            log.debug("Connection successful", host=self.db_params.get('host'))
             return self
         except (Exception, psycopg2.DatabaseError) as error:
-            print(f"Error while connecting to PostgreSQL: {error}")
+            log.error("Error while connecting to PostgreSQL", host=self.db_params.get('host'), error=str(error))
             # Reraise the exception to prevent the 'with' block from executing
             raise
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """
         Closes the cursor and connection when exiting the 'with' block.
+        Pooled connections are rolled back on error and handed back to the pool.
         """
         if self.cursor:
             self.cursor.close()
-        if self.connection:
+        if self.connection and self.pool is not None:
+            if exc_type is not None and not self.connection.closed:
+                try:
+                    self.connection.rollback()
+                except psycopg2.Error:
+                    pass
+            self.pool.putconn(self.connection)
+            self.connection = None
+        elif self.connection:
             self.connection.close()
-            print("Database connection closed.")
+            log.debug("Database connection closed", host=self.db_params.get('host'))
 
     def select_all(self, table_name):
         """
@@ -62,15 +348,175 @@ class Database:
             # Use psycopg2.sql to safely quote the table name
             query = sql.SQL("SELECT * FROM {}").format(sql.Identifier(table_name))
 
-            print(f"Selecting all from the {table_name} table...")
+            log.debug("Selecting all rows", table=table_name)
             self.cursor.execute(query)
 
             records = self.cursor.fetchall()
-            print(f"Found {len(records)} records in {table_name}.")
+            log.info("Selected rows", table=table_name, rows=len(records))
 
         except (Exception, psycopg2.DatabaseError) as error:
-            print(f"Error during query execution for table {table_name}: {error}")
+            log.error("Error during query execution", table=table_name, error=str(error))
+
+        return records
+
+    def upsert_many(self, table_name, records, conflict_column=None):
+        """
+        Upserts records that share the same columns using multi-row VALUES statements.
+        Rows whose compared columns are unchanged are left untouched.
+        The caller is responsible for committing.
+
+        Args:
+            table_name (str): The table to write to.
+            records (list): Records of one type (see scrapeRecords), or dicts with identical keys.
+            conflict_column (str): The unique column used for ON CONFLICT
+                                   (default: the record's natural key, or 'id' for dicts).
+
+        Returns:
+            int: The number of rows sent to the database.
+        """
+        if not records:
+            return 0
+        layout = _upsert_layout(records[0], conflict_column)
+        key_index = layout.columns.index(layout.conflict_column)
+
+        # Postgres rejects a multi-row upsert that touches the same key twice, so the last one wins
+        unique_values = {}
+        for record in records:
+            values = layout.row_values(record)
+            unique_values[values[key_index]] = values
+
+        query = _cached_statement(
+            self.connection, ('upsert_many', table_name) + layout[:1] + layout[2:],
+            lambda: _upsert_query(table_name, layout.columns, layout.conflict_column, sql.SQL("VALUES %s"),
+                                  layout.keep_columns, layout.compare_columns),
+        )
+        values = list(unique_values.values())
+
+        self.cursor = self.connection.cursor()
+        self._with_free_ids(table_name, layout, values,
+                            lambda rows: execute_values(self.cursor, query, rows, page_size=UPSERT_PAGE_SIZE))
+        return len(values)
 
+    def upsert(self, table_name, record, conflict_column=None):
+        """
+        Upserts a single record through a server-side prepared statement.
+        The statement is prepared once per connection, so pooled connections skip
+        SQL generation and planning on repeat calls. The caller is responsible for committing.
+
+        Args:
+            table_name (str): The table to write to.
+            record: A record from scrapeRecords, or a column name to value dict.
+            conflict_column (str): The unique column used for ON CONFLICT
+                                   (default: the record's natural key, or 'id' for dicts).
+
+        Returns:
+            int: 1 if the row was inserted or updated, 0 if it was already up to date.
+        """
+        layout = _upsert_layout(record, conflict_column)
+        key = ('upsert', table_name) + layout[:1] + layout[2:]
+        name = _prepared_names.get(key)
+        if name is None:
+            name = _prepared_names.setdefault(
+                key, 'upsert_' + hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16])
+
+        self.cursor = self.connection.cursor()
+        prepared = _prepared_statements.setdefault(self.connection, set())
+        if name not in prepared:
+            self.cursor.execute(_cached_statement(
+                self.connection, ('prepare',) + key,
+                lambda: _prepare_upsert_query(name, table_name, layout),
+            ))
+            prepared.add(name)
+
+        execute = _cached_statement(
+            self.connection, ('execute',) + key,
+            lambda: sql.SQL("EXECUTE {} ({})").format(
+                sql.Identifier(name), sql.SQL(', ').join(sql.Placeholder() * len(layout.columns))),
+        )
+        self._with_free_ids(table_name, layout, [layout.row_values(record)],
+                            lambda rows: self.cursor.execute(execute, rows[0]))
+        return self.cursor.rowcount
+
+    def _with_free_ids(self, table_name, layout, values, write):
+        """
+        Runs `write(values)` for an upsert that conflicts on a natural key while also supplying
+        the derived primary key. Two natural keys can derive the same 31-bit id, and ON CONFLICT
+        only covers the natural key, so inserting the second one violates the primary key: the
+        write is then rolled back to a savepoint and repeated with the clashing rows moved to free ids.
+        """
+        if 'id' not in layout.columns or layout.conflict_column == 'id':
+            write(values)
+            return
+        self.cursor.execute("SAVEPOINT upsert_ids")
+        try:
+            write(values)
+        except psycopg2.errors.UniqueViolation:
+            self.cursor.execute("ROLLBACK TO SAVEPOINT upsert_ids")
+            write(self._reassign_taken_ids(table_name, layout, values))
+        self.cursor.execute("RELEASE SAVEPOINT upsert_ids")
+
+    def _reassign_taken_ids(self, table_name, layout, values):
+        """
+        Returns `values` with a free id for every row whose id is already held by another natural key,
+        in the table or earlier in the batch. Free ids are derived from "<key>#<n>", so they are stable.
+        """
+        id_index = layout.columns.index('id')
+        key_index = layout.columns.index(layout.conflict_column)
+        self.cursor.execute(
+            sql.SQL("SELECT id, {key} FROM {table} WHERE id = ANY(%s)").format(
+                key=sql.Identifier(layout.conflict_column), table=sql.Identifier(table_name)),
+            ([row[id_index] for row in values],),
+        )
+        owners = dict(self.cursor.fetchall())
+        used = set()
+        reassigned = []
+        for row in values:
+            row_id, key = row[id_index], row[key_index]
+            if owners.get(row_id, key) != key or row_id in used:
+                row_id = self._free_id(table_name, key, used)
+                log.warning("🔀 Derived id already taken; using another", table=table_name, source_key=key,
+                            taken_id=row[id_index], id=row_id)
+                row = row[:id_index] + (row_id,) + row[id_index + 1:]
+            used.add(row_id)
+            reassigned.append(row)
+        return reassigned
+
+    def _free_id(self, table_name, key, used):
+        query = sql.SQL("SELECT 1 FROM {} WHERE id = %s").format(sql.Identifier(table_name))
+        attempt = 0
+        while True:
+            attempt += 1
+            candidate = stable_id(f"{key}#{attempt}")
+            if candidate in used:
+                continue
+            self.cursor.execute(query, (candidate,))
+            if self.cursor.fetchone() is None:
+                return candidate
+
+    def select_changed(self, table_name, columns, changed_column, since=None):
+        """
+        Selects rows changed at or after a point in time, oldest change first, for incremental reloads.
+        Rows whose `changed_column` is NULL are only returned when `since` is None (a full load).
+        Database errors are raised so the caller can keep its previous state.
+
+        Args:
+            table_name (str): The name of the table to query.
+            columns (list): The columns to return, in order.
+            changed_column (str): The last-modified timestamp column.
+            since (datetime): Lower bound (inclusive) on `changed_column`, or None for every row.
+
+        Returns:
+            list: A list of tuples in `columns` order.
+        """
+        self.cursor = self.connection.cursor()
+        query = sql.SQL("SELECT {} FROM {}").format(
+            sql.SQL(', ').join(map(sql.Identifier, columns)), sql.Identifier(table_name))
+        if since is not None:
+            query += sql.SQL(" WHERE {} >= %s").format(sql.Identifier(changed_column))
+        query += sql.SQL(" ORDER BY {} NULLS FIRST").format(sql.Identifier(changed_column))
+        self.cursor.execute(query, (since,) if since is not None else None)
+        records = self.cursor.fetchall()
+        log.debug("Selected changed rows", table=table_name, since=since, rows=len(records))
         return records
 
     def select_from_multiple_tables(self, table_names):
@@ -129,5 +575,5 @@ if __name__ == '__main__':
 
     except Exception as e:
         # This will catch connection errors raised from __enter__
-        print(f"Failed to execute database operations. Reason: {e}")
+        log.error("Failed to execute database operations", error=str(e))
 
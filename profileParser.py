@@ -0,0 +1,110 @@
+import json
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # orjson is optional; the stdlib parser gives identical results, only slower
+    _loads = json.loads
+
+# --- CONFIGURATION ---
+# Post nodes kept per profile (InstaScrapper reads 5, the scheduler's posting signals read 12)
+MAX_POSTS = 12
+PROFILE_FIELDS = (
+    'id', 'username', 'full_name', 'biography', 'external_url', 'profile_pic_url',
+    'business_email', 'business_phone_number', 'business_address_json', 'category_name',
+)
+
+
+class PostSnapshot:
+    """The fields of one timeline post node that classification and scheduling read."""
+    __slots__ = ('id', 'caption', 'display_url', 'location', 'has_upcoming_event', 'taken_at_timestamp')
+
+    def __init__(self, node: dict):
+        caption_edges = node.get('edge_media_to_caption', {}).get('edges', [])
+        self.id = node.get('id')
+        self.caption = caption_edges[0].get('node', {}).get('text') if caption_edges else None
+        self.display_url = node.get('display_url')
+        location = node.get('location')
+        self.location = {'id': location.get('id'), 'name': location.get('name')} if location else None
+        self.has_upcoming_event = bool(node.get('has_upcoming_event'))
+        self.taken_at_timestamp = node.get('taken_at_timestamp')
+
+    def to_node(self) -> dict:
+        """Rebuilds a post node in the detailed-info layout, holding only the kept fields."""
+        node = {'id': self.id, 'has_upcoming_event': self.has_upcoming_event,
+                'taken_at_timestamp': self.taken_at_timestamp, 'location': self.location}
+        if self.display_url is not None:
+            node['display_url'] = self.display_url
+        if self.caption is not None:
+            node['edge_media_to_caption'] = {'edges': [{'node': {'text': self.caption}}]}
+        return node
+
+
+class ProfileSnapshot:
+    """
+    A compact view of a detailed-info payload: the profile fields in PROFILE_FIELDS
+    and the first MAX_POSTS post nodes. Everything else in the response is dropped.
+    """
+    __slots__ = PROFILE_FIELDS + ('posts',)
+
+    def __init__(self, profile_data: dict, max_posts: int = MAX_POSTS):
+        for field in PROFILE_FIELDS:
+            setattr(self, field, profile_data.get(field))
+        edges = (profile_data.get('edge_owner_to_timeline_media') or {}).get('edges') or []
+        self.posts = tuple(PostSnapshot(edge.get('node', {})) for edge in edges[:max_posts])
+
+    def to_payload(self) -> dict:
+        """Returns a detailed-info shaped payload ({'data': {...}}) holding only the kept fields."""
+        data = {field: getattr(self, field) for field in PROFILE_FIELDS if getattr(self, field) is not None}
+        data['edge_owner_to_timeline_media'] = {'edges': [{'node': post.to_node()} for post in self.posts]}
+        return {'data': data}
+
+
+def parse_profile(raw: bytes, max_posts: int = MAX_POSTS) -> ProfileSnapshot:
+    """
+    Parses raw detailed-info response bytes into a ProfileSnapshot.
+
+    Returns:
+        ProfileSnapshot: The compact profile, or None if the payload has no profile data.
+
+    Raises:
+        json.JSONDecodeError: If the bytes are not valid JSON (orjson's error subclasses it).
+    """
+    payload = _loads(raw)
+    profile_data = payload.get('data') if isinstance(payload, dict) else None
+    if not isinstance(profile_data, dict):
+        return None
+    return ProfileSnapshot(profile_data, max_posts)
+
+
+def compact_payload(raw: bytes, max_posts: int = MAX_POSTS) -> dict:
+    """
+    Parses raw detailed-info response bytes and returns the compacted payload that the
+    scrapers consume. Payloads without profile data (API errors) are returned as parsed,
+    so callers still see and report them.
+    """
+    payload = _loads(raw)
+    profile_data = payload.get('data') if isinstance(payload, dict) else None
+    if not isinstance(profile_data, dict):
+        return payload
+    return ProfileSnapshot(profile_data, max_posts).to_payload()
+
+
+def compact_posts_page(raw: bytes) -> tuple:
+    """
+    Parses one page of the user-posts endpoint into compact post nodes.
+
+    Returns:
+        tuple: (post nodes in the detailed-info layout, cursor of the next page or None on the last page)
+
+    Raises:
+        json.JSONDecodeError: If the bytes are not valid JSON.
+    """
+    payload = _loads(raw)
+    data = payload.get('data') if isinstance(payload, dict) else None
+    if not isinstance(data, dict):
+        return [], None
+    posts = data.get('posts') or []
+    nodes = [PostSnapshot(post.get('node', post)).to_node() for post in posts]
+    # An empty page ends the history even if the API still hands out a cursor
+    return nodes, (data.get('last_cursor') or None) if nodes else None
@@ -0,0 +1,284 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# --- CONFIGURATION ---
+# Sustained request rate and burst size allowed against the EnsembleData API
+MAX_REQUESTS_PER_SECOND = float(os.getenv('ENSEMBLE_MAX_RPS', '5'))
+MIN_REQUESTS_PER_SECOND = float(os.getenv('ENSEMBLE_MIN_RPS', '0.2'))
+BURST_SIZE = int(os.getenv('ENSEMBLE_BURST', '10'))
+
+# Daily API unit budget (0 disables the check)
+DAILY_UNIT_BUDGET = int(os.getenv('ENSEMBLE_DAILY_UNITS', '0'))
+
+# Backoff settings for 429 / 5xx responses (in seconds)
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+
+# Circuit breaker settings
+FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_SECONDS = 30.0
+
+
+class CircuitOpenError(Exception):
+    """Raised when a host's circuit breaker is open and calls are being refused."""
+
+
+class BudgetExhaustedError(Exception):
+    """Raised when the daily API unit budget has been spent."""
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket whose refill rate adapts to the server's responses.
+    Callers reserve tokens and are told how long to wait, so the same bucket serves
+    both blocking and asyncio code.
+    """
+
+    def __init__(self, rate, capacity, min_rate=MIN_REQUESTS_PER_SECOND):
+        self.max_rate = rate
+        self.floor_rate = min_rate
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, tokens=1):
+        """
+        Takes tokens from the bucket, going into debt if needed.
+
+        Returns:
+            float: Seconds the caller must wait before sending its request.
+        """
+        with self.lock:
+            self._refill()
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def slow_down(self):
+        """Halves the refill rate after the server pushed back (429)."""
+        with self.lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def speed_up(self):
+        """Grows the refill rate back towards the configured maximum."""
+        with self.lock:
+            if self.rate < self.max_rate:
+                self._refill()
+                self.rate = min(self.max_rate, self.rate * 1.05 + 0.01)
+
+    def resize(self, rate, capacity):
+        """Changes the maximum rate and capacity, scaling the current (adapted) rate along."""
+        with self.lock:
+            self._refill()
+            scaled = self.rate * rate / self.max_rate
+            self.max_rate = rate
+            self.min_rate = min(self.floor_rate, rate)
+            self.rate = max(self.min_rate, min(rate, scaled))
+            self.capacity = capacity
+            self.tokens = min(self.tokens, capacity)
+
+
+class UnitBudget:
+    """Tracks API units spent per UTC day against an optional daily limit."""
+
+    def __init__(self, daily_limit=DAILY_UNIT_BUDGET):
+        self.daily_limit = daily_limit
+        self.day = None
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def spend(self, units):
+        with self.lock:
+            today = datetime.now(timezone.utc).date()
+            if today != self.day:
+                self.day, self.used = today, 0
+            if self.daily_limit and self.used + units > self.daily_limit:
+                raise BudgetExhaustedError(
+                    f"Daily API budget of {self.daily_limit} units exhausted ({self.used} used).")
+            self.used += units
+
+    def resize(self, daily_limit):
+        """Changes the daily limit; units already spent today still count."""
+        with self.lock:
+            self.daily_limit = daily_limit
+
+    @property
+    def remaining(self):
+        if not self.daily_limit:
+            return None
+        return max(0, self.daily_limit - self.used)
+
+
+class CircuitBreaker:
+    """
+    Opens after FAILURE_THRESHOLD consecutive failures, refuses calls for
+    CIRCUIT_RESET_SECONDS, then lets a single trial request through.
+    """
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_seconds=CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    def allow(self, host):
+        """
+        Raises CircuitOpenError while the circuit is open.
+
+        Returns:
+            bool: True if the caller was let through as the half-open trial request.
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return False
+            if time.monotonic() - self.opened_at < self.reset_seconds or self.trial_in_flight:
+                raise CircuitOpenError(f"Circuit open for {host}; refusing request.")
+            # Half-open: let one request probe the host
+            self.trial_in_flight = True
+            return True
+
+    def cancel_trial(self):
+        """Gives back the half-open trial slot of a request that was never sent."""
+        with self.lock:
+            self.trial_in_flight = False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+def parse_retry_after(value):
+    """Converts a Retry-After header (delta-seconds or HTTP-date) into seconds."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Returns how long to wait before retry number `attempt` (starting at 0).
+    A server-provided Retry-After wins; otherwise full-jitter exponential backoff.
+    """
+    server_delay = parse_retry_after(retry_after)
+    if server_delay is not None:
+        return min(server_delay, BACKOFF_CAP)
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+class RateLimiter:
+    """
+    Shared limiter for outgoing API calls: one token bucket for the account-wide
+    request rate, a unit budget, and one circuit breaker per host.
+    When several processes call the same account, each one gets a share (see set_share).
+    """
+
+    def __init__(self, rate=MAX_REQUESTS_PER_SECOND, burst=BURST_SIZE, daily_units=DAILY_UNIT_BUDGET):
+        self.rate = rate
+        self.burst = burst
+        self.daily_units = daily_units
+        self.shares = 1
+        self.bucket = TokenBucket(rate, burst)
+        self.budget = UnitBudget(daily_units)
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def set_share(self, shares: int):
+        """
+        Limits this process to 1/`shares` of the configured rate, burst and daily units,
+        for when `shares` processes (e.g. the live scrape workers) draw on the same API account.
+
+        Args:
+            shares (int): The number of processes sharing the account (at least 1).
+        """
+        shares = max(1, shares)
+        with self.lock:
+            if shares == self.shares:
+                return
+            self.shares = shares
+        self.bucket.resize(self.rate / shares, max(1.0, self.burst / shares))
+        self.budget.resize(max(1, self.daily_units // shares) if self.daily_units else 0)
+
+    def _breaker(self, host):
+        with self.lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker()
+            return self.breakers[host]
+
+    def _admit(self, host, units):
+        breaker = self._breaker(host)
+        trial = breaker.allow(host)
+        try:
+            self.budget.spend(units)
+        except BudgetExhaustedError:
+            # Otherwise the trial never reports back and the circuit stays open after the budget resets
+            if trial:
+                breaker.cancel_trial()
+            raise
+        return self.bucket.reserve()
+
+    def acquire(self, host, units=1):
+        """Blocks until a request to `host` may be sent."""
+        wait = self._admit(host, units)
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self, host, units=1):
+        """Asyncio counterpart of acquire()."""
+        wait = self._admit(host, units)
+        if wait:
+            await asyncio.sleep(wait)
+
+    def record_response(self, host, status_code):
+        """Feeds a response status back into the breaker and the adaptive rate."""
+        if status_code == 429:
+            self.bucket.slow_down()
+            self._breaker(host).record_failure()
+        elif status_code >= 500:
+            self._breaker(host).record_failure()
+        else:
+            self.bucket.speed_up()
+            self._breaker(host).record_success()
+
+    def record_error(self, host):
+        """Records a connection-level failure (timeout, reset, DNS...)."""
+        self._breaker(host).record_failure()
+
+
+# Process-wide limiter shared by every EnsembleData caller
+ENSEMBLE_LIMITER = RateLimiter()
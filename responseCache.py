@@ -0,0 +1,206 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from profileParser import compact_payload
+
+# --- CONFIGURATION ---
+CACHE_DIR = os.getenv('RESPONSE_CACHE_DIR', '.response_cache')
+# Cached responses younger than this are served instead of calling the API (in seconds)
+CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '900'))
+# Least recently used payloads are evicted once the cache grows past this size (in bytes)
+CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+# "normal" reads and writes the cache, "offline" never calls the API, "off" bypasses the cache
+CACHE_MODE = os.getenv('RESPONSE_CACHE_MODE', 'normal')
+
+
+class ResponseCache:
+    """
+    A content-addressed, zlib-compressed on-disk cache of raw API responses.
+    Payload blobs are stored once per SHA-256 digest; an SQLite index maps each
+    username to its fetch history and tracks blob access times for LRU eviction.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES, mode=CACHE_MODE):
+        """
+        Opens (and creates if needed) the cache directory and its index.
+
+        Args:
+            cache_dir (str): Directory holding the blobs and the index.
+            ttl (float): Default maximum age of a servable response, in seconds.
+            max_bytes (int): Total compressed size above which LRU eviction kicks in.
+            mode (str): "normal", "offline" or "off".
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(cache_dir, 'blobs'), exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite3'), check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS fetches (
+                username TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS fetches_by_user ON fetches (username, fetched_at)")
+
+    @property
+    def enabled(self):
+        return self.mode != 'off'
+
+    @property
+    def offline(self):
+        return self.mode == 'offline'
+
+    def _blob_path(self, digest):
+        return os.path.join(self.cache_dir, 'blobs', digest[:2], digest + '.json.z')
+
+    def load(self, digest: str) -> dict:
+        """
+        Loads a stored payload by digest and decodes it into the compact form the
+        scrapers consume (see profileParser), or returns None if it is gone.
+        """
+        raw = self.load_raw(digest)
+        return compact_payload(raw) if raw is not None else None
+
+    def load_raw(self, digest: str) -> bytes:
+        """Returns the stored response bytes for a digest exactly as the API sent them, or None."""
+        try:
+            with open(self._blob_path(digest), 'rb') as f:
+                raw = zlib.decompress(f.read())
+        except (OSError, zlib.error):
+            return None
+        with self._lock:
+            self._conn.execute("UPDATE blobs SET last_access = ? WHERE digest = ?", (time.time(), digest))
+        return raw
+
+    def get(self, username: str, max_age: float = None) -> dict:
+        """
+        Returns the latest cached payload for `username` if it is young enough.
+        In offline mode any cached payload is returned regardless of age.
+        """
+        if not self.enabled:
+            return None
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT digest, fetched_at FROM fetches WHERE username = ? ORDER BY fetched_at DESC LIMIT 1",
+                (username,)
+            ).fetchone()
+        if row is None:
+            return None
+        digest, fetched_at = row
+        if not self.offline and time.time() - fetched_at > max_age:
+            return None
+        return self.load(digest)
+
+    def put(self, username: str, raw: bytes):
+        """
+        Stores the raw response bytes for `username` and evicts old blobs if needed.
+
+        Returns:
+            str: The SHA-256 digest the payload was stored under.
+        """
+        if not self.enabled:
+            return None
+        digest = hashlib.sha256(raw).hexdigest()
+        path = self._blob_path(digest)
+        now = time.time()
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            compressed = zlib.compress(raw, 6)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(compressed)
+            os.replace(tmp_path, path)
+            size = len(compressed)
+        else:
+            size = os.path.getsize(path)
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO blobs (digest, size, last_access) VALUES (?, ?, ?) "
+                "ON CONFLICT (digest) DO UPDATE SET last_access = excluded.last_access",
+                (digest, size, now),
+            )
+            self._conn.execute("INSERT INTO fetches (username, digest, fetched_at) VALUES (?, ?, ?)",
+                               (username, digest, now))
+        self.evict()
+        return digest
+
+    def evict(self):
+        """Deletes least recently used blobs (and their fetch rows) until under max_bytes."""
+        with self._lock:
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for digest, size in self._conn.execute("SELECT digest, size FROM blobs ORDER BY last_access").fetchall():
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(self._blob_path(digest))
+                except OSError:
+                    pass
+                self._conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+                self._conn.execute("DELETE FROM fetches WHERE digest = ?", (digest,))
+                total -= size
+
+    def usernames(self) -> list:
+        """Returns every username with at least one cached fetch."""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT username FROM fetches ORDER BY username")]
+
+    def history(self, username: str) -> list:
+        """Returns (fetched_at, digest) pairs for every cached fetch of `username`, newest first."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT fetched_at, digest FROM fetches WHERE username = ? ORDER BY fetched_at DESC",
+                (username,)
+            ).fetchall()
+
+    def replay(self, username: str = None):
+        """
+        Yields (username, fetched_at, payload) for cached fetches, oldest first,
+        so historical payloads can be pushed through InstaScrapper offline.
+        """
+        with self._lock:
+            if username is None:
+                rows = self._conn.execute(
+                    "SELECT username, fetched_at, digest FROM fetches ORDER BY fetched_at").fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT username, fetched_at, digest FROM fetches WHERE username = ? ORDER BY fetched_at",
+                    (username,)
+                ).fetchall()
+        for row_username, fetched_at, digest in rows:
+            payload = self.load(digest)
+            if payload is not None:
+                yield row_username, fetched_at, payload
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Returns the process-wide cache configured from the environment, opening it on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
@@ -0,0 +1,98 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from scrapeLogging import get_logger
+
+log = get_logger(__name__)
+
+# --- CONFIGURATION ---
+# Scrape jobs allowed to run at the same time per server process
+MAX_RUNNING_JOBS = 4
+# Finished jobs are forgotten after this long (in seconds)
+JOB_RETENTION = 60 * 60
+
+_executor = ThreadPoolExecutor(max_workers=MAX_RUNNING_JOBS, thread_name_prefix='scrape-job')
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class ScrapeJob:
+    """
+    Output of one background scrape: the logs, alerts and cards yielded so far, plus
+    card updates as (position, card) pairs that replace an earlier card.
+    Lives in server memory, so the Dash app must poll the process that started it
+    (run a single gunicorn worker with threads, or pin sessions).
+    """
+
+    def __init__(self, usernames):
+        self.id = uuid.uuid4().hex
+        self.usernames = usernames
+        self.status = 'queued'
+        self.error = None
+        self.items = {'log': [], 'alert': [], 'card': [], 'card_update': []}
+        self.started_at = None
+        self.finished_at = None
+        self.lock = threading.Lock()
+
+    def append(self, item_type, content):
+        if content is None or item_type not in self.items:
+            return
+        with self.lock:
+            self.items[item_type].append(content)
+
+    def since(self, cursor: dict) -> tuple:
+        """
+        Returns the items added after `cursor` together with the cursor to pass next time.
+        A cursor maps each item type to how many items of that type were already seen.
+        """
+        cursor = cursor or {}
+        with self.lock:
+            new_items = {item_type: items[cursor.get(item_type, 0):] for item_type, items in self.items.items()}
+            new_cursor = {item_type: len(items) for item_type, items in self.items.items()}
+        return new_items, new_cursor
+
+    @property
+    def done(self):
+        return self.status in ('done', 'failed')
+
+
+def _run(job, job_factory):
+    job.status, job.started_at = 'running', time.time()
+    try:
+        for item_type, content in job_factory(job.usernames):
+            job.append(item_type, content)
+        job.status = 'done'
+    except Exception as e:
+        log.exception("❌ Scrape job failed", job_id=job.id, error=str(e))
+        job.error = str(e)
+        job.status = 'failed'
+    finally:
+        job.finished_at = time.time()
+
+
+def _forget_old_jobs():
+    cutoff = time.time() - JOB_RETENTION
+    with _jobs_lock:
+        for job_id in [job_id for job_id, job in _jobs.items() if job.finished_at and job.finished_at < cutoff]:
+            del _jobs[job_id]
+
+
+def start_job(job_factory, usernames: list) -> ScrapeJob:
+    """
+    Runs `job_factory(usernames)` (a generator of (item_type, content) pairs such as
+    run_scraping_job) on a worker thread and returns the job handle immediately.
+    """
+    _forget_old_jobs()
+    job = ScrapeJob(usernames)
+    with _jobs_lock:
+        _jobs[job.id] = job
+    _executor.submit(_run, job, job_factory)
+    return job
+
+
+def get_job(job_id: str) -> ScrapeJob:
+    """Returns the job with this ID, or None if it is unknown or was forgotten."""
+    with _jobs_lock:
+        return _jobs.get(job_id)
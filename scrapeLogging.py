@@ -0,0 +1,192 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder writes the same lines, only slower
+    orjson = None
+
+# --- CONFIGURATION ---
+# Level for every module without an override
+LOG_LEVEL = os.getenv('SCRAPE_LOG_LEVEL', 'INFO')
+# Per-module overrides, e.g. "postGresConnection=WARNING,ensembleClient=DEBUG"
+LOG_LEVELS = os.getenv('SCRAPE_LOG_LEVELS', '')
+# Fraction of each high-volume message kind that is written, e.g. "record=0.01,cache=0.5"
+LOG_SAMPLE_RATES = os.getenv('SCRAPE_LOG_SAMPLE', '')
+DEFAULT_SAMPLE_RATES = {
+    'record': 0.05,     # full formatted records
+    'cache': 0.2,       # responses served from the response cache
+    'skip': 0.2,        # profiles skipped as fresh or unchanged
+    'classify': 0.2,    # per-profile classification results
+    'write': 0.2,       # per-record upsert confirmations
+}
+# Records buffered for the writer thread; when it falls behind, new records are dropped instead of blocking
+LOG_QUEUE_SIZE = int(os.getenv('SCRAPE_LOG_QUEUE_SIZE', '10000'))
+# Parent of every module logger
+ROOT_LOGGER = 'beatbnk'
+
+
+def _parse_pairs(spec: str) -> dict:
+    """Parses "a=1,b=2" into {'a': '1', 'b': '2'}, ignoring blanks."""
+    pairs = {}
+    for item in spec.split(','):
+        name, _, value = item.partition('=')
+        if name.strip() and value.strip():
+            pairs[name.strip()] = value.strip()
+    return pairs
+
+
+SAMPLE_RATES = {**DEFAULT_SAMPLE_RATES,
+                **{name: float(rate) for name, rate in _parse_pairs(LOG_SAMPLE_RATES).items()}}
+
+
+def _default(value):
+    """Serializes values the JSON encoder does not know: records via as_dict(), anything else as str."""
+    as_dict = getattr(value, 'as_dict', None)
+    if as_dict is not None:
+        return as_dict()
+    return str(value)
+
+
+if orjson is not None:
+    def _dumps(entry: dict) -> str:
+        return orjson.dumps(entry, default=_default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+else:
+    def _dumps(entry: dict) -> str:
+        return json.dumps(entry, default=_default, ensure_ascii=False, separators=(',', ':'))
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as one JSON object per line: ts, level, logger, pid, msg, then its fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'pid': record.process,
+            'msg': record.getMessage(),
+        }
+        for name, value in (getattr(record, 'fields', None) or {}).items():
+            entry.setdefault(name, value)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return _dumps(entry)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the writer thread without formatting or waiting.
+    The stdlib QueueHandler formats in the calling thread; here formatting and
+    serialization happen on the listener thread, so a log call costs one queue put.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class StructuredLogger:
+    """
+    A module logger whose calls take a fixed message plus keyword fields:
+
+        log.info("Upserted record", table='events', source_key=key)
+
+    Fields are only serialized (on the writer thread) if the record is written.
+    Pass sample='<kind>' on high-volume messages to keep only the SAMPLE_RATES
+    fraction of them.
+    """
+    __slots__ = ('logger',)
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+
+    def enabled_for(self, level: int) -> bool:
+        return self.logger.isEnabledFor(level)
+
+    def log(self, level: int, msg: str, sample: str = None, exc_info=False, **fields):
+        if not self.logger.isEnabledFor(level):
+            return
+        if sample is not None and random.random() >= SAMPLE_RATES.get(sample, 1.0):
+            return
+        self.logger.log(level, msg, exc_info=exc_info, extra={'fields': fields})
+
+    def debug(self, msg: str, **fields):
+        self.log(logging.DEBUG, msg, **fields)
+
+    def info(self, msg: str, **fields):
+        self.log(logging.INFO, msg, **fields)
+
+    def warning(self, msg: str, **fields):
+        self.log(logging.WARNING, msg, **fields)
+
+    def error(self, msg: str, **fields):
+        self.log(logging.ERROR, msg, **fields)
+
+    def exception(self, msg: str, **fields):
+        """Logs at ERROR with the traceback of the exception being handled."""
+        self.log(logging.ERROR, msg, exc_info=True, **fields)
+
+
+_handler = None
+_listener = None
+_configure_lock = threading.Lock()
+
+
+def configure_logging(level: str = LOG_LEVEL, levels: str = LOG_LEVELS, stream=None) -> NonBlockingQueueHandler:
+    """
+    Routes every module logger through one bounded queue to a JSON writer thread.
+    Safe to call more than once; only the first call takes effect.
+
+    Args:
+        level (str): Default level name for all modules.
+        levels (str): Per-module overrides as "module=LEVEL,...".
+        stream: Where JSON lines are written (defaults to stdout).
+
+    Returns:
+        NonBlockingQueueHandler: The shared handler (its `dropped` counts records lost to a full queue).
+    """
+    global _handler, _listener
+    with _configure_lock:
+        if _handler is not None:
+            return _handler
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(level.upper())
+        root.propagate = False
+        for module, module_level in _parse_pairs(levels).items():
+            logging.getLogger(f"{ROOT_LOGGER}.{module}").setLevel(module_level.upper())
+
+        writer = logging.StreamHandler(stream or sys.stdout)
+        writer.setFormatter(JsonFormatter())
+        log_queue = queue.Queue(LOG_QUEUE_SIZE)
+        _handler = NonBlockingQueueHandler(log_queue)
+        root.addHandler(_handler)
+        _listener = logging.handlers.QueueListener(log_queue, writer, respect_handler_level=True)
+        _listener.start()
+        # Write out whatever is still queued when the process exits
+        atexit.register(_listener.stop)
+        return _handler
+
+
+def get_logger(module: str) -> StructuredLogger:
+    """Returns the structured logger for a module (pass __name__), configuring logging on first use."""
+    configure_logging()
+    return StructuredLogger(logging.getLogger(f"{ROOT_LOGGER}.{module}"))
@@ -0,0 +1,49 @@
+from flask import Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# --- CONFIGURATION ---
+METRICS_ROUTE = '/metrics'
+# Latency buckets (in seconds) spanning in-memory classification up to slow API calls and DB batches
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Stages: api (one HTTP attempt), parse, classify, dedup, image (download + resize), db_upsert (one transaction)
+STAGE_SECONDS = Histogram('scrape_stage_seconds', 'Time spent in each scrape pipeline stage.', ['stage'],
+                          buckets=STAGE_BUCKETS)
+API_RESPONSES = Counter('ensemble_api_responses_total', 'EnsembleData API responses by HTTP status.', ['status'])
+API_RATE_LIMITED = Counter('ensemble_api_rate_limited_total', 'EnsembleData API 429 responses.')
+API_ERRORS = Counter('ensemble_api_errors_total', 'EnsembleData API calls that failed without a response.',
+                     ['reason'])
+CACHE_HITS = Counter('response_cache_hits_total', 'Detailed-info requests served from the response cache.')
+SCRAPE_RESULTS = Counter('scrape_profiles_total', 'Profiles processed, by outcome (upserted, queued, skipped, '
+                                                  'fresh, api_error, db_error, error).', ['status'])
+QUEUE_DEPTH = Gauge('scrape_queue_depth', 'Records waiting to be written, by queue.', ['queue'])
+
+
+def stage_timer(stage: str):
+    """Returns a context manager (also usable as a decorator) that observes the stage's duration."""
+    return STAGE_SECONDS.labels(stage).time()
+
+
+def record_api_response(status_code: int):
+    API_RESPONSES.labels(str(status_code)).inc()
+    if status_code == 429:
+        API_RATE_LIMITED.inc()
+
+
+def record_scrape(status: str):
+    SCRAPE_RESULTS.labels(status).inc()
+
+
+def track_queue_depth(queue: str, depth_function):
+    """Reports `depth_function()` as the depth of `queue` whenever metrics are scraped."""
+    QUEUE_DEPTH.labels(queue).set_function(depth_function)
+
+
+def register_metrics_route(server):
+    """Adds the Prometheus scrape endpoint to a Flask server."""
+
+    @server.route(METRICS_ROUTE)
+    def serve_metrics():
+        return Response(generate_latest(), content_type=CONTENT_TYPE_LATEST)
+
+    return serve_metrics
@@ -0,0 +1,115 @@
+import hashlib
+from operator import attrgetter
+
+
+def stable_id(source_key: str) -> int:
+    """Derives a positive 31-bit integer primary key from a record's natural key."""
+    return int.from_bytes(hashlib.sha256(source_key.encode('utf-8')).digest()[:4], 'big') & 0x7FFFFFFF
+
+
+def _profile_key(profile_data: dict) -> str:
+    return str(profile_data.get('id') or profile_data.get('username'))
+
+
+def event_source_key(profile_data: dict, event_post: dict) -> str:
+    """Natural key of an event: the Instagram profile ID and the ID of the post it was built from."""
+    post_id = (event_post or {}).get('id') or 'profile'
+    return f"instagram:event:{_profile_key(profile_data)}:{post_id}"
+
+
+def venue_source_key(profile_data: dict) -> str:
+    """Natural key of a venue: the Instagram profile ID."""
+    return f"instagram:venue:{_profile_key(profile_data)}"
+
+
+class ScrapeRecord:
+    """
+    Base class for the rows the scrapers write. Subclasses list their table columns,
+    in INSERT order, in COLUMNS and reuse it as __slots__, so a record carries no
+    per-instance dict and converts to a parameter tuple with one precomputed getter.
+    """
+    __slots__ = ()
+    RECORD_TYPE = None
+    TABLE = None
+    COLUMNS = ()
+    # Unique natural key that upserts conflict on
+    KEY_COLUMN = 'sourceKey'
+    # Written on insert, never overwritten by a later upsert
+    INSERT_ONLY_COLUMNS = ('id', 'createdAt')
+    # Regenerated on every scrape; a difference in these alone does not rewrite the row
+    VOLATILE_COLUMNS = ('updatedAt',)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._column_set = frozenset(cls.COLUMNS)
+        cls._params = attrgetter(*cls.COLUMNS) if cls.COLUMNS else None
+        cls.COMPARE_COLUMNS = tuple(
+            column for column in cls.COLUMNS
+            if column != cls.KEY_COLUMN and column not in cls.INSERT_ONLY_COLUMNS + cls.VOLATILE_COLUMNS
+        )
+
+    def __init__(self, **values):
+        unknown = values.keys() - self._column_set
+        if unknown:
+            raise TypeError(f"{type(self).__name__} has no column(s): {', '.join(sorted(unknown))}")
+        for column in self.COLUMNS:
+            setattr(self, column, values.get(column))
+
+    def as_params(self) -> tuple:
+        """Returns the column values in COLUMNS order, ready to bind to an INSERT."""
+        return self._params(self)
+
+    def as_dict(self) -> dict:
+        """Returns a column name to value mapping (for logging and hashing)."""
+        return dict(zip(self.COLUMNS, self.as_params()))
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.as_params() == other.as_params()
+
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ', '.join(f"{column}={value!r}" for column, value in zip(self.COLUMNS, self.as_params()))
+        return f"{type(self).__name__}({fields})"
+
+
+class EventRecord(ScrapeRecord):
+    """A row of the events table."""
+    RECORD_TYPE = "event"
+    TABLE = "events"
+    COLUMNS = (
+        'id', 'sourceKey', 'performerId', 'eventName', 'description', 'minAmount', 'eventDate', 'posterUrl', 'createdBy',
+        'deletedAt', 'createdAt', 'updatedAt', 'isPaid', 'ticketingURL', 'eventQRCode', 'eventStatus',
+        'previousEventDate', 'previousStartTime', 'previousEndTime', 'startTime', 'endTime', 'venueId',
+    )
+    __slots__ = COLUMNS
+
+    @property
+    def name(self):
+        return self.eventName
+
+    @property
+    def image_url(self):
+        return self.posterUrl
+
+
+class VenueRecord(ScrapeRecord):
+    """A row of the venues table."""
+    RECORD_TYPE = "venue"
+    TABLE = "venues"
+    COLUMNS = (
+        'id', 'sourceKey', 'userId', 'venueName', 'email', 'phoneNumber', 'address', 'openHours', 'closingHours',
+        'latitude', 'longitude', 'capacity', 'description', 'website', 'profileImageUrl', 'coverImageUrl',
+        'allowsDirectBookings', 'createdAt', 'updatedAt', 'deletedAt',
+    )
+    __slots__ = COLUMNS
+
+    @property
+    def name(self):
+        return self.venueName
+
+    @property
+    def image_url(self):
+        return self.profileImageUrl
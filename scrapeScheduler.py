@@ -0,0 +1,126 @@
+import heapq
+import time
+
+from changeState import ChangeStateStore, get_state_store
+from instaScrapper import PLACES_TO_SCRAPE, process_user
+from scrapeLogging import get_logger
+
+log = get_logger(__name__)
+
+# --- CONFIGURATION ---
+# Bounds on how often a single profile is polled (in seconds)
+MIN_INTERVAL = 15 * 60
+MAX_INTERVAL = 24 * 60 * 60
+# Starting interval for profiles with no history yet (the old fixed 2-hour cycle)
+DEFAULT_INTERVAL = 2 * 60 * 60
+# Ceiling while a profile advertises an upcoming event
+EVENT_INTERVAL = 30 * 60
+# Interval growth after a poll that found nothing new, and after a failed poll
+UNCHANGED_BACKOFF = 1.5
+ERROR_BACKOFF = 2.0
+
+
+def posting_signals(scraped_json: dict) -> tuple:
+    """
+    Extracts scheduling signals from a detailed-info payload.
+
+    Returns:
+        tuple: (mean seconds between recent posts or None, whether any recent post has an upcoming event)
+    """
+    try:
+        edges = scraped_json['data'].get('edge_owner_to_timeline_media', {}).get('edges', [])
+    except (KeyError, TypeError, AttributeError):
+        return None, False
+
+    nodes = [edge.get('node', {}) for edge in edges[:12]]
+    has_upcoming_event = any(node.get('has_upcoming_event') for node in nodes)
+    timestamps = sorted((node['taken_at_timestamp'] for node in nodes if node.get('taken_at_timestamp')),
+                        reverse=True)
+    if len(timestamps) < 2:
+        return None, has_upcoming_event
+    mean_gap = (timestamps[0] - timestamps[-1]) / (len(timestamps) - 1)
+    return mean_gap, has_upcoming_event
+
+
+def next_interval(current: float, status: str, scraped_json: dict) -> float:
+    """
+    Picks the next poll interval for a profile from the outcome of its last poll.
+    Profiles are polled about twice per typical gap between their posts, faster while
+    an event is upcoming, and progressively slower while nothing changes.
+    """
+    if status in ("api_error", "db_error", "error"):
+        return min(MAX_INTERVAL, current * ERROR_BACKOFF)
+
+    mean_gap, has_upcoming_event = posting_signals(scraped_json) if scraped_json else (None, False)
+    interval = mean_gap / 2 if mean_gap else current
+    if status == "skipped":
+        interval = max(interval, current * UNCHANGED_BACKOFF)
+    if has_upcoming_event:
+        interval = min(interval, EVENT_INTERVAL)
+    return max(MIN_INTERVAL, min(MAX_INTERVAL, interval))
+
+
+class ScrapeScheduler:
+    """
+    Polls profiles from a heap ordered by next-due time, adapting each profile's
+    interval to how often it posts and whether it has an upcoming event.
+    """
+
+    def __init__(self, usernames: list, state: ChangeStateStore = None):
+        """
+        Seeds the heap, resuming from the last fetch times in the change-detection state.
+
+        Args:
+            usernames (list): Instagram usernames to poll.
+            state (ChangeStateStore): Durable scrape state; defaults to the shared store.
+        """
+        self.state = state or get_state_store()
+        self.intervals = {}
+        self.heap = []
+        now = time.time()
+        for username in dict.fromkeys(usernames):
+            self.add_profile(username, now)
+
+    def add_profile(self, username: str, now: float = None):
+        """Schedules a profile; it is due immediately unless it was fetched recently."""
+        if username in self.intervals:
+            return
+        now = now or time.time()
+        self.intervals[username] = DEFAULT_INTERVAL
+        saved = self.state.get(username)
+        last_fetched_at = saved['last_fetched_at'] if saved else None
+        next_due = last_fetched_at + DEFAULT_INTERVAL if last_fetched_at else now
+        heapq.heappush(self.heap, (max(now, next_due), username))
+
+    def run_once(self):
+        """
+        Waits for the next due profile, scrapes it and reschedules it.
+
+        Returns:
+            tuple: (username, status, seconds until the profile is due again)
+        """
+        next_due, username = heapq.heappop(self.heap)
+        wait = next_due - time.time()
+        if wait > 0:
+            log.info("⏳ Waiting for the next due profile", username=username, wait_seconds=round(wait))
+            time.sleep(wait)
+
+        # The scheduler decides when a profile is due, so the refetch guard is disabled here
+        status, scraped_json = process_user(username, self.state, min_refetch_seconds=0)
+
+        interval = next_interval(self.intervals[username], status, scraped_json)
+        self.intervals[username] = interval
+        heapq.heappush(self.heap, (time.time() + interval, username))
+        log.info("🗓️ Profile rescheduled", username=username, status=status,
+                 next_poll_minutes=round(interval / 60))
+        return username, status, interval
+
+    def run_forever(self):
+        """Runs the scheduling loop until interrupted."""
+        log.info("Scheduler started", profiles=len(self.heap))
+        while self.heap:
+            self.run_once()
+
+
+if __name__ == "__main__":
+    ScrapeScheduler(PLACES_TO_SCRAPE).run_forever()
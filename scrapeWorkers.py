@@ -0,0 +1,279 @@
+import bisect
+import hashlib
+import multiprocessing
+import os
+import socket
+import time
+import zlib
+
+from changeState import get_state_store
+from instaScrapper import PLACES_TO_SCRAPE, db_connection_params, process_user
+from postGresConnection import Database, get_pool
+from rateLimiter import ENSEMBLE_LIMITER
+from scrapeLogging import get_logger
+from scrapeScheduler import DEFAULT_INTERVAL, next_interval
+
+log = get_logger(__name__)
+
+# --- CONFIGURATION ---
+# Worker processes started on this host by run_worker_pool
+WORKER_PROCESSES = int(os.getenv('SCRAPE_WORKER_PROCESSES', str(os.cpu_count() or 1)))
+# Usernames hash into this many fixed slots; the ring assigns slots to live workers
+HASH_SLOTS = 1024
+# Points per worker on the consistent-hash ring
+RING_REPLICAS = 64
+# A worker that has not heartbeated for this long is dropped from the ring (in seconds)
+WORKER_HEARTBEAT_TTL = 60
+# A claimed profile not finished within this long can be claimed again (in seconds)
+CLAIM_LEASE_SECONDS = 15 * 60
+# Sleep between polls when no owned profile is due (in seconds)
+IDLE_SLEEP = 10.0
+
+
+def username_slot(username: str) -> int:
+    """Returns the fixed hash slot of a username."""
+    return zlib.crc32(username.lower().encode('utf-8')) % HASH_SLOTS
+
+
+class HashRing:
+    """
+    Consistent hashing of slots onto workers: adding or removing one of N workers
+    only moves about 1/N of the slots.
+    """
+
+    def __init__(self, members: list, replicas: int = RING_REPLICAS):
+        self.members = sorted(members)
+        points = sorted(
+            (self._hash(f"{member}#{replica}"), member) for member in self.members for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [member for _, member in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+    def owner(self, key: str) -> str:
+        """Returns the member responsible for `key`, or None if the ring is empty."""
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, self._hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+    def slots_for(self, member: str) -> list:
+        """Returns every slot the member owns."""
+        return [slot for slot in range(HASH_SLOTS) if self.owner(f"slot:{slot}") == member]
+
+
+def ensure_work_tables(db: Database):
+    """Creates the shared work-queue and worker-membership tables if they are missing, and commits."""
+    cursor = db.connection.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS scrape_queue (
+            username TEXT PRIMARY KEY,
+            slot INTEGER NOT NULL,
+            due_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            interval_seconds DOUBLE PRECISION NOT NULL,
+            leased_by TEXT,
+            leased_until TIMESTAMPTZ,
+            last_status TEXT,
+            last_scraped_at TIMESTAMPTZ
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS scrape_queue_due ON scrape_queue (slot, due_at)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS scrape_workers (
+            worker_id TEXT PRIMARY KEY,
+            host TEXT,
+            pid INTEGER,
+            heartbeat_at TIMESTAMPTZ NOT NULL
+        )
+    """)
+    db.connection.commit()
+    cursor.close()
+
+
+def seed_work_queue(db_params: dict, usernames: list) -> int:
+    """
+    Adds profiles to the shared work queue, due immediately; existing entries keep their schedule.
+
+    Returns:
+        int: The number of profiles newly added.
+    """
+    with Database(db_params, pool=get_pool(db_params)) as db:
+        ensure_work_tables(db)
+        db.cursor = db.connection.cursor()
+        added = 0
+        for username in dict.fromkeys(usernames):
+            db.cursor.execute(
+                "INSERT INTO scrape_queue (username, slot, interval_seconds) VALUES (%s, %s, %s) "
+                "ON CONFLICT (username) DO NOTHING",
+                (username, username_slot(username), DEFAULT_INTERVAL),
+            )
+            added += db.cursor.rowcount
+        db.connection.commit()
+    return added
+
+
+class ScrapeWorker:
+    """
+    One scrape worker process. Workers register in scrape_workers, build the same
+    consistent-hash ring from the live members, and only claim profiles in the slots
+    they own. Claims go through FOR UPDATE SKIP LOCKED plus a lease, so two workers
+    never scrape the same profile even while membership is changing. Every worker limits
+    itself to its share of the API rate and daily units, so together they stay within them.
+    """
+
+    def __init__(self, worker_id: str, db_params: dict = db_connection_params, state=None):
+        self.worker_id = worker_id
+        self.db_params = db_params
+        self.state = state or get_state_store()
+        self.ring = None
+        self.slots = []
+
+    def _database(self) -> Database:
+        return Database(self.db_params, pool=get_pool(self.db_params))
+
+    def heartbeat(self):
+        """
+        Refreshes this worker's membership. If the live members changed, recomputes its slots
+        and its share of the API rate limit and budget.
+        """
+        with self._database() as db:
+            db.cursor = db.connection.cursor()
+            db.cursor.execute(
+                "INSERT INTO scrape_workers (worker_id, host, pid, heartbeat_at) VALUES (%s, %s, %s, now()) "
+                "ON CONFLICT (worker_id) DO UPDATE SET heartbeat_at = now(), pid = excluded.pid",
+                (self.worker_id, socket.gethostname(), os.getpid()),
+            )
+            db.cursor.execute(
+                "SELECT worker_id FROM scrape_workers WHERE heartbeat_at > now() - %s * interval '1 second'",
+                (WORKER_HEARTBEAT_TTL,),
+            )
+            members = [row[0] for row in db.cursor.fetchall()]
+            db.connection.commit()
+
+        if self.ring is None or self.ring.members != sorted(members):
+            self.ring = HashRing(members)
+            self.slots = self.ring.slots_for(self.worker_id)
+            ENSEMBLE_LIMITER.set_share(len(members))
+            log.info("🧩 Worker slots reassigned", worker_id=self.worker_id, slots=len(self.slots),
+                     total_slots=HASH_SLOTS, live_workers=len(members),
+                     max_rps=round(ENSEMBLE_LIMITER.bucket.max_rate, 3),
+                     daily_units=ENSEMBLE_LIMITER.budget.daily_limit)
+
+    def claim(self) -> tuple:
+        """
+        Leases the most overdue profile in this worker's slots.
+
+        Returns:
+            tuple: (username, current interval in seconds), or None if nothing is due.
+        """
+        if not self.slots:
+            return None
+        with self._database() as db:
+            db.cursor = db.connection.cursor()
+            db.cursor.execute(
+                "UPDATE scrape_queue SET leased_by = %s, leased_until = now() + %s * interval '1 second' "
+                "WHERE username = ("
+                "    SELECT username FROM scrape_queue"
+                "    WHERE slot = ANY(%s) AND due_at <= now()"
+                "      AND (leased_until IS NULL OR leased_until < now())"
+                "    ORDER BY due_at LIMIT 1 FOR UPDATE SKIP LOCKED"
+                ") RETURNING username, interval_seconds",
+                (self.worker_id, CLAIM_LEASE_SECONDS, self.slots),
+            )
+            row = db.cursor.fetchone()
+            db.connection.commit()
+        return row
+
+    def finish(self, username: str, status: str, interval: float):
+        """Releases a claimed profile and schedules its next scrape."""
+        with self._database() as db:
+            db.cursor = db.connection.cursor()
+            db.cursor.execute(
+                "UPDATE scrape_queue SET due_at = now() + %s * interval '1 second', interval_seconds = %s, "
+                "last_status = %s, last_scraped_at = now(), leased_by = NULL, leased_until = NULL "
+                "WHERE username = %s AND leased_by = %s",
+                (interval, interval, status, username, self.worker_id),
+            )
+            db.connection.commit()
+
+    def run_once(self) -> bool:
+        """
+        Scrapes one due profile, if any.
+
+        Returns:
+            bool: True if a profile was scraped.
+        """
+        self.heartbeat()
+        claimed = self.claim()
+        if claimed is None:
+            return False
+        username, interval = claimed
+        # The queue decides when a profile is due, so the refetch guard is disabled here
+        status, scraped_json = process_user(username, self.state, min_refetch_seconds=0)
+        interval = next_interval(interval, status, scraped_json)
+        self.finish(username, status, interval)
+        log.info("🗓️ Profile rescheduled", worker_id=self.worker_id, username=username, status=status,
+                 next_poll_minutes=round(interval / 60))
+        return True
+
+    def leave(self):
+        """Removes this worker from the ring so its slots move to the others right away."""
+        with self._database() as db:
+            db.cursor = db.connection.cursor()
+            db.cursor.execute("DELETE FROM scrape_workers WHERE worker_id = %s", (self.worker_id,))
+            db.connection.commit()
+
+    def run_forever(self):
+        """Runs the claim/scrape loop until interrupted."""
+        log.info("Worker started", worker_id=self.worker_id)
+        with self._database() as db:
+            ensure_work_tables(db)
+        try:
+            while True:
+                try:
+                    scraped = self.run_once()
+                except Exception as e:
+                    log.exception("❌ Worker loop error", worker_id=self.worker_id, error=str(e))
+                    scraped = False
+                if not scraped:
+                    time.sleep(IDLE_SLEEP)
+        finally:
+            self.leave()
+
+
+def _worker_main(worker_id: str):
+    try:
+        ScrapeWorker(worker_id).run_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def run_worker_pool(processes: int = WORKER_PROCESSES, usernames: list = None):
+    """
+    Seeds the work queue and runs `processes` workers on this host until interrupted.
+    Start the same command on other hosts to scale out; they join the ring through Postgres.
+    """
+    if usernames:
+        added = seed_work_queue(db_connection_params, usernames)
+        log.info("📋 Profiles added to the shared work queue", added=added)
+
+    # Spawned (not forked) children open their own pools, SQLite handles and threads
+    context = multiprocessing.get_context('spawn')
+    host = socket.gethostname()
+    workers = [context.Process(target=_worker_main, args=(f"{host}-{os.getpid()}-{i}",), name=f"scrape-worker-{i}")
+               for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.join(timeout=10)
+
+
+if __name__ == "__main__":
+    run_worker_pool(usernames=PLACES_TO_SCRAPE)
@@ -0,0 +1,87 @@
+import unittest
+from datetime import datetime
+
+from captionDates import LATE_END_HOUR, NO_EVENT_TIMES, VENUE_TIMEZONE, parse_event_times, scan_caption
+
+# Wednesday 11 December 2024, noon in the venues' timezone
+POSTED_AT = datetime(2024, 12, 11, 12, 0, tzinfo=VENUE_TIMEZONE).timestamp()
+
+
+def _at(*args) -> datetime:
+    return datetime(*args, tzinfo=VENUE_TIMEZONE)
+
+
+class CaptionDatesTest(unittest.TestCase):
+
+    def assertTimes(self, caption, event_date, start_time=None, end_time=None, posted_at=POSTED_AT):
+        self.assertEqual(tuple(parse_event_times(caption, posted_at)), (event_date, start_time, end_time))
+
+    def test_explicit_dates(self):
+        self.assertTimes("Sat 14th Dec 8PM", _at(2024, 12, 14), _at(2024, 12, 14, 20))
+        self.assertTimes("Dec 20, 2025 at 21:30", _at(2025, 12, 20), _at(2025, 12, 20, 21, 30))
+        self.assertTimes("See you on 21/12", _at(2024, 12, 21))
+        self.assertTimes("14th of December", _at(2024, 12, 14))
+
+    def test_numeric_dates_need_a_cue(self):
+        self.assertTimes("Sat 21/12", _at(2024, 12, 21))
+        self.assertTimes("Jumamosi 21/12", _at(2024, 12, 21))
+        self.assertTimes("Party 21/12/2024", _at(2024, 12, 21))
+        self.assertIsNone(scan_caption("Table for 4/6 people"))
+        # Opening hours and ratings are not dates, even next to a cue
+        self.assertIsNone(scan_caption("Open 24/7"))
+        self.assertIsNone(scan_caption("Rated 10/10"))
+        self.assertIsNone(scan_caption("Open on 24/7, rated on 9/10"))
+
+    def test_weekday_phrase_wins_over_a_numeric_date(self):
+        self.assertTimes("Karaoke this Friday 8pm. Open 24/7", _at(2024, 12, 13), _at(2024, 12, 13, 20))
+        self.assertTimes("This Friday, and again on 20/12", _at(2024, 12, 13))
+        # A month name is no weaker than a weekday
+        self.assertTimes("This Friday, and again on 20th Dec", _at(2024, 12, 20))
+
+    def test_dates_long_past_belong_to_next_year(self):
+        self.assertTimes("Back on 5th Jan", _at(2025, 1, 5))
+        # Within the grace period a past date stays in the post's year
+        self.assertTimes("Thanks for coming on 1st Dec", _at(2024, 12, 1))
+
+    def test_relative_days(self):
+        self.assertTimes("Tonight from 9pm", _at(2024, 12, 11), _at(2024, 12, 11, 21))
+        self.assertTimes("Tomorrow!", _at(2024, 12, 12))
+        self.assertTimes("Kesho 7pm", _at(2024, 12, 12), _at(2024, 12, 12, 19))
+
+    def test_weekdays(self):
+        self.assertTimes("This Friday", _at(2024, 12, 13))
+        # The day of the post itself, unless "next" pushes it a week
+        self.assertTimes("Wednesday jazz", _at(2024, 12, 11))
+        self.assertTimes("Next Wednesday", _at(2024, 12, 18))
+        self.assertTimes("Jumamosi", _at(2024, 12, 14))
+
+    def test_time_ranges(self):
+        self.assertTimes("Fri 13th Dec 6pm - 10pm", _at(2024, 12, 13), _at(2024, 12, 13, 18), _at(2024, 12, 13, 22))
+        self.assertTimes("Fri 13/12 20:00 to 23:30hrs", _at(2024, 12, 13), _at(2024, 12, 13, 20),
+                         _at(2024, 12, 13, 23, 30))
+        # Two unrelated times are not a range
+        self.assertTimes("Doors 6pm, show starts 8pm", _at(2024, 12, 11), _at(2024, 12, 11, 18))
+
+    def test_ranges_past_midnight(self):
+        self.assertTimes("Sat 14th Dec 10pm till 4am", _at(2024, 12, 14), _at(2024, 12, 14, 22),
+                         _at(2024, 12, 15, 4))
+        self.assertTimes("Sat 14th Dec 9PM till late", _at(2024, 12, 14), _at(2024, 12, 14, 21),
+                         _at(2024, 12, 15, LATE_END_HOUR))
+
+    def test_twelve_oclock(self):
+        self.assertTimes("Today 12pm", _at(2024, 12, 11), _at(2024, 12, 11, 12))
+        self.assertTimes("Today 12am", _at(2024, 12, 11), _at(2024, 12, 11, 0))
+
+    def test_nothing_to_read(self):
+        self.assertEqual(parse_event_times("Our new brunch menu", POSTED_AT), NO_EVENT_TIMES)
+        self.assertEqual(parse_event_times("", POSTED_AT), NO_EVENT_TIMES)
+        self.assertEqual(parse_event_times("Tonight", None), NO_EVENT_TIMES)
+        # Version numbers, prices and URLs are not dates or times
+        self.assertIsNone(scan_caption("v2.30 costs 1,500/= see example.com/12/10"))
+
+    def test_invalid_dates_fall_back_to_weaker_signals(self):
+        self.assertTimes("Friday 31/02", _at(2024, 12, 13))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import batchUpserter
+import eventDedup
+from batchUpserter import UpsertBatcher
+from eventDedup import (CAPTION_SIMILARITY_THRESHOLD, IMAGE_DISTANCE_THRESHOLD, MINHASH_BINS, EventDeduplicator,
+                        caption_similarity, minhash_signature)
+from scrapeRecords import EventRecord, VenueRecord
+
+CAPTION = ("Afro house night at The Alchemist this Saturday with DJ Kaytrixx and friends. "
+           "Doors open 8pm, early bird tickets 500 bob, gate 1000. Dress code: all white.")
+
+
+def _event(source_key: str, description: str = CAPTION, day: int = 14, poster: str = None) -> EventRecord:
+    fields = dict.fromkeys(EventRecord.COLUMNS)
+    fields.update(sourceKey=source_key, description=description, eventDate=datetime(2024, 12, day), posterUrl=poster)
+    return EventRecord(**fields)
+
+
+class MinHashTest(unittest.TestCase):
+
+    def test_identical_and_reformatted_captions_match(self):
+        signature = minhash_signature(CAPTION)
+        self.assertEqual(len(signature), MINHASH_BINS)
+        self.assertEqual(caption_similarity(signature, minhash_signature(CAPTION)), 1.0)
+        # Case, accents and punctuation are normalized away
+        reformatted = CAPTION.upper().replace('.', ' !!').replace('Afro', 'Afró')
+        self.assertEqual(caption_similarity(signature, minhash_signature(reformatted)), 1.0)
+
+    def test_small_edits_stay_above_the_threshold(self):
+        edited = CAPTION + " Link in bio!"
+        self.assertGreaterEqual(caption_similarity(minhash_signature(CAPTION), minhash_signature(edited)),
+                                CAPTION_SIMILARITY_THRESHOLD)
+
+    def test_different_events_fall_below_the_threshold(self):
+        other = ("Jazz brunch at The Alchemist this Sunday with the Nairobi Horns Section. "
+                 "Brunch from 11am, bottomless mimosas 2500, kids eat free.")
+        self.assertLess(caption_similarity(minhash_signature(CAPTION), minhash_signature(other)),
+                        CAPTION_SIMILARITY_THRESHOLD)
+
+    def test_short_captions_are_not_compared(self):
+        self.assertIsNone(minhash_signature("Tonight!"))
+        self.assertIsNone(minhash_signature(""))
+
+
+class EventDeduplicatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.hashes = {}
+        patches = [
+            mock.patch.object(eventDedup, 'perceptual_hash', side_effect=self.hashes.get),
+            mock.patch.object(eventDedup, 'prefetch_thumbnails'),
+        ]
+        self.perceptual_hash, self.prefetch = [patch.start() for patch in patches]
+        for patch in patches:
+            self.addCleanup(patch.stop)
+        self.dedup = EventDeduplicator(os.path.join(self.dir.name, 'dedup.sqlite3'), image_hashes=True)
+
+    def tearDown(self):
+        self.dedup.close()
+        self.dir.cleanup()
+
+    def _kept(self, records, **kwargs) -> list:
+        return [record.sourceKey for record in self.dedup.filter(records, **kwargs)]
+
+    def test_reposted_caption_is_dropped(self):
+        self.assertEqual(self._kept([_event('a')]), ['a'])
+        self.assertEqual(self._kept([_event('b', CAPTION + " Tag your squad")]), [])
+        # A re-scrape of the original is an update; a re-scrape of the repost stays dropped
+        self.assertEqual(self._kept([_event('a'), _event('b')]), ['a'])
+
+    def test_duplicates_within_one_batch(self):
+        self.assertEqual(self._kept([_event('a'), _event('b'), _event('c', "Completely different words here")]),
+                         ['a', 'c'])
+
+    def test_same_caption_on_another_day_is_another_event(self):
+        self.assertEqual(self._kept([_event('a', day=14), _event('b', day=21)]), ['a', 'b'])
+
+    def test_posters_within_the_distance_threshold_match(self):
+        poster = 0xF0F0F0F0F0F0F0F0
+        # p2 differs from p1 in IMAGE_DISTANCE_THRESHOLD bits, p3 in one more
+        self.hashes.update({'p1': poster, 'p2': poster ^ ((1 << IMAGE_DISTANCE_THRESHOLD) - 1),
+                            'p3': poster ^ ((1 << (IMAGE_DISTANCE_THRESHOLD + 1)) - 1)})
+        self.assertEqual(self._kept([_event('a', "First flyer caption text", poster='p1')]), ['a'])
+        self.assertEqual(self._kept([_event('b', "Another promoter, other words", poster='p2')]), [])
+        self.assertEqual(self._kept([_event('c', "A third caption altogether", poster='p3')]), ['c'])
+
+    def test_generic_images_are_not_hashed(self):
+        self.hashes['pic'] = 0x1234
+        kept = self._kept([_event('a', "First event caption text", poster='pic'),
+                           _event('b', "Second unrelated event caption", poster='pic')], generic_images=['pic'])
+        self.assertEqual(kept, ['a', 'b'])
+        self.perceptual_hash.assert_not_called()
+
+    def test_posters_are_prefetched_for_new_events_only(self):
+        self.hashes.update({'p1': 1, 'p2': 2 ** 40})
+        self._kept([_event('a', "First event caption text", poster='p1')])
+        self._kept([_event('a', "First event caption text", poster='p1'),
+                    _event('b', "Second unrelated event caption", poster='p2')])
+        self.assertEqual([list(call.args[0]) for call in self.prefetch.call_args_list], [['p1'], ['p2']])
+
+    def test_other_records_pass_through(self):
+        venue = VenueRecord(**dict(dict.fromkeys(VenueRecord.COLUMNS), sourceKey='v'))
+        self.assertEqual(self.dedup.filter([venue]), [venue])
+
+
+class BatcherDeduplicationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.dedup = EventDeduplicator(os.path.join(self.dir.name, 'dedup.sqlite3'), image_hashes=False)
+        self.written = []
+        database = mock.MagicMock()
+        database.__enter__.return_value.upsert_many.side_effect = lambda table, rows: self.written.extend(
+            row.sourceKey for row in rows)
+        patches = [mock.patch.object(batchUpserter, 'Database', return_value=database),
+                   mock.patch.object(batchUpserter, 'get_pool')]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.batcher = UpsertBatcher({}, deduplicator=self.dedup)
+
+    def tearDown(self):
+        self.dedup.close()
+        self.dir.cleanup()
+
+    def test_duplicates_are_skipped_when_the_batch_flushes(self):
+        done = []
+        for key in ('a', 'b'):
+            self.batcher.add('event', _event(key), on_success=lambda key=key: done.append(key))
+        result = self.batcher.flush()
+        self.assertEqual(self.written, ['a'])
+        self.assertEqual([data.sourceKey for _, data in result.records], ['a'])
+        self.assertEqual([data.sourceKey for _, data in result.skipped], ['b'])
+        # A skipped record is settled too
+        self.assertEqual(done, ['a', 'b'])
+
+    def test_a_batch_of_duplicates_writes_nothing(self):
+        self.batcher.add('event', _event('a'))
+        self.batcher.flush()
+        self.batcher.add('event', _event('b'))
+        result = self.batcher.flush()
+        self.assertTrue(result.success)
+        self.assertEqual((result.records, len(result.skipped)), ([], 1))
+        self.assertEqual(self.written, ['a'])
+
+
+if __name__ == "__main__":
+    unittest.main()
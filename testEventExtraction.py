@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import instaScrapper
+from changeState import ChangeStateStore
+from eventDedup import EventDeduplicator
+from eventExtraction import caption_headline, select_event_posts
+from writeQueue import WriteBehindQueue
+
+
+def _node(post_id: str, taken_at: float = None, caption: str = None, **fields) -> dict:
+    node = {'id': post_id, 'taken_at_timestamp': taken_at, **fields}
+    if caption is not None:
+        node['edge_media_to_caption'] = {'edges': [{'node': {'text': caption}}]}
+    return node
+
+
+NODES = [
+    _node('1', 100, 'Concert this Friday, tickets at the door'),
+    _node('2', 200, 'Our new brunch menu'),
+    _node('3', 300, 'Quiet week', has_upcoming_event=True),
+    _node('4', 400, 'Festival lineup drops tonight'),
+]
+
+
+class SelectEventPostsTest(unittest.TestCase):
+
+    def test_without_a_mark_every_event_post_is_selected(self):
+        posts, newest = select_event_posts(NODES)
+        self.assertEqual([post['id'] for post in posts], ['1', '3', '4'])
+        self.assertEqual(newest, 400)
+
+    def test_only_posts_after_the_mark_are_considered(self):
+        posts, newest = select_event_posts(NODES, high_water=200)
+        self.assertEqual([post['id'] for post in posts], ['3', '4'])
+        self.assertEqual(newest, 400)
+        # The mark itself is exclusive
+        self.assertEqual([post['id'] for post in select_event_posts(NODES, high_water=300)[0]], ['4'])
+
+    def test_mark_never_moves_backwards(self):
+        self.assertEqual(select_event_posts(NODES, high_water=400), ([], 400))
+        self.assertEqual(select_event_posts(NODES[:1], high_water=500), ([], 500))
+        self.assertEqual(select_event_posts([]), ([], None))
+
+    def test_undated_posts_are_left_alone_past_a_mark(self):
+        undated = [_node('5', None, 'Party tonight')]
+        self.assertEqual(select_event_posts(undated, high_water=100), ([], 100))
+        posts, newest = select_event_posts(undated)
+        self.assertEqual([post['id'] for post in posts], ['5'])
+        self.assertIsNone(newest)
+
+    def test_caption_headline(self):
+        self.assertEqual(caption_headline("\n  Jazz Night  \nSaturday 8pm"), 'Jazz Night')
+        self.assertEqual(caption_headline("word " * 40, max_length=12), 'word word…')
+        self.assertEqual(caption_headline(''), '')
+
+
+class HighWaterMarkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.state = ChangeStateStore(os.path.join(self.dir.name, 'state.sqlite3'))
+        self.queue = WriteBehindQueue(os.path.join(self.dir.name, 'queue.sqlite3'))
+        self.dedup = EventDeduplicator(os.path.join(self.dir.name, 'dedup.sqlite3'), image_hashes=False)
+
+    def tearDown(self):
+        for store in (self.state, self.queue, self.dedup):
+            store.close()
+        self.dir.cleanup()
+
+    def test_stored_mark_only_advances(self):
+        self.assertIsNone(self.state.post_high_water('club'))
+        self.state.record_post_high_water('club', 300)
+        self.state.record_post_high_water('club', 200)
+        self.assertEqual(self.state.post_high_water('club'), 300)
+
+    def _handle(self, nodes):
+        scraped_json = {'data': {'id': '42', 'username': 'club', 'full_name': 'The Club',
+                                 'edge_owner_to_timeline_media': {'edges': [{'node': node} for node in nodes]}}}
+        with mock.patch.object(instaScrapper, 'get_deduplicator', return_value=self.dedup):
+            return instaScrapper.handle_scraped_json('club', scraped_json, self.state, write_queue=self.queue)
+
+    def test_each_event_post_is_extracted_once(self):
+        status, record_type, records = self._handle(NODES[:3])
+        self.assertEqual((status, record_type), ('queued', 'event'))
+        self.assertEqual([record.sourceKey for record in records],
+                         [instaScrapper.event_source_key({'id': '42'}, NODES[i]) for i in (0, 2)])
+        self.assertEqual(self.state.post_high_water('club'), 300)
+
+        # The same posts again: nothing new to extract
+        self.assertEqual(self._handle(NODES[:3])[0], 'skipped')
+        # A newer post: only it is extracted
+        status, _, records = self._handle(NODES)
+        self.assertEqual(status, 'queued')
+        self.assertEqual([record.sourceKey for record in records],
+                         [instaScrapper.event_source_key({'id': '42'}, NODES[3])])
+        self.assertEqual(self.state.post_high_water('club'), 400)
+        self.assertEqual(len(self.queue), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
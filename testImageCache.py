@@ -0,0 +1,126 @@
+import io
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import requests
+from PIL import Image
+
+import imageCache
+from imageCache import fetch_thumbnail, load_thumbnail, prune_disk_cache, thumbnail_key
+
+
+def _jpeg(color: str) -> bytes:
+    buffer = io.BytesIO()
+    Image.new('RGB', (32, 32), color).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+class ImageCacheTestCase(unittest.TestCase):
+    """Points the cache at a fresh directory with empty in-memory state and a fake image server."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.now = 1000.0
+        self.served = {}
+        patches = [
+            mock.patch.object(imageCache, 'THUMBNAIL_DIR', directory.name),
+            mock.patch.object(imageCache, '_memory', imageCache.OrderedDict()),
+            mock.patch.object(imageCache, '_failures', {}),
+            mock.patch.object(imageCache, '_disk_bytes', None),
+            mock.patch.object(imageCache, '_last_prune', float('-inf')),
+            mock.patch.object(imageCache.time, 'monotonic', side_effect=lambda: self.now),
+            mock.patch.object(imageCache.requests, 'get', side_effect=self._get),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def _get(self, url, timeout):
+        if url not in self.served:
+            raise requests.exceptions.ConnectionError(f"cannot reach {url}")
+        return mock.Mock(content=self.served[url], raise_for_status=lambda: None)
+
+    def _on_disk(self, url: str) -> bool:
+        return os.path.exists(imageCache._disk_path(thumbnail_key(url)))
+
+    def _age(self, url: str, seconds: float):
+        """Backdates a cached thumbnail's last use and drops it from memory."""
+        key = thumbnail_key(url)
+        imageCache._memory.pop(key, None)
+        last_used = time.time() - seconds
+        os.utime(imageCache._disk_path(key), (last_used, last_used))
+
+
+class DiskCacheLimitTest(ImageCacheTestCase):
+
+    def test_least_recently_used_thumbnails_go_once_over_size(self):
+        urls = [f"https://cdn.example.com/{color}.jpg" for color in ('red', 'green', 'blue')]
+        for url, color in zip(urls, ('red', 'green', 'blue')):
+            self.served[url] = _jpeg(color)
+        size = len(imageCache._make_thumbnail(self.served[urls[0]]))
+
+        with mock.patch.object(imageCache, 'THUMBNAIL_DISK_MAX_BYTES', int(size * 2.5)):
+            fetch_thumbnail(urls[0])
+            fetch_thumbnail(urls[1])
+            self._age(urls[0], 60)
+            self._age(urls[1], 120)
+            # Reading the older one from disk makes it the most recently used
+            self.assertIsNotNone(load_thumbnail(thumbnail_key(urls[1])))
+            fetch_thumbnail(urls[2])
+
+        self.assertEqual([self._on_disk(url) for url in urls], [False, True, True])
+        self.assertLessEqual(imageCache._disk_bytes, size * 2.5)
+
+    def test_unused_thumbnails_expire(self):
+        urls = [f"https://cdn.example.com/{color}.jpg" for color in ('red', 'green', 'blue', 'white')]
+        for url, color in zip(urls, ('red', 'green', 'blue', 'white')):
+            self.served[url] = _jpeg(color)
+        fetch_thumbnail(urls[0])
+        fetch_thumbnail(urls[1])
+        self._age(urls[0], imageCache.THUMBNAIL_MAX_AGE + 60)
+
+        # Writes within the rescan interval leave the directory alone, the first one after it prunes
+        self.now += imageCache.PRUNE_INTERVAL - 1
+        fetch_thumbnail(urls[2])
+        self.assertTrue(self._on_disk(urls[0]))
+        self.now += 1
+        fetch_thumbnail(urls[3])
+        self.assertEqual([self._on_disk(url) for url in urls], [False, True, True, True])
+
+    def test_thumbnails_being_written_are_left_alone(self):
+        url = "https://cdn.example.com/red.jpg"
+        self.served[url] = _jpeg('red')
+        fetch_thumbnail(url)
+        tmp_path = imageCache._disk_path(thumbnail_key(url)) + ".123.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(b'partial')
+        with mock.patch.object(imageCache, 'THUMBNAIL_DISK_MAX_BYTES', 0):
+            prune_disk_cache()
+        self.assertEqual((self._on_disk(url), os.path.exists(tmp_path)), (False, True))
+
+
+class FailureCacheTest(ImageCacheTestCase):
+
+    def test_failed_urls_are_not_retried_within_the_ttl(self):
+        url = "https://cdn.example.com/missing.jpg"
+        self.assertIsNone(fetch_thumbnail(url))
+        self.served[url] = _jpeg('red')
+        self.now += imageCache.FAILURE_TTL - 1
+        self.assertIsNone(fetch_thumbnail(url))
+        self.now += 1
+        self.assertEqual(fetch_thumbnail(url), thumbnail_key(url))
+
+    def test_expired_failures_are_pruned(self):
+        for n in range(3):
+            fetch_thumbnail(f"https://cdn.example.com/missing-{n}.jpg")
+        self.now += imageCache.FAILURE_TTL
+        fetch_thumbnail("https://cdn.example.com/missing-again.jpg")
+        self.assertEqual(list(imageCache._failures), [thumbnail_key("https://cdn.example.com/missing-again.jpg")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+
+from keywordMatcher import (DEFAULT_WEIGHT, EVENT_CONFIDENCE_THRESHOLD, EVENT_MATCHER, STRONG_WEIGHT,
+                            WEAK_ONLY_CONFIDENCE_CAP, WEAK_WEIGHT, KeywordMatcher)
+
+
+class KeywordMatcherTest(unittest.TestCase):
+
+    def test_matches_whole_words_only(self):
+        self.assertEqual(EVENT_MATCHER.match("Free delivery on olive oil").keywords, [])
+        self.assertEqual(EVENT_MATCHER.match("Showroom opens").keywords, [])
+
+    def test_matches_plurals_case_and_spacing(self):
+        self.assertEqual(EVENT_MATCHER.match("Two CONCERTS this month").keywords, ['concert'])
+        self.assertEqual(EVENT_MATCHER.match("Live\n  Music every night").keywords, ['live music'])
+
+    def test_irregular_plurals_do_not_match(self):
+        # Only "s"/"es" suffixes are folded: "parties" is not "party"
+        self.assertEqual(EVENT_MATCHER.match("The best parties in town").keywords, [])
+
+    def test_phrase_wins_over_its_words(self):
+        result = EVENT_MATCHER.match("live music")
+        self.assertEqual(result.keywords, ['live music'])
+        self.assertAlmostEqual(result.confidence, STRONG_WEIGHT)
+
+    def test_confidence_combines_distinct_keywords(self):
+        result = EVENT_MATCHER.match("Tickets! Tickets! RSVP now")
+        self.assertEqual(result.keywords, ['tickets', 'rsvp'])
+        self.assertEqual(len(result.matches), 3)
+        self.assertAlmostEqual(result.confidence, 1 - (1 - STRONG_WEIGHT) ** 2)
+
+    def test_thresholds(self):
+        # A single weak keyword is not enough...
+        self.assertLess(EVENT_MATCHER.match("live").confidence, EVENT_CONFIDENCE_THRESHOLD)
+        self.assertLess(EVENT_MATCHER.match("summer sale").confidence, EVENT_CONFIDENCE_THRESHOLD)
+        # ...two weak ones still fall short, one default-weight keyword is enough
+        self.assertLess(EVENT_MATCHER.match("live game").confidence, EVENT_CONFIDENCE_THRESHOLD)
+        self.assertGreaterEqual(EVENT_MATCHER.match("workshop").confidence, EVENT_CONFIDENCE_THRESHOLD)
+        self.assertEqual(EVENT_CONFIDENCE_THRESHOLD, DEFAULT_WEIGHT)
+
+    def test_weak_keywords_alone_never_reach_the_threshold(self):
+        promo = EVENT_MATCHER.match("Flash sale on cocktails, special prices, live DJ")
+        self.assertEqual(promo.keywords, ['sale', 'special', 'live'])
+        self.assertAlmostEqual(promo.confidence, WEAK_ONLY_CONFIDENCE_CAP)
+        self.assertLess(promo.confidence, EVENT_CONFIDENCE_THRESHOLD)
+        everything_weak = EVENT_MATCHER.match("opening sale promotion special live match game vibe manzi")
+        self.assertLess(everything_weak.confidence, EVENT_CONFIDENCE_THRESHOLD)
+        # With one stronger keyword the weak ones count in full again
+        backed = EVENT_MATCHER.match("Flash sale on cocktails, special prices, live DJ. Join us!")
+        self.assertAlmostEqual(backed.confidence, 1 - (1 - DEFAULT_WEIGHT) * (1 - WEAK_WEIGHT) ** 3)
+
+    def test_swahili_and_sheng_keywords(self):
+        self.assertEqual(EVENT_MATCHER.match("Tamasha la leo usiku").keywords, ['tamasha', 'leo usiku'])
+        self.assertAlmostEqual(EVENT_MATCHER.match("vibe").confidence, WEAK_WEIGHT)
+
+    def test_match_many_matches_each_text_separately(self):
+        texts = ["a party", "", "live", "music festival"]
+        results = EVENT_MATCHER.match_many(texts)
+        self.assertEqual([result.keywords for result in results], [['party'], [], ['live'], ['festival']])
+        # Offsets are relative to each text
+        self.assertEqual(results[3].matches[0][1:], (6, 14))
+        for text, result in zip(texts, results):
+            self.assertEqual(result, EVENT_MATCHER.match(text))
+
+    def test_keywords_never_span_texts(self):
+        matcher = KeywordMatcher({'join us': 0.5})
+        self.assertEqual([result.keywords for result in matcher.match_many(["join", "us"])], [[], []])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,225 @@
+import threading
+import unittest
+from unittest import mock
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.pool
+import psycopg2.sql as sql
+
+import postGresConnection
+from postGresConnection import ConnectionPool, Database
+from scrapeRecords import EventRecord, stable_id
+
+
+class FakeCursor:
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query):
+        self.connection.on_ping()
+
+
+class FakeConnection:
+    """Stands in for a psycopg2 connection; `on_ping` and `on_rollback` run when the pool uses them."""
+
+    def __init__(self):
+        self.closed = 0
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        self.on_ping = self.on_rollback = lambda: None
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.on_rollback()
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def get_transaction_status(self):
+        return self.status
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.opened = []
+        connect = mock.patch.object(postGresConnection.psycopg2, 'connect', side_effect=self._connect)
+        connect.start()
+        self.addCleanup(connect.stop)
+        self.pool = ConnectionPool({}, min_size=0, max_size=2, health_check_after=0)
+
+    def _connect(self, **params):
+        self.opened.append(FakeConnection())
+        return self.opened[-1]
+
+    def _in_thread(self, target) -> threading.Thread:
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        return thread
+
+    def test_a_slow_ping_does_not_block_other_borrowers(self):
+        slow = self.pool.getconn()
+        self.pool.putconn(slow)
+        pinging, release = threading.Event(), threading.Event()
+        slow.on_ping = lambda: (pinging.set(), release.wait(5))
+        borrowed = []
+        thread = self._in_thread(lambda: borrowed.append(self.pool.getconn()))
+        self.assertTrue(pinging.wait(5))
+
+        # The ping is still running, yet another thread gets a fresh connection straight away
+        self.assertIsNot(self.pool.getconn(timeout=1), slow)
+        self.assertTrue(thread.is_alive())
+        release.set()
+        thread.join(5)
+        self.assertEqual(borrowed, [slow])
+
+    def test_a_failed_ping_discards_the_connection(self):
+        broken = self.pool.getconn()
+        self.pool.putconn(broken)
+        broken.on_ping = mock.Mock(side_effect=psycopg2.OperationalError("server closed the connection"))
+        connection = self.pool.getconn()
+        self.assertIsNot(connection, broken)
+        self.assertTrue(broken.closed)
+        # The broken connection's slot was freed
+        self.pool.getconn(timeout=0)
+        with self.assertRaises(psycopg2.pool.PoolError):
+            self.pool.getconn(timeout=0)
+
+    def test_a_slow_rollback_does_not_block_other_borrowers(self):
+        busy = self.pool.getconn()
+        busy.status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        rolling_back, release = threading.Event(), threading.Event()
+        busy.on_rollback = lambda: (rolling_back.set(), release.wait(5))
+        thread = self._in_thread(lambda: self.pool.putconn(busy))
+        self.assertTrue(rolling_back.wait(5))
+
+        self.assertIsNotNone(self.pool.getconn(timeout=1))
+        self.assertTrue(thread.is_alive())
+        release.set()
+        thread.join(5)
+        self.assertIs(self.pool.getconn(timeout=0), busy)
+
+    def test_a_failed_rollback_discards_the_connection(self):
+        broken = self.pool.getconn()
+        broken.status = psycopg2.extensions.TRANSACTION_STATUS_INERROR
+        broken.on_rollback = mock.Mock(side_effect=psycopg2.InterfaceError("connection already closed"))
+        self.pool.putconn(broken)
+        self.assertTrue(broken.closed)
+        self.assertIsNot(self.pool.getconn(), broken)
+
+
+def _render(query) -> str:
+    """Renders a psycopg2.sql composition without a live connection (identifiers unquoted)."""
+    if isinstance(query, sql.Composed):
+        return ''.join(map(_render, query.seq))
+    if isinstance(query, sql.SQL):
+        return query.string
+    if isinstance(query, sql.Identifier):
+        return '.'.join(query.strings)
+    return query
+
+
+class FakeEventsTable:
+    """
+    An events table with a primary key on id and a unique sourceKey, answering just the
+    statements Database.upsert_many sends: savepoints, the id lookups and the upsert itself.
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.saved = None
+        self.result = []
+
+    def execute(self, query, params=None):
+        query = _render(query)
+        if query == "SAVEPOINT upsert_ids":
+            self.saved = {row_id: dict(row) for row_id, row in self.rows.items()}
+        elif query == "ROLLBACK TO SAVEPOINT upsert_ids":
+            self.rows = self.saved
+        elif query.startswith("SELECT id, sourceKey FROM events"):
+            self.result = [(row_id, self.rows[row_id]['sourceKey']) for row_id in params[0] if row_id in self.rows]
+        elif query.startswith("SELECT 1 FROM events"):
+            self.result = [(1,)] if params[0] in self.rows else []
+        elif query != "RELEASE SAVEPOINT upsert_ids":
+            raise AssertionError(f"unexpected statement: {query}")
+
+    def fetchall(self):
+        return self.result
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def upsert(self, rows):
+        for values in rows:
+            row = dict(zip(EventRecord.COLUMNS, values))
+            current = next((stored for stored in self.rows.values() if stored['sourceKey'] == row['sourceKey']), None)
+            if current is not None:
+                current.update((column, value) for column, value in row.items()
+                               if column not in EventRecord.INSERT_ONLY_COLUMNS)
+            elif row['id'] in self.rows:
+                raise psycopg2.errors.UniqueViolation('duplicate key value violates unique constraint "events_pkey"')
+            else:
+                self.rows[row['id']] = row
+
+
+class DerivedIdCollisionTest(unittest.TestCase):
+
+    # Both keys are made to derive this id, as if their hashes collided
+    CLASHING_ID = 7
+
+    def setUp(self):
+        self.table = FakeEventsTable()
+        connection = mock.Mock(cursor=lambda: self.table)
+        patches = [
+            mock.patch.object(postGresConnection, '_cached_statement', return_value='upsert'),
+            mock.patch.object(postGresConnection, 'execute_values',
+                              side_effect=lambda cursor, query, rows, page_size: self.table.upsert(rows)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.db = Database({})
+        self.db.connection = connection
+
+    def _event(self, source_key: str, name: str) -> EventRecord:
+        return EventRecord(**dict(dict.fromkeys(EventRecord.COLUMNS), id=self.CLASHING_ID, sourceKey=source_key,
+                                  eventName=name))
+
+    def _names(self) -> dict:
+        return {row['sourceKey']: (row_id, row['eventName']) for row_id, row in self.table.rows.items()}
+
+    def test_second_key_gets_a_free_id_and_the_first_row_is_kept(self):
+        self.db.upsert_many('events', [self._event('a', 'First')])
+        self.db.upsert_many('events', [self._event('b', 'Second')])
+        self.assertEqual(self._names(), {'a': (self.CLASHING_ID, 'First'), 'b': (stable_id('b#1'), 'Second')})
+
+        # Re-scraping either key updates its own row in place
+        self.db.upsert_many('events', [self._event('b', 'Second, updated'), self._event('a', 'First, updated')])
+        self.assertEqual(self._names(), {'a': (self.CLASHING_ID, 'First, updated'),
+                                         'b': (stable_id('b#1'), 'Second, updated')})
+
+    def test_clash_within_one_batch(self):
+        self.db.upsert_many('events', [self._event('a', 'First'), self._event('b', 'Second')])
+        self.assertEqual(self._names(), {'a': (self.CLASHING_ID, 'First'), 'b': (stable_id('b#1'), 'Second')})
+
+    def test_taken_fallback_ids_are_skipped(self):
+        self.table.rows[stable_id('b#1')] = dict(self._event('z', 'Other').as_dict(), id=stable_id('b#1'))
+        self.db.upsert_many('events', [self._event('a', 'First')])
+        self.db.upsert_many('events', [self._event('b', 'Second')])
+        self.assertEqual(self._names()['b'], (stable_id('b#2'), 'Second'))
+        self.assertEqual(self._names()['z'], (stable_id('b#1'), 'Other'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import json
+import unittest
+
+from instaScrapper import classify_profile
+from profileParser import MAX_POSTS, compact_payload, compact_posts_page, parse_profile
+
+
+def _post(index: int, caption: str = None, **fields) -> dict:
+    node = {
+        'id': str(index),
+        'shortcode': f"sc{index}",
+        'taken_at_timestamp': 1700000000 + index,
+        'display_url': f"https://example.invalid/{index}.jpg",
+        'thumbnail_resources': [{'src': f"https://example.invalid/{index}_150.jpg", 'config_width': 150}],
+        'edge_liked_by': {'count': index},
+        **fields,
+    }
+    if caption is not None:
+        node['edge_media_to_caption'] = {'edges': [{'node': {'text': caption}}]}
+    return {'node': node}
+
+
+def _response(posts: list, **profile) -> bytes:
+    data = {
+        'id': '42',
+        'username': 'theclub',
+        'full_name': 'The Club',
+        'biography': 'Nairobi nights',
+        'profile_pic_url': 'https://example.invalid/pic.jpg',
+        'edge_followed_by': {'count': 1000},
+        'edge_owner_to_timeline_media': {'count': len(posts), 'edges': posts},
+        **profile,
+    }
+    return json.dumps({'data': data}).encode('utf-8')
+
+
+class CompactPayloadTest(unittest.TestCase):
+
+    def test_keeps_only_the_fields_the_scrapers_read(self):
+        raw = _response([_post(1, 'Party tonight', location={'id': 7, 'name': 'The Club', 'slug': 'the-club'},
+                               has_upcoming_event=True)])
+        data = compact_payload(raw)['data']
+        self.assertNotIn('edge_followed_by', data)
+        self.assertEqual(data['username'], 'theclub')
+        node = data['edge_owner_to_timeline_media']['edges'][0]['node']
+        self.assertEqual(node, {
+            'id': '1', 'has_upcoming_event': True, 'taken_at_timestamp': 1700000001,
+            'location': {'id': 7, 'name': 'The Club'}, 'display_url': 'https://example.invalid/1.jpg',
+            'edge_media_to_caption': {'edges': [{'node': {'text': 'Party tonight'}}]},
+        })
+
+    def test_caps_the_posts(self):
+        raw = _response([_post(i) for i in range(MAX_POSTS + 5)])
+        edges = compact_payload(raw)['data']['edge_owner_to_timeline_media']['edges']
+        self.assertEqual([edge['node']['id'] for edge in edges], [str(i) for i in range(MAX_POSTS)])
+        self.assertEqual(len(parse_profile(raw, max_posts=3).posts), 3)
+
+    def test_missing_fields_are_omitted(self):
+        raw = _response([_post(1)], full_name=None)
+        data = compact_payload(raw)['data']
+        self.assertNotIn('full_name', data)
+        self.assertNotIn('edge_media_to_caption', data['edge_owner_to_timeline_media']['edges'][0]['node'])
+
+    def test_error_payloads_are_returned_as_parsed(self):
+        self.assertEqual(compact_payload(b'{"detail": "quota exceeded"}'), {'detail': 'quota exceeded'})
+        self.assertEqual(compact_payload(b'{"data": null}'), {'data': None})
+        self.assertIsNone(parse_profile(b'[]'))
+        with self.assertRaises(json.JSONDecodeError):
+            compact_payload(b'not json')
+
+    def test_classification_is_unchanged_by_compaction(self):
+        raw = _response([_post(1, 'Quiet brunch'), _post(2, 'Live music this Saturday, tickets at the door')])
+        full = json.loads(raw)['data']
+        record_type, post, confidence, latest_post_id = classify_profile(compact_payload(raw)['data'])
+        full_type, full_post, full_confidence, full_latest_post_id = classify_profile(full)
+        self.assertEqual((record_type, post['id'], confidence, latest_post_id),
+                         (full_type, full_post['id'], full_confidence, full_latest_post_id))
+
+
+class CompactPostsPageTest(unittest.TestCase):
+
+    def test_returns_nodes_and_next_cursor(self):
+        raw = json.dumps({'data': {'posts': [_post(1, 'hello'), _post(2)], 'last_cursor': 'abc'}}).encode('utf-8')
+        nodes, cursor = compact_posts_page(raw)
+        self.assertEqual([node['id'] for node in nodes], ['1', '2'])
+        self.assertEqual(cursor, 'abc')
+
+    def test_empty_page_ends_the_history(self):
+        raw = json.dumps({'data': {'posts': [], 'last_cursor': 'abc'}}).encode('utf-8')
+        self.assertEqual(compact_posts_page(raw), ([], None))
+        self.assertEqual(compact_posts_page(b'{"error": "private"}'), ([], None))
+
+
+if __name__ == "__main__":
+    unittest.main()
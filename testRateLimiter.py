@@ -0,0 +1,169 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import rateLimiter
+from rateLimiter import (BudgetExhaustedError, CircuitBreaker, CircuitOpenError, RateLimiter, TokenBucket,
+                         UnitBudget)
+
+
+class FakeClockTestCase(unittest.TestCase):
+    """Runs rateLimiter on a clock that only moves when the test says so."""
+
+    def setUp(self):
+        self.now = 1000.0
+        self.today = datetime(2024, 12, 11, 12, tzinfo=timezone.utc)
+        self.slept = []
+        patches = [
+            mock.patch.object(rateLimiter.time, 'monotonic', side_effect=lambda: self.now),
+            mock.patch.object(rateLimiter.time, 'sleep', side_effect=self.slept.append),
+            mock.patch.object(rateLimiter, 'datetime', mock.Mock(now=lambda tz=None: self.today)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+
+class TokenBucketTest(FakeClockTestCase):
+
+    def test_burst_then_waits_for_refill(self):
+        bucket = TokenBucket(rate=2, capacity=3)
+        self.assertEqual([bucket.reserve() for _ in range(3)], [0.0, 0.0, 0.0])
+        # Every further request waits its turn behind the debt already taken on
+        self.assertEqual([bucket.reserve() for _ in range(2)], [0.5, 1.0])
+        self.now += 1.0
+        self.assertEqual(bucket.reserve(), 0.5)
+
+    def test_refill_is_capped_at_capacity(self):
+        bucket = TokenBucket(rate=2, capacity=3)
+        bucket.reserve(3)
+        self.now += 60
+        self.assertEqual([bucket.reserve() for _ in range(4)], [0.0, 0.0, 0.0, 0.5])
+
+    def test_slow_down_and_speed_up(self):
+        bucket = TokenBucket(rate=4, capacity=1, min_rate=1)
+        for _ in range(5):
+            bucket.slow_down()
+        self.assertEqual(bucket.rate, 1)
+        for _ in range(200):
+            bucket.speed_up()
+        self.assertEqual(bucket.rate, 4)
+
+    def test_resize_scales_the_adapted_rate(self):
+        bucket = TokenBucket(rate=4, capacity=8, min_rate=0.5)
+        bucket.slow_down()
+        bucket.resize(2, 4)
+        self.assertEqual((bucket.max_rate, bucket.rate, bucket.capacity, bucket.tokens), (2, 1, 4, 4))
+        # The floor never rises above the new maximum
+        bucket.resize(0.25, 1)
+        self.assertEqual((bucket.min_rate, bucket.rate), (0.25, 0.25))
+
+
+class UnitBudgetTest(FakeClockTestCase):
+
+    def test_spending_past_the_limit_is_refused(self):
+        budget = UnitBudget(daily_limit=10)
+        budget.spend(7)
+        self.assertEqual(budget.remaining, 3)
+        with self.assertRaises(BudgetExhaustedError):
+            budget.spend(4)
+        # A refused call spends nothing
+        budget.spend(3)
+        self.assertEqual(budget.remaining, 0)
+
+    def test_budget_resets_each_utc_day(self):
+        budget = UnitBudget(daily_limit=10)
+        budget.spend(10)
+        self.today += timedelta(days=1)
+        budget.spend(10)
+        self.assertEqual(budget.remaining, 0)
+
+    def test_zero_limit_is_unlimited(self):
+        budget = UnitBudget(daily_limit=0)
+        budget.spend(10 ** 9)
+        self.assertIsNone(budget.remaining)
+
+
+class CircuitBreakerTest(FakeClockTestCase):
+
+    def test_open_half_open_closed(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_seconds=30)
+        for _ in range(2):
+            breaker.record_failure()
+        self.assertFalse(breaker.allow('api'))
+
+        breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            breaker.allow('api')
+
+        # Half-open after the reset period: exactly one trial goes through
+        self.now += 30
+        self.assertTrue(breaker.allow('api'))
+        with self.assertRaises(CircuitOpenError):
+            breaker.allow('api')
+        breaker.record_success()
+        self.assertFalse(breaker.allow('api'))
+
+    def test_failed_trial_reopens_the_circuit(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+        breaker.record_failure()
+        self.now += 30
+        self.assertTrue(breaker.allow('api'))
+        breaker.record_failure()
+        self.now += 29
+        with self.assertRaises(CircuitOpenError):
+            breaker.allow('api')
+        self.now += 1
+        self.assertTrue(breaker.allow('api'))
+
+    def test_cancelled_trial_frees_the_slot(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+        breaker.record_failure()
+        self.now += 30
+        self.assertTrue(breaker.allow('api'))
+        breaker.cancel_trial()
+        self.assertTrue(breaker.allow('api'))
+
+
+class RateLimiterTest(FakeClockTestCase):
+
+    def test_acquire_sleeps_once_the_burst_is_spent(self):
+        limiter = RateLimiter(rate=2, burst=2)
+        for _ in range(3):
+            limiter.acquire('api')
+        self.assertEqual(self.slept, [0.5])
+
+    def test_budget_refusal_cancels_the_half_open_trial(self):
+        limiter = RateLimiter(rate=2, burst=2, daily_units=1)
+        limiter.acquire('api')
+        for _ in range(rateLimiter.FAILURE_THRESHOLD):
+            limiter.record_error('api')
+        self.now += rateLimiter.CIRCUIT_RESET_SECONDS
+        with self.assertRaises(BudgetExhaustedError):
+            limiter.acquire('api')
+
+        # Once the budget resets the trial slot is still free, so the circuit can close again
+        self.today += timedelta(days=1)
+        limiter.acquire('api')
+        limiter.record_response('api', 200)
+        self.assertFalse(limiter._breaker('api').allow('api'))
+
+    def test_set_share_splits_rate_burst_and_units(self):
+        limiter = RateLimiter(rate=6, burst=9, daily_units=100)
+        limiter.set_share(3)
+        self.assertEqual((limiter.bucket.max_rate, limiter.bucket.capacity, limiter.budget.daily_limit), (2, 3, 33))
+        limiter.set_share(0)
+        self.assertEqual((limiter.bucket.max_rate, limiter.bucket.capacity, limiter.budget.daily_limit), (6, 9, 100))
+
+    def test_set_share_keeps_at_least_one_token_and_unit(self):
+        limiter = RateLimiter(rate=1, burst=2, daily_units=5)
+        limiter.set_share(10)
+        self.assertEqual((limiter.bucket.capacity, limiter.budget.daily_limit), (1.0, 1))
+        # Without a daily budget there is nothing to split
+        unlimited = RateLimiter(rate=1, burst=2, daily_units=0)
+        unlimited.set_share(10)
+        self.assertEqual(unlimited.budget.daily_limit, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
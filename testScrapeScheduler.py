@@ -0,0 +1,59 @@
+import unittest
+
+from scrapeScheduler import (DEFAULT_INTERVAL, ERROR_BACKOFF, EVENT_INTERVAL, MAX_INTERVAL, MIN_INTERVAL,
+                             UNCHANGED_BACKOFF, next_interval, posting_signals)
+
+HOUR = 60 * 60
+
+
+def _payload(gap: float = None, posts: int = 4, upcoming: bool = False) -> dict:
+    """A detailed-info payload with `posts` posts published `gap` seconds apart, newest first."""
+    nodes = [{'taken_at_timestamp': 1700000000 - i * gap if gap else None,
+              'has_upcoming_event': upcoming and i == 0} for i in range(posts)]
+    return {'data': {'edge_owner_to_timeline_media': {'edges': [{'node': node} for node in nodes]}}}
+
+
+class PostingSignalsTest(unittest.TestCase):
+
+    def test_mean_gap_and_upcoming_event(self):
+        self.assertEqual(posting_signals(_payload(gap=6 * HOUR)), (6 * HOUR, False))
+        self.assertEqual(posting_signals(_payload(gap=6 * HOUR, upcoming=True)), (6 * HOUR, True))
+
+    def test_too_few_dated_posts(self):
+        self.assertEqual(posting_signals(_payload(gap=HOUR, posts=1)), (None, False))
+        self.assertEqual(posting_signals(_payload(gap=None)), (None, False))
+        self.assertEqual(posting_signals({'error': 'private'}), (None, False))
+
+
+class NextIntervalTest(unittest.TestCase):
+
+    def test_polls_twice_per_posting_gap(self):
+        self.assertEqual(next_interval(DEFAULT_INTERVAL, 'upserted', _payload(gap=6 * HOUR)), 3 * HOUR)
+
+    def test_keeps_the_interval_without_signals(self):
+        self.assertEqual(next_interval(DEFAULT_INTERVAL, 'upserted', None), DEFAULT_INTERVAL)
+        self.assertEqual(next_interval(DEFAULT_INTERVAL, 'fresh', None), DEFAULT_INTERVAL)
+
+    def test_backs_off_while_nothing_changes(self):
+        self.assertEqual(next_interval(DEFAULT_INTERVAL, 'skipped', None), DEFAULT_INTERVAL * UNCHANGED_BACKOFF)
+        # A slow poster's own rhythm wins over the backoff when it is slower still
+        self.assertEqual(next_interval(DEFAULT_INTERVAL, 'skipped', _payload(gap=12 * HOUR)), 6 * HOUR)
+
+    def test_errors_back_off_regardless_of_signals(self):
+        for status in ('api_error', 'db_error', 'error'):
+            self.assertEqual(next_interval(DEFAULT_INTERVAL, status, _payload(gap=HOUR)),
+                             DEFAULT_INTERVAL * ERROR_BACKOFF)
+
+    def test_upcoming_event_caps_the_interval(self):
+        self.assertEqual(next_interval(DEFAULT_INTERVAL, 'skipped', _payload(gap=24 * HOUR, upcoming=True)),
+                         EVENT_INTERVAL)
+
+    def test_interval_stays_within_bounds(self):
+        self.assertEqual(next_interval(DEFAULT_INTERVAL, 'upserted', _payload(gap=60)), MIN_INTERVAL)
+        self.assertEqual(next_interval(MAX_INTERVAL, 'skipped', None), MAX_INTERVAL)
+        self.assertEqual(next_interval(MAX_INTERVAL, 'api_error', None), MAX_INTERVAL)
+        self.assertEqual(next_interval(DEFAULT_INTERVAL, 'upserted', _payload(gap=7 * 24 * HOUR)), MAX_INTERVAL)
+
+
+if __name__ == "__main__":
+    unittest.main()
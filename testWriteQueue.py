@@ -0,0 +1,142 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import psycopg2
+
+import writeQueue
+from batchUpserter import FlushResult
+from scrapeRecords import EventRecord
+from writeQueue import CLAIM_LEASE_SECONDS, FLUSH_RETRY_BASE, WriteBehindFlusher, WriteBehindQueue
+
+
+def _event(source_key: str) -> EventRecord:
+    return EventRecord(**dict(dict.fromkeys(EventRecord.COLUMNS), sourceKey=source_key, eventName=source_key))
+
+
+class QueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.queue = WriteBehindQueue(os.path.join(self.dir.name, 'queue.sqlite3'))
+        self.now = 1000.0
+        clock = mock.patch.object(writeQueue.time, 'time', side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def tearDown(self):
+        self.queue.close()
+        self.dir.cleanup()
+
+    def _enqueue(self, *keys) -> list:
+        return [self.queue.enqueue('event', _event(key), 'club', key, 'hash') for key in keys]
+
+    def _claimed_keys(self, limit=10) -> list:
+        return [entry[2].sourceKey for entry in self.queue.claim(limit)]
+
+
+class WriteBehindQueueTest(QueueTestCase):
+
+    def test_claim_returns_records_oldest_first(self):
+        self._enqueue('a', 'b', 'c')
+        entries = self.queue.claim(2)
+        self.assertEqual([(entry[1], entry[2].sourceKey, entry[3:]) for entry in entries],
+                         [('event', 'a', ('club', 'a', 'hash')), ('event', 'b', ('club', 'b', 'hash'))])
+        self.assertEqual(entries[0][2].eventName, 'a')
+
+    def test_claimed_entries_are_leased(self):
+        self._enqueue('a', 'b')
+        self.assertEqual(self._claimed_keys(1), ['a'])
+        self.assertEqual(self._claimed_keys(), ['b'])
+        self.assertEqual(self._claimed_keys(), [])
+        # A claim neither completed nor failed is handed out again once its lease runs out
+        self.now += CLAIM_LEASE_SECONDS
+        self.assertEqual(self._claimed_keys(), ['a', 'b'])
+
+    def test_complete_removes_entries(self):
+        entry_ids = self._enqueue('a', 'b')
+        self.queue.claim()
+        self.queue.complete(entry_ids[:1])
+        self.assertEqual(len(self.queue), 1)
+
+    def test_fail_backs_off_exponentially(self):
+        entry_id, = self._enqueue('a')
+        for attempt in range(3):
+            self.assertEqual(self._claimed_keys(), ['a'])
+            self.queue.fail([entry_id], 'boom')
+            delay = FLUSH_RETRY_BASE * 2 ** attempt
+            self.now += delay - 0.1
+            self.assertEqual(self._claimed_keys(), [])
+            self.now += 0.1
+
+    def test_entries_are_dead_lettered_after_max_attempts(self):
+        entry_id, = self._enqueue('a')
+        self.assertEqual(self.queue.fail([entry_id], 'bad row', max_attempts=2), 0)
+        self.assertEqual(self.queue.fail([entry_id], 'bad row', max_attempts=2), 1)
+        self.assertEqual((len(self.queue), self.queue.dead_letters()), (0, 1))
+
+        self.assertEqual(self.queue.requeue_dead(), 1)
+        self.assertEqual((len(self.queue), self.queue.dead_letters()), (1, 0))
+        self.assertEqual(self._claimed_keys(), ['a'])
+
+    def test_unlimited_attempts_are_never_dead_lettered(self):
+        entry_id, = self._enqueue('a')
+        for _ in range(20):
+            self.queue.fail([entry_id], 'unreachable', max_attempts=None)
+        self.assertEqual((len(self.queue), self.queue.dead_letters()), (1, 0))
+
+
+class WriteBehindFlusherTest(QueueTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.state = mock.Mock()
+        self.bad_keys = set()
+        self.unreachable = False
+        self.batches = []
+        self.flusher = WriteBehindFlusher(self.queue, {}, batch_size=4, state=self.state, max_attempts=2)
+        self.flusher._write = self._write
+
+    def _write(self, entries):
+        keys = [entry[2].sourceKey for entry in entries]
+        self.batches.append(keys)
+        if self.unreachable:
+            return FlushResult(False, "unreachable", [], error=psycopg2.OperationalError("unreachable"))
+        if self.bad_keys & set(keys):
+            return FlushResult(False, "bad row", [], error=psycopg2.DataError("bad row"))
+        return FlushResult(True, "ok", [])
+
+    def test_a_bad_record_does_not_hold_back_its_batch(self):
+        self._enqueue('a', 'b', 'c', 'd')
+        self.bad_keys = {'c'}
+        self.assertEqual(self.flusher.flush_once(), 3)
+        self.assertEqual(self.batches, [['a', 'b', 'c', 'd'], ['a', 'b'], ['c', 'd'], ['c'], ['d']])
+        self.assertEqual(len(self.queue), 1)
+
+    def test_drain_continues_past_failed_batches(self):
+        self._enqueue(*'abcdefgh')
+        self.bad_keys = {'a', 'b', 'c', 'd'}
+        self.assertEqual(self.flusher.drain(), 4)
+        self.assertEqual(len(self.queue), 4)
+        # Their retries fail again and move them to the dead-letter table
+        self.now += FLUSH_RETRY_BASE
+        self.assertEqual(self.flusher.drain(), 0)
+        self.assertEqual((len(self.queue), self.queue.dead_letters()), (0, 4))
+
+    def test_outages_retry_whole_batches_without_dead_lettering(self):
+        self._enqueue(*'abcdefgh')
+        self.unreachable = True
+        for _ in range(5):
+            self.assertEqual(self.flusher.drain(), 0)
+            self.now += writeQueue.FLUSH_RETRY_CAP
+        # One attempt per pass: the drain stops at the first unreachable batch and never bisects
+        self.assertEqual(self.batches, [['a', 'b', 'c', 'd']] * 5)
+        self.assertEqual((len(self.queue), self.queue.dead_letters()), (8, 0))
+
+        self.unreachable = False
+        self.assertEqual(self.flusher.drain(), 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
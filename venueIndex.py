@@ -0,0 +1,214 @@
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+import psycopg2
+
+from postGresConnection import Database, get_pool
+from scrapeLogging import get_logger
+
+log = get_logger(__name__)
+
+# --- CONFIGURATION ---
+# How often the background refresh reads the venues table for rows changed since the last load (in seconds)
+VENUE_INDEX_REFRESH_SECONDS = float(os.getenv('VENUE_INDEX_REFRESH_SECONDS', '300'))
+VENUE_COLUMNS = ('id', 'sourceKey', 'venueName', 'updatedAt', 'deletedAt')
+# Venue profiles written by the scrapers are keyed "instagram:venue:<profile id or username>"
+VENUE_KEY_PREFIX = 'instagram:venue:'
+
+
+def normalize_name(name: str) -> str:
+    """Folds a venue or location name for matching: accents removed, lowercased, punctuation collapsed."""
+    if not name:
+        return ''
+    folded = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii').lower()
+    return ' '.join(re.findall(r'[a-z0-9]+', folded))
+
+
+class VenueIndex:
+    """
+    In-memory resolution of Instagram locations and profiles to venues.id.
+    Loaded from the venues table by start(), then refreshed incrementally by updatedAt on a
+    background thread every `refresh_seconds`, so resolving an event costs a few dict lookups
+    and never a query. An index that was never started only knows the venues taught to it by
+    learn_venue, which keeps offline runs (e.g. batchClassifier) away from the database. Keys:
+
+    - Instagram profile IDs and usernames, from the sourceKey of scraped venues
+    - normalized venue names, matched against a post's location name
+    - Instagram location IDs, which the venues table does not store: learned from the
+      locations a venue profile tags on its own posts (see learn_venue)
+
+    Safe to share between threads.
+    """
+
+    def __init__(self, db_params: dict, refresh_seconds: float = VENUE_INDEX_REFRESH_SECONDS):
+        """
+        Args:
+            db_params (dict): Connection parameters of the database holding the venues table.
+            refresh_seconds (float): Time between incremental reloads once started.
+        """
+        self.db_params = db_params
+        self.refresh_seconds = refresh_seconds
+        self.loaded_until = None
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._by_location = {}
+        self._by_profile = {}
+        self._by_name = {}
+        # venues.id -> (profile key, name key) it was indexed under, to drop them on rename or delete
+        self._keys_by_venue = {}
+
+    def __len__(self):
+        return len(self._keys_by_venue)
+
+    def refresh(self) -> int:
+        """
+        Loads the venues changed since the last load (every venue on the first call).
+        On a database error the index keeps what it has and the next refresh retries.
+
+        Returns:
+            int: The number of venue rows applied.
+        """
+        with self._refresh_lock:
+            try:
+                with Database(self.db_params, pool=get_pool(self.db_params)) as db:
+                    rows = db.select_changed('venues', VENUE_COLUMNS, 'updatedAt', self.loaded_until)
+                    db.connection.commit()
+            except psycopg2.Error as e:
+                log.error("❌ Venue index refresh failed; keeping the loaded venues", error=str(e))
+                return 0
+            for row in rows:
+                self._apply(*row)
+            log.info("🏟️ Venue index refreshed", changed=len(rows), venues=len(self._keys_by_venue),
+                     loaded_until=self.loaded_until)
+            return len(rows)
+
+    def _apply(self, venue_id, source_key, venue_name, updated_at, deleted_at):
+        """Indexes one venues row, replacing the keys of its previous version."""
+        if updated_at is not None and (self.loaded_until is None or updated_at > self.loaded_until):
+            self.loaded_until = updated_at
+        self._forget(venue_id)
+        if deleted_at is not None:
+            # Also drop what learn_venue indexed for it
+            for keys in (self._by_location, self._by_profile, self._by_name):
+                for key in [key for key, value in list(keys.items()) if value == venue_id]:
+                    keys.pop(key, None)
+            return
+
+        profile_key = None
+        if source_key and source_key.startswith(VENUE_KEY_PREFIX):
+            profile_key = source_key[len(VENUE_KEY_PREFIX):].lower()
+            self._by_profile[profile_key] = venue_id
+        name_key = normalize_name(venue_name)
+        if name_key:
+            # A scraped venue wins a name shared with a manually created one
+            if profile_key or name_key not in self._by_name:
+                self._by_name[name_key] = venue_id
+        self._keys_by_venue[venue_id] = (profile_key, name_key)
+
+    def _forget(self, venue_id):
+        profile_key, name_key = self._keys_by_venue.pop(venue_id, (None, None))
+        if profile_key and self._by_profile.get(profile_key) == venue_id:
+            del self._by_profile[profile_key]
+        if name_key and self._by_name.get(name_key) == venue_id:
+            del self._by_name[name_key]
+
+    def run_forever(self):
+        """Loads the index, then reloads changed venues every `refresh_seconds` until stop() is called."""
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                log.exception("❌ Venue index refresh failed", error=str(e))
+            self._stop.wait(self.refresh_seconds)
+
+    def start(self):
+        """Starts loading and refreshing on a daemon thread (once; later calls are no-ops)."""
+        with self._refresh_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self.run_forever, name='venue-index-refresh', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, timeout: float = None):
+        """Stops the background refresh after its current pass."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def learn_venue(self, profile_data: dict, venue_id: int):
+        """
+        Indexes a venue profile as it is scraped: its Instagram ID, username and name, and
+        the location it tags most often on its own posts, taken to be the venue itself.
+
+        Args:
+            profile_data (dict): The detailed-info profile of the venue.
+            venue_id (int): The venues.id its record is written under.
+        """
+        for key in (profile_data.get('id'), profile_data.get('username')):
+            if key:
+                self._by_profile[str(key).lower()] = venue_id
+        name_key = normalize_name(profile_data.get('full_name'))
+        if name_key:
+            self._by_name.setdefault(name_key, venue_id)
+
+        edges = (profile_data.get('edge_owner_to_timeline_media') or {}).get('edges') or []
+        tagged = Counter(str(location['id']) for edge in edges
+                         for location in ((edge.get('node') or {}).get('location'),)
+                         if location and location.get('id'))
+        if tagged:
+            self._by_location[tagged.most_common(1)[0][0]] = venue_id
+
+    def resolve(self, event_post: dict, profile_data: dict = None, default: int = None) -> int:
+        """
+        Returns the venues.id an event post belongs to: the venue at the post's tagged
+        location (by ID, then by name), else the venue of the posting profile itself.
+
+        Args:
+            event_post (dict): The post node (may be None or untagged).
+            profile_data (dict): The profile that published it.
+            default (int): Returned when nothing matches.
+
+        Returns:
+            int: The matching venues.id, or `default`.
+        """
+        location = (event_post or {}).get('location')
+        if location:
+            venue_id = self._by_location.get(str(location.get('id')))
+            if venue_id is None:
+                venue_id = self._by_name.get(normalize_name(location.get('name')))
+            if venue_id is not None:
+                return venue_id
+        if profile_data:
+            for key in (profile_data.get('id'), profile_data.get('username')):
+                venue_id = self._by_profile.get(str(key).lower()) if key else None
+                if venue_id is not None:
+                    return venue_id
+        return default
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_venue_index(db_params: dict) -> VenueIndex:
+    """
+    Returns the process-wide venue index for `db_params`, creating it (unloaded) on first use.
+    Lookups on it never touch the database; see ensure_venue_index.
+    """
+    key = tuple(sorted(db_params.items()))
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = VenueIndex(db_params)
+            _indexes[key] = index
+        return index
+
+
+def ensure_venue_index(db_params: dict) -> VenueIndex:
+    """Starts (once per process and database) the background load and refresh of the shared venue index."""
+    return get_venue_index(db_params).start()
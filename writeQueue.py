@@ -0,0 +1,369 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+import psycopg2
+
+from batchUpserter import UpsertBatcher
+from changeState import get_state_store
+from scrapeLogging import get_logger
+from scrapeMetrics import track_queue_depth
+from scrapeRecords import EventRecord, VenueRecord
+
+log = get_logger(__name__)
+
+# --- CONFIGURATION ---
+# Local SQLite file holding records scraped but not yet written to Postgres
+WRITE_QUEUE_DB_PATH = os.getenv('WRITE_QUEUE_DB', 'write_queue.sqlite3')
+# Records written per Postgres transaction by the flusher
+FLUSH_BATCH_SIZE = int(os.getenv('WRITE_QUEUE_BATCH_SIZE', '200'))
+# Seconds the flusher sleeps when the queue is empty or nothing is due
+FLUSH_INTERVAL = float(os.getenv('WRITE_QUEUE_FLUSH_INTERVAL', '5'))
+# Retry delay after a failed flush doubles from the base up to the cap (in seconds)
+FLUSH_RETRY_BASE = 5.0
+FLUSH_RETRY_CAP = 300.0
+# A claimed batch that is neither completed nor failed within this long is handed out again
+CLAIM_LEASE_SECONDS = 120.0
+# An entry whose own write has failed this many times is moved to the dead_writes table
+WRITE_QUEUE_MAX_ATTEMPTS = int(os.getenv('WRITE_QUEUE_MAX_ATTEMPTS', '8'))
+
+RECORD_CLASSES = {cls.RECORD_TYPE: cls for cls in (EventRecord, VenueRecord)}
+
+
+class WriteBehindQueue:
+    """
+    A durable local queue of formatted records waiting to be written to Postgres.
+    Scrapers enqueue and move on; a WriteBehindFlusher drains the queue in batches,
+    so scraping never waits on the database and an outage loses nothing.
+    Safe to share between threads; claims are leased, so a crashed flusher's batch is retried.
+    Entries that keep failing on their own are parked in a dead_writes table for inspection.
+    """
+
+    def __init__(self, path=WRITE_QUEUE_DB_PATH):
+        """
+        Opens (and creates if needed) the SQLite queue file.
+
+        Args:
+            path (str): Path to the SQLite database file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS pending_writes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                record_type TEXT NOT NULL,
+                record BLOB NOT NULL,
+                username TEXT,
+                post_id TEXT,
+                content_hash TEXT,
+                enqueued_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                leased_until REAL NOT NULL DEFAULT 0,
+                last_error TEXT
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pending_writes_due ON pending_writes (next_attempt_at, id)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS dead_writes (
+                id INTEGER PRIMARY KEY,
+                record_type TEXT NOT NULL,
+                record BLOB NOT NULL,
+                username TEXT,
+                post_id TEXT,
+                content_hash TEXT,
+                enqueued_at REAL NOT NULL,
+                attempts INTEGER NOT NULL,
+                last_error TEXT,
+                failed_at REAL NOT NULL
+            )
+        """)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM pending_writes").fetchone()[0]
+
+    def enqueue(self, record_type: str, record, username: str = None, post_id: str = None,
+                content_hash: str = None) -> int:
+        """
+        Durably queues a formatted record.
+        The username, post ID and content hash are recorded in the change-detection
+        state once the record is written.
+
+        Returns:
+            int: The queue entry ID.
+        """
+        # Column names are stored with the values so entries survive added or reordered columns
+        blob = pickle.dumps((record.COLUMNS, record.as_params()), protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO pending_writes (record_type, record, username, post_id, content_hash, enqueued_at, "
+                "next_attempt_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (record_type, blob, username, post_id, content_hash, now, now),
+            )
+            return cursor.lastrowid
+
+    def claim(self, limit: int = FLUSH_BATCH_SIZE) -> list:
+        """
+        Leases up to `limit` due entries, oldest first.
+
+        Returns:
+            list: (entry_id, record_type, record, username, post_id, content_hash) tuples.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, record_type, record, username, post_id, content_hash FROM pending_writes "
+                    "WHERE next_attempt_at <= ? AND leased_until <= ? ORDER BY id LIMIT ?",
+                    (now, now, limit),
+                ).fetchall()
+                self._conn.executemany("UPDATE pending_writes SET leased_until = ? WHERE id = ?",
+                                       [(now + CLAIM_LEASE_SECONDS, row[0]) for row in rows])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        entries = []
+        for entry_id, record_type, blob, username, post_id, content_hash in rows:
+            columns, params = pickle.loads(blob)
+            record = RECORD_CLASSES[record_type](**dict(zip(columns, params)))
+            entries.append((entry_id, record_type, record, username, post_id, content_hash))
+        return entries
+
+    def complete(self, entry_ids: list):
+        """Removes entries that were committed to Postgres."""
+        with self._lock:
+            self._conn.executemany("DELETE FROM pending_writes WHERE id = ?", [(i,) for i in entry_ids])
+
+    def fail(self, entry_ids: list, error: str, max_attempts: int = WRITE_QUEUE_MAX_ATTEMPTS) -> int:
+        """
+        Releases entries whose write failed and schedules their retry with exponential backoff.
+        Entries that have now failed `max_attempts` times are moved to the dead_writes table instead.
+
+        Args:
+            entry_ids (list): The failed entries.
+            error (str): The error message kept with them.
+            max_attempts (int): Attempts before an entry is dead-lettered (None retries forever).
+
+        Returns:
+            int: The number of entries moved to dead_writes.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "UPDATE pending_writes SET attempts = attempts + 1, leased_until = 0, last_error = ?, "
+                    "next_attempt_at = ? + MIN(?, ? * (1 << MIN(attempts, 16))) WHERE id = ?",
+                    [(error, now, FLUSH_RETRY_CAP, FLUSH_RETRY_BASE, i) for i in entry_ids],
+                )
+                dead = 0
+                if max_attempts is not None:
+                    dead = self._conn.executemany(
+                        "INSERT INTO dead_writes (id, record_type, record, username, post_id, content_hash, "
+                        "enqueued_at, attempts, last_error, failed_at) SELECT id, record_type, record, username, "
+                        "post_id, content_hash, enqueued_at, attempts, last_error, ? FROM pending_writes "
+                        "WHERE id = ? AND attempts >= ?",
+                        [(now, i, max_attempts) for i in entry_ids],
+                    ).rowcount
+                    self._conn.executemany("DELETE FROM pending_writes WHERE id = ? AND attempts >= ?",
+                                           [(i, max_attempts) for i in entry_ids])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return dead
+
+    def dead_letters(self) -> int:
+        """Returns the number of entries in the dead_writes table."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM dead_writes").fetchone()[0]
+
+    def requeue_dead(self) -> int:
+        """
+        Moves every dead-lettered entry back into the queue with a fresh attempt count, e.g. after
+        the schema or the data that made them fail was fixed.
+
+        Returns:
+            int: The number of entries requeued.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                requeued = self._conn.execute(
+                    "INSERT INTO pending_writes (record_type, record, username, post_id, content_hash, enqueued_at, "
+                    "next_attempt_at) SELECT record_type, record, username, post_id, content_hash, enqueued_at, ? "
+                    "FROM dead_writes ORDER BY id",
+                    (now,),
+                ).rowcount
+                self._conn.execute("DELETE FROM dead_writes")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return requeued
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class WriteBehindFlusher:
+    """
+    Drains a WriteBehindQueue into Postgres on a background thread, one transaction per batch.
+    A batch rejected by the database is bisected until the records it refuses are isolated, so
+    the rest still commit; those records are retried with backoff and dead-lettered after
+    `max_attempts`. Batches that fail because the database is unreachable are retried as a whole.
+    """
+
+    def __init__(self, queue: WriteBehindQueue, db_params: dict, batch_size=FLUSH_BATCH_SIZE,
+                 interval=FLUSH_INTERVAL, state=None, max_attempts=WRITE_QUEUE_MAX_ATTEMPTS):
+        self.queue = queue
+        self.db_params = db_params
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.state = state or get_state_store()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def flush_once(self) -> int:
+        """
+        Writes one batch of due entries.
+
+        Returns:
+            int: The number of entries committed (0 if none were due or every write failed).
+        """
+        return self._flush_entries(self.queue.claim(self.batch_size))[0]
+
+    def drain(self) -> int:
+        """
+        Flushes due entries until none are left. Records that fail are rescheduled and the drain
+        moves on to the next batch; it only stops early while the database is unreachable.
+
+        Returns:
+            int: The number of entries committed.
+        """
+        total = 0
+        while True:
+            entries = self.queue.claim(self.batch_size)
+            if not entries:
+                return total
+            written, reachable = self._flush_entries(entries)
+            total += written
+            if not reachable:
+                return total
+
+    def _flush_entries(self, entries: list) -> tuple:
+        """
+        Writes claimed entries in one transaction, bisecting a rejected batch into halves
+        that are written separately.
+
+        Returns:
+            tuple: (entries committed, False if the database could not be reached)
+        """
+        if not entries:
+            return 0, True
+        result = self._write(entries)
+        entry_ids = [entry[0] for entry in entries]
+        if result.success:
+            self.queue.complete(entry_ids)
+            return len(entry_ids), True
+
+        unreachable = isinstance(result.error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+        if unreachable or len(entries) == 1:
+            # An outage is not the records' fault, so it backs them off but never dead-letters them
+            dead = self.queue.fail(entry_ids, result.message, None if unreachable else self.max_attempts)
+            if dead < len(entry_ids):
+                log.warning("⏸️ Queued records kept for retry", records=len(entry_ids) - dead, error=result.message)
+            if dead:
+                log.error("🪦 Queued records moved to the dead-letter table", records=dead, error=result.message)
+            return 0, not unreachable
+
+        # One bad record fails its whole transaction: split the batch so the others still commit
+        middle = len(entries) // 2
+        written, reachable = self._flush_entries(entries[:middle])
+        if not reachable:
+            self.queue.fail(entry_ids[middle:], result.message, None)
+            return written, False
+        more, reachable = self._flush_entries(entries[middle:])
+        return written + more, reachable
+
+    def _write(self, entries: list):
+        """Upserts claimed entries in one transaction and returns the batcher's FlushResult."""
+        # The batcher only flushes when asked, so the whole claim goes out in one transaction
+        batcher = UpsertBatcher(self.db_params, max_records=float('inf'), max_age=float('inf'))
+        for _, record_type, record, username, post_id, content_hash in entries:
+            on_success = None
+            if username is not None:
+                def on_success(username=username, post_id=post_id, content_hash=content_hash):
+                    self.state.record_write(username, post_id, content_hash)
+            batcher.add(record_type, record, on_success=on_success)
+        return batcher.flush()
+
+    def run_forever(self):
+        """Flushes until stop() is called, sleeping between passes when nothing is due."""
+        while not self._stop.is_set():
+            try:
+                self.drain()
+            except Exception as e:
+                log.exception("❌ Write-behind flush failed", error=str(e))
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Starts flushing on a daemon thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name='write-behind-flusher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = None):
+        """Stops the background thread after its current pass."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+_default_queue = None
+_default_flushers = {}
+_defaults_lock = threading.Lock()
+
+
+def get_write_queue() -> WriteBehindQueue:
+    """Returns the process-wide queue backed by WRITE_QUEUE_DB_PATH, opening it on first use."""
+    global _default_queue
+    with _defaults_lock:
+        if _default_queue is None:
+            _default_queue = WriteBehindQueue()
+            track_queue_depth('write_behind', _default_queue.__len__)
+        return _default_queue
+
+
+def ensure_flusher(db_params: dict) -> WriteBehindFlusher:
+    """Starts (once per process and database) a background flusher for the shared queue."""
+    queue = get_write_queue()
+    key = tuple(sorted(db_params.items()))
+    with _defaults_lock:
+        flusher = _default_flushers.get(key)
+        if flusher is None:
+            flusher = _default_flushers[key] = WriteBehindFlusher(queue, db_params)
+        return flusher.start()
+
+
+if __name__ == "__main__":
+    # Run as a standalone flusher next to scrapers that only enqueue
+    from instaScrapper import db_connection_params
+
+    queue = get_write_queue()
+    log.info("Write-behind flusher started", pending=len(queue), dead_letters=queue.dead_letters())
+    WriteBehindFlusher(queue, db_connection_params).run_forever()